@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Long-lived endpoints such as the kitchen queue stream
+(restau/chef/orders/stream/) should be served through this application,
+e.g. ``uvicorn backend_restau.asgi:application``, so an idle screen holds an
+event-loop task instead of a worker thread.
 """
 
 import os
@@ -14,3 +19,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_restau.settings')
 
 application = get_asgi_application()
+
+from restaurant.expiry import start_sweeper  # noqa: E402
+
+# Only server processes run the periodic expiry sweep (EXPIRY_SWEEP_INTERVAL)
+start_sweeper()
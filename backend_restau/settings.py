@@ -16,6 +16,7 @@ import os
 from dotenv import load_dotenv
 import datetime
 from corsheaders.defaults import default_headers
+from django.core.exceptions import ImproperlyConfigured
 
 load_dotenv()
 
@@ -56,6 +57,7 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'restaurant.middleware.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -91,11 +93,64 @@ WSGI_APPLICATION = 'backend_restau.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# Pick a profile with DB_PROFILE:
+#   sqlite-tuned (default): WAL journal, busy timeout, bigger page cache and
+#       mmap, IMMEDIATE write transactions and persistent connections
+#   sqlite: the untuned stock configuration
+#   postgres: PostgreSQL through psycopg's connection pool
+#       (pip install "psycopg[binary,pool]"; configured with POSTGRES_* variables)
+# `manage.py bench_concurrent_orders --profiles ...` compares them.
+SQLITE_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA cache_size=-20000',
+    'PRAGMA mmap_size=134217728',
+    'PRAGMA temp_store=MEMORY',
+]
+
+DATABASE_PROFILES = {
+    'sqlite': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    'sqlite-tuned': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(SQLITE_PRAGMAS),
+            # Take the write lock at BEGIN: a deferred transaction that later
+            # writes can fail with "database is locked" despite busy_timeout
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 5,
+        },
+    },
+    'postgres': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.getenv("POSTGRES_DB", "restaurant"),
+        'USER': os.getenv("POSTGRES_USER", "restaurant"),
+        'PASSWORD': os.getenv("POSTGRES_PASSWORD", ""),
+        'HOST': os.getenv("POSTGRES_HOST", "localhost"),
+        'PORT': os.getenv("POSTGRES_PORT", "5432"),
+        # The pool replaces persistent connections (CONN_MAX_AGE must stay 0)
+        'OPTIONS': {
+            'pool': {
+                'min_size': int(os.getenv("POSTGRES_POOL_MIN", 2)),
+                'max_size': int(os.getenv("POSTGRES_POOL_MAX", 20)),
+                'timeout': 10,
+            },
+        },
+    },
+}
+
+DB_PROFILE = os.getenv("DB_PROFILE", "sqlite-tuned")
+if DB_PROFILE not in DATABASE_PROFILES:
+    raise ImproperlyConfigured(f"Unknown DB_PROFILE {DB_PROFILE!r}; use one of {', '.join(DATABASE_PROFILES)}")
+
+DATABASES = {
+    'default': DATABASE_PROFILES[DB_PROFILE],
 }
 
 
@@ -143,6 +198,12 @@ SIMPLE_JWT = {
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "default-secret-key")
 JWT_ALGORITHM = 'HS256'  # The algorithm used for signing the token
 JWT_EXPIRATION_DELTA = datetime.timedelta(days=1) 
+# Verified device tokens kept in memory per process (restaurant.auth)
+DEVICE_AUTH_CACHE_SIZE = 1024
+DEVICE_AUTH_CACHE_TTL = 60  # seconds
+# Seconds between checks for tables changed by other processes: how long a
+# revoked device token can still be accepted by another worker
+DEVICE_AUTH_REVOCATION_CHECK = 1
 
 
 # Internationalization
@@ -179,3 +240,29 @@ CORS_ALLOW_HEADERS = list(default_headers) + [
 ]
 
 AUTO_RESET_TIME = 30 * 60
+
+# Order expiry sweep (restaurant.expiry). A non-zero interval also runs it
+# inside the web server process; otherwise schedule `manage.py expire_orders`.
+EXPIRY_SWEEP_INTERVAL = int(os.getenv("EXPIRY_SWEEP_INTERVAL", 0))
+EXPIRY_SWEEP_BATCH_SIZE = 500
+EXPIRY_SWEEP_PAUSE = 0.05
+# Order change feed (restaurant.models.OrderEvent): events older than this are
+# compacted by the same sweep; clients further behind resync from the lists
+ORDER_EVENT_RETENTION = 24 * 60 * 60
+# Menu change log (restaurant.models.MenuChange), compacted by the same sweep;
+# tablets whose revision is older get the whole menu
+MENU_CHANGE_RETENTION = 7 * 24 * 60 * 60
+# Seconds a process serves its menu snapshot before checking the menu revision
+# in the database again (restaurant.menu); its own changes apply at once
+MENU_REVISION_CHECK_INTERVAL = 1.0
+
+# Default page size of the order and stats listings (restaurant.pagination)
+KEYSET_PAGE_SIZE = 50
+
+# Per-endpoint request metrics (restaurant.middleware.metrics), served in
+# Prometheus format at /restau/metrics/ to admins
+METRICS_ENABLED = True
+METRICS_PREFIX = 'restaurant'
+
+# Adds X-DB-Queries / X-DB-Time-Ms response headers (used by `manage.py loadtest`)
+EXPOSE_QUERY_COUNT = DEBUG
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_restau.settings')
 
 application = get_wsgi_application()
+
+from restaurant.expiry import start_sweeper  # noqa: E402
+
+# Only server processes run the periodic expiry sweep (EXPIRY_SWEEP_INTERVAL)
+start_sweeper()
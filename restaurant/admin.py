@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Dish, Table, Order, OrderItem, Stats, Ingredient, OrderItem
+from .models import Category, Dish, Table, Order, OrderItem, Stats, HourlyStats, DishSales, Ingredient, OrderItem, OrderEvent
 
 ### Editable Models ###
 
@@ -10,7 +10,8 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
-    list_display = ('name', 'icon')
+    list_display = ('name', 'icon', 'stock')
+    list_editable = ('stock',)
 
 @admin.register(Dish)
 class DishAdmin(admin.ModelAdmin):
@@ -63,3 +64,33 @@ class StatsAdmin(admin.ModelAdmin):
     def has_add_permission(self, request): return False
     def has_change_permission(self, request, obj=None): return False
     def has_delete_permission(self, request, obj=None): return False
+
+
+@admin.register(HourlyStats)
+class HourlyStatsAdmin(admin.ModelAdmin):
+    list_display = ['date', 'hour', 'total_orders', 'total_revenue', 'items_sold']
+    list_filter = ['date']
+    readonly_fields = [field.name for field in HourlyStats._meta.fields]
+    def has_add_permission(self, request): return False
+    def has_change_permission(self, request, obj=None): return False
+    def has_delete_permission(self, request, obj=None): return False
+
+
+@admin.register(DishSales)
+class DishSalesAdmin(admin.ModelAdmin):
+    list_display = ['date', 'hour', 'dish', 'quantity', 'revenue']
+    list_filter = ['date']
+    readonly_fields = [field.name for field in DishSales._meta.fields]
+    def has_add_permission(self, request): return False
+    def has_change_permission(self, request, obj=None): return False
+    def has_delete_permission(self, request, obj=None): return False
+
+
+@admin.register(OrderEvent)
+class OrderEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'order', 'table', 'kind', 'old_status', 'status', 'at']
+    list_filter = ['kind', 'status']
+    readonly_fields = [field.name for field in OrderEvent._meta.fields]
+    def has_add_permission(self, request): return False
+    def has_change_permission(self, request, obj=None): return False
+    def has_delete_permission(self, request, obj=None): return False
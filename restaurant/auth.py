@@ -1,37 +1,173 @@
+import threading
+import time
+from collections import OrderedDict
 
 import jwt
+from asgiref.sync import sync_to_async
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 from django.conf import settings
-from restaurant.models import Table  
+from restaurant.models import Table
+
+
+class DeviceTokenCache:
+    """Bounded LRU of verified device tokens and the table they resolve to.
+
+    Entries expire at the token's ``exp`` claim, or after
+    ``DEVICE_AUTH_CACHE_TTL`` seconds, whichever comes first. A table saved
+    in this process drops its entries at once (``invalidate_table``); one
+    relinked, deactivated or deleted by another process is noticed by
+    ``check_revocations`` within ``check_interval`` seconds, which is how
+    long a revoked token can still be accepted here.
+    """
+
+    def __init__(self, max_entries=1024, ttl=60, check_interval=1):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._entries = OrderedDict()
+        self._tokens_by_table = {}
+        self._checked_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            table, payload, expires_at = entry
+            if expires_at <= time.time():
+                self._discard(token)
+                return None
+            self._entries.move_to_end(token)
+            return table, payload
+
+    def set(self, token, table, payload):
+        expires_at = time.time() + self.ttl
+        if payload.get('exp') is not None:
+            expires_at = min(expires_at, payload['exp'])
+        with self._lock:
+            if not self._entries:
+                # Nothing older to check
+                self._checked_at = time.monotonic()
+            self._discard(token)
+            self._entries[token] = (table, payload, expires_at)
+            self._tokens_by_table.setdefault(table.pk, set()).add(token)
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate_table(self, table_pk):
+        with self._lock:
+            for token in list(self._tokens_by_table.get(table_pk, ())):
+                self._discard(token)
+
+    def revocation_check_due(self):
+        return bool(self._entries) and time.monotonic() - self._checked_at >= self.check_interval
+
+    def check_revocations(self):
+        """Drop the entries of tables saved or deleted since they were cached, with one query"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            cached = {}
+            for table, _, _ in self._entries.values():
+                cached.setdefault(table.pk, set()).add(table.updated_at)
+        if not cached:
+            return
+        current = dict(Table.objects.filter(pk__in=cached).values_list('pk', 'updated_at'))
+        for table_pk, stamps in cached.items():
+            if stamps != {current.get(table_pk)}:
+                self.invalidate_table(table_pk)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_table.clear()
+
+    def _discard(self, token):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        tokens = self._tokens_by_table.get(entry[0].pk)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_table[entry[0].pk]
+
+
+device_token_cache = DeviceTokenCache(
+    max_entries=getattr(settings, 'DEVICE_AUTH_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'DEVICE_AUTH_CACHE_TTL', 60),
+    check_interval=getattr(settings, 'DEVICE_AUTH_REVOCATION_CHECK', 1),
+)
+
+
+def decode_device_token(token):
+    try:
+        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=["HS256"])
+        return payload, {'table_num': payload["table_num"], 'device_id': payload["device_id"]}
+    except jwt.ExpiredSignatureError:
+        raise AuthenticationFailed("Token has expired")
+    except (jwt.InvalidTokenError, KeyError, ValueError):
+        raise AuthenticationFailed("Invalid token")
+
+
+def resolve_device_token(token):
+    """Return ``(table, payload)`` for a device token, decoding it at most once"""
+    if device_token_cache.revocation_check_due():
+        device_token_cache.check_revocations()
+    cached = device_token_cache.get(token)
+    if cached is not None:
+        return cached
+
+    payload, lookup = decode_device_token(token)
+    try:
+        table = Table.objects.get(**lookup)
+    except Table.DoesNotExist:
+        raise AuthenticationFailed("Table not found or device ID mismatch")
+
+    device_token_cache.set(token, table, payload)
+    return table, payload
+
+
+async def aresolve_device_token(token):
+    """``resolve_device_token`` for async code; a cache hit only leaves the event loop for the revocation check"""
+    if device_token_cache.revocation_check_due():
+        await sync_to_async(device_token_cache.check_revocations)()
+    cached = device_token_cache.get(token)
+    if cached is not None:
+        return cached
+
+    payload, lookup = decode_device_token(token)
+    try:
+        table = await Table.objects.aget(**lookup)
+    except Table.DoesNotExist:
+        raise AuthenticationFailed("Table not found or device ID mismatch")
+
+    device_token_cache.set(token, table, payload)
+    return table, payload
+
+
+def bearer_token(request):
+    """The token of an ``Authorization: Bearer`` header, if any"""
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith("Bearer "):
+        return auth_header.split(" ")[1]
+    return None
+
 
 class DeviceJWTAuthentication(BaseAuthentication):
     def authenticate(self, request):
-        #print("All headers:", request.headers)
         auth_header = request.headers.get('Authorization')
-        #print(f"Auth header: {auth_header}")
-        
+
         if not auth_header or not auth_header.startswith("Bearer "):
-            return None  
+            return None
 
         token = auth_header.split(" ")[1]
-        try:
-            payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=["HS256"])
-            #print(f"Decoded payload: {payload}")
-            
-            table = Table.objects.get(
-                table_num=payload["table_num"],
-                device_id=payload["device_id"]
-            )
-            
-            return (table, {'device_id': payload["device_id"]})
-            
-        except jwt.ExpiredSignatureError:
-            raise AuthenticationFailed("Token has expired")
-        except jwt.InvalidTokenError:
-            raise AuthenticationFailed("Invalid token")
-        except Table.DoesNotExist:
-            raise AuthenticationFailed("Table not found or device ID mismatch")
-        except Exception as e:
-            print(f"Authentication error: {str(e)}")
-            raise AuthenticationFailed("Authentication failed")
\ No newline at end of file
+
+        # DeviceJWTMiddleware already resolved this token for the request
+        if getattr(request._request, 'device_token', None) == token:
+            table = request._request.table
+            return (table, {'device_id': table.device_id})
+
+        table, payload = resolve_device_token(token)
+        return (table, {'device_id': payload["device_id"]})
@@ -0,0 +1,51 @@
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+@contextmanager
+def scratch_database(verbosity=0, sqlite_path=None):
+    """Run the block against a freshly migrated throwaway copy of the database.
+
+    Benchmarks seed and mutate a lot of rows, so they never touch the real
+    database; this reuses Django's test database machinery instead. SQLite
+    test databases live in memory unless ``sqlite_path`` names a file, which
+    concurrency benchmarks need to see real locking.
+    """
+    old_name = connection.settings_dict['NAME']
+    if sqlite_path and connection.vendor == 'sqlite':
+        connection.settings_dict['TEST'] = {**connection.settings_dict.get('TEST', {}), 'NAME': sqlite_path}
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def measure(fn, repeat=50):
+    """Call ``fn`` ``repeat`` times and return latency (ms) and query stats."""
+    timings = []
+    queries = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(len(ctx.captured_queries))
+    return {
+        'queries': max(queries),
+        'mean_ms': statistics.mean(timings),
+        'p50_ms': percentile(timings, 50),
+        'p95_ms': percentile(timings, 95),
+    }
@@ -0,0 +1,135 @@
+import datetime
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from restaurant.models import MenuChange, Order, OrderEvent
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SweepResult:
+    expired: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+    # Longest single UPDATE, i.e. the longest the write lock was held
+    max_batch_seconds: float = 0.0
+
+
+def expire_orders(orders):
+    """Expire the not yet expired orders of the ``orders`` queryset; returns how many.
+
+    The rows are flipped with one UPDATE and logged as ``OrderEvent``s in
+    the same transaction, which also moves their tables' polling versions.
+    """
+    with transaction.atomic():
+        # expired=False again: a tablet may have expired some of them meanwhile
+        rows = list(orders.filter(expired=False).values_list('pk', 'table_id', 'status'))
+        if not rows:
+            return 0
+        Order.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(expired=True)
+        OrderEvent.record_expired(rows)
+    return len(rows)
+
+
+def sweep_expired_orders(before=None, batch_size=None, pause=None):
+    """Expire served/cancelled orders completed before ``before`` in bounded batches.
+
+    Each batch picks at most ``batch_size`` ids through the expiry index and
+    flips them with one short UPDATE in its own transaction, then sleeps
+    ``pause`` seconds so order placement can take the write lock in between.
+    ``before`` defaults to ``AUTO_RESET_TIME`` seconds ago.
+    """
+    if before is None:
+        before = timezone.now() - datetime.timedelta(seconds=settings.AUTO_RESET_TIME)
+    batch_size = batch_size or settings.EXPIRY_SWEEP_BATCH_SIZE
+    pause = settings.EXPIRY_SWEEP_PAUSE if pause is None else pause
+
+    result = SweepResult()
+    started = time.perf_counter()
+    while True:
+        ids = list(Order.get_expirable_orders(before).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        batch_started = time.perf_counter()
+        result.expired += expire_orders(Order.objects.filter(pk__in=ids))
+        result.max_batch_seconds = max(result.max_batch_seconds, time.perf_counter() - batch_started)
+        result.batches += 1
+        if len(ids) < batch_size:
+            break
+        time.sleep(pause)
+    result.seconds = time.perf_counter() - started
+
+    logger.info(
+        "Expired %d orders in %d batches in %.3fs (longest batch %.1fms)",
+        result.expired, result.batches, result.seconds, result.max_batch_seconds * 1000,
+    )
+    return result
+
+
+def compact_order_events(before=None):
+    """Drop ``OrderEvent``s older than ``before`` (default: ``ORDER_EVENT_RETENTION`` seconds ago)"""
+    if before is None:
+        before = timezone.now() - datetime.timedelta(seconds=settings.ORDER_EVENT_RETENTION)
+    deleted = OrderEvent.compact(before, batch_size=settings.EXPIRY_SWEEP_BATCH_SIZE)
+    if deleted:
+        logger.info("Compacted %d order events", deleted)
+    return deleted
+
+
+def compact_menu_changes(before=None):
+    """Drop ``MenuChange``s older than ``before`` (default: ``MENU_CHANGE_RETENTION`` seconds ago)"""
+    if before is None:
+        before = timezone.now() - datetime.timedelta(seconds=settings.MENU_CHANGE_RETENTION)
+    deleted = MenuChange.compact(before, batch_size=settings.EXPIRY_SWEEP_BATCH_SIZE)
+    if deleted:
+        logger.info("Compacted %d menu changes", deleted)
+    return deleted
+
+
+class ExpirySweeper(threading.Thread):
+    """Runs ``sweep_expired_orders`` and the log compactions every ``interval`` seconds in this process"""
+
+    def __init__(self, interval):
+        super().__init__(name='order-expiry-sweeper', daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.last_result = None
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            close_old_connections()
+            try:
+                self.last_result = sweep_expired_orders()
+                compact_order_events()
+                compact_menu_changes()
+            except Exception:
+                logger.exception("Order expiry sweep failed")
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self.stopped.set()
+
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+def start_sweeper(interval=None):
+    """Start the in-process sweeper once; a no-op unless an interval is configured"""
+    global _sweeper
+    interval = interval or settings.EXPIRY_SWEEP_INTERVAL
+    if not interval:
+        return None
+    with _sweeper_lock:
+        if _sweeper is None:
+            _sweeper = ExpirySweeper(interval)
+            _sweeper.start()
+        return _sweeper
@@ -0,0 +1,121 @@
+import hashlib
+import io
+import logging
+import posixpath
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Longest edge, in pixels, of every derivative
+VARIANT_SIZES = {'thumb': 160, 'card': 480, 'full': 1280}
+WEBP_QUALITY = 80
+# libwebp's default effort; 6 is several times slower for a few percent smaller files
+WEBP_METHOD = 4
+JPEG_QUALITY = 82
+
+VARIANTS_DIR = 'variants'
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def encode(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == 'webp':
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=WEBP_METHOD)
+    elif fmt == 'png':
+        image.save(buffer, 'PNG', optimize=True)
+    else:
+        image.convert('RGB').save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def variant_name(source_name, digest, size, fmt):
+    """``dish_images/variants/<stem>-<digest>-<size>.<fmt>`` next to the source upload"""
+    directory, filename = posixpath.split(source_name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, VARIANTS_DIR, f'{stem}-{digest}-{size}.{fmt}')
+
+
+def build_variants(field_file):
+    """Write the resized WebP and fallback copies of an image and describe them.
+
+    Returns ``{'source': name, size: {'width', 'height', 'webp', <fallback>}}``
+    where the format keys hold storage names. File names carry a hash of the
+    source bytes, so they can be cached forever and rebuilding an unchanged
+    image writes nothing.
+    """
+    storage = field_file.storage
+    with field_file.open('rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()[:12]
+
+    source = Image.open(io.BytesIO(data))
+    source = ImageOps.exif_transpose(source)
+    fallback = 'png' if has_alpha(source) else 'jpeg'
+    source = source.convert('RGBA' if fallback == 'png' else 'RGB')
+
+    variants = {'source': field_file.name}
+    for size, edge in VARIANT_SIZES.items():
+        image = source.copy()
+        # Never upscale: a small source is simply re-encoded
+        image.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        entry = {'width': image.width, 'height': image.height}
+        for fmt in ('webp', fallback):
+            name = variant_name(field_file.name, digest, size, fmt)
+            if not storage.exists(name):
+                name = storage.save(name, ContentFile(encode(image, fmt)))
+            entry[fmt] = name
+        variants[size] = entry
+    return variants
+
+
+def variants_stale(instance):
+    """True when ``instance.image_variants`` does not describe its current image"""
+    current = instance.image_variants or {}
+    if not instance.image:
+        return bool(current)
+    return current.get('source') != instance.image.name
+
+
+def refresh_image_variants(instance):
+    """Rebuild ``instance.image_variants`` if its image changed; True when it did"""
+    image = instance.image
+    current = instance.image_variants or {}
+    if not variants_stale(instance):
+        return False
+    elif not image:
+        variants = {}
+    else:
+        try:
+            variants = build_variants(image)
+        except (OSError, Image.DecompressionBombError):
+            # Missing or unreadable upload: serve the original, as before
+            logger.warning("Cannot build image variants for %s", image.name, exc_info=True)
+            variants = {}
+        if variants == current:
+            return False
+
+    instance.image_variants = variants
+    type(instance).objects.filter(pk=instance.pk).update(image_variants=variants)
+    return True
+
+
+def variant_urls(variants, storage, build_uri=None):
+    """Storage names in ``image_variants`` turned into URLs (absolute with ``build_uri``)"""
+    urls = {}
+    for size in VARIANT_SIZES:
+        entry = variants.get(size)
+        if not entry:
+            continue
+        urls[size] = {}
+        for key, value in entry.items():
+            if key in ('width', 'height'):
+                urls[size][key] = value
+            else:
+                url = storage.url(value)
+                urls[size][key] = build_uri(url) if build_uri else url
+    return urls
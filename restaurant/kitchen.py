@@ -0,0 +1,128 @@
+import asyncio
+import json
+import threading
+
+from asgiref.sync import sync_to_async
+from rest_framework.utils.encoders import JSONEncoder
+
+from restaurant.models import Order, OrderEvent
+from restaurant.serializers import OrderSerializer
+
+KITCHEN_STATUSES = [Order.OrderStatus.PENDING, Order.OrderStatus.IN_PROGRESS]
+
+# The stream reads the order event log at least this often, so changes made by
+# other processes (workers, the expiry command) show up without a wake-up
+CATCH_UP_SECONDS = 1
+KEEPALIVE_SECONDS = 15
+# Events read from the log per query
+EVENT_BATCH_SIZE = 500
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, cls=JSONEncoder)}\n\n"
+
+
+class KitchenBroker:
+    """Wakes the kitchen streams of this process when an order changed here.
+
+    The streams read what changed from the ``OrderEvent`` log themselves;
+    the wake-up only spares them waiting for their next catch-up. Notifiers
+    run in ordinary request threads and every subscriber owns an
+    ``asyncio.Event`` on its loop, so it is set through
+    ``call_soon_threadsafe``.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        wakeup = asyncio.Event()
+        with self._lock:
+            self._subscribers[wakeup] = asyncio.get_running_loop()
+        return wakeup
+
+    def unsubscribe(self, wakeup):
+        with self._lock:
+            self._subscribers.pop(wakeup, None)
+
+    def notify(self):
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        for wakeup, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                # The subscriber's loop is gone
+                self.unsubscribe(wakeup)
+
+
+kitchen_broker = KitchenBroker()
+
+
+def get_kitchen_queue():
+    """The pending and in-progress orders, with the event log head read before them"""
+    # Read first, so a change made while the orders are read is replayed after
+    head = OrderEvent.head()
+    orders = (
+        Order.objects.filter(status__in=KITCHEN_STATUSES, expired=False)
+        .select_related('table')
+        .prefetch_related('items__dish')
+        .order_by('order_time')
+    )
+    return OrderSerializer(orders, many=True).data, head
+
+
+def get_kitchen_events(since):
+    """SSE messages for the order events after ``since``, and the cursor to continue from.
+
+    Events commit in id order (see ``SequencedLog``), so nothing can appear
+    behind the returned cursor.
+    """
+    events = list(OrderEvent.objects.filter(pk__gt=since).order_by('pk')
+                  .values('pk', 'order_id', 'kind', 'old_status', 'status')[:EVENT_BATCH_SIZE])
+    if not events:
+        return [], since
+    created = (
+        Order.objects.select_related('table').prefetch_related('items__dish')
+        .in_bulk([event['order_id'] for event in events if event['kind'] == OrderEvent.Kind.CREATED])
+    )
+    messages = []
+    for event in events:
+        if event['kind'] == OrderEvent.Kind.CREATED:
+            order = created.get(event['order_id'])
+            if order is not None:
+                messages.append(format_event('order_created', OrderSerializer(order).data))
+        elif event['kind'] == OrderEvent.Kind.STATUS and (
+                event['old_status'] in KITCHEN_STATUSES or event['status'] in KITCHEN_STATUSES):
+            messages.append(format_event('order_updated', {
+                'id': event['order_id'],
+                'old_status': event['old_status'],
+                'status': event['status'],
+            }))
+    return messages, events[-1]['pk']
+
+
+async def kitchen_event_stream():
+    # Screens apply events idempotently by order id, so an order created
+    # while the snapshot is read may arrive twice but is never missed
+    wakeup = kitchen_broker.subscribe()
+    try:
+        snapshot, cursor = await sync_to_async(get_kitchen_queue)()
+        yield format_event('snapshot', snapshot)
+        idle = 0
+        while True:
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=CATCH_UP_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            wakeup.clear()
+            messages, cursor = await sync_to_async(get_kitchen_events)(cursor)
+            for message in messages:
+                yield message
+            idle = 0 if messages else idle + CATCH_UP_SECONDS
+            if idle >= KEEPALIVE_SECONDS:
+                idle = 0
+                yield ": keepalive\n\n"
+    finally:
+        kitchen_broker.unsubscribe(wakeup)
@@ -0,0 +1,93 @@
+import datetime
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+
+def _init_worker(settings_module):
+    # Workers are spawned, so each one sets Django up on its own.
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def compute_chunk(dates):
+    """Compute the hourly Stats buckets and dish sales of a list of dates (read-only, runs in a worker)"""
+    from restaurant.models import DishSales, Stats
+
+    return [(date, Stats.compute_hourly(date), DishSales.compute_for_date(date)) for date in dates]
+
+
+def save_chunk(results):
+    """Write computed Stats values in one short transaction.
+
+    Only the parent process writes, so workers never contend for the
+    SQLite write lock; the heavy part (the grouped queries) is what runs
+    in parallel.
+    """
+    from restaurant.models import DishSales, Stats
+
+    with transaction.atomic():
+        for date, hourly, dish_sales in results:
+            Stats.save_day(date, hourly)
+            DishSales.save_day(date, dish_sales)
+    return len(results)
+
+
+def date_chunks(start, end, size):
+    chunk = []
+    day = start
+    while day <= end:
+        chunk.append(day)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+        day += datetime.timedelta(days=1)
+    if chunk:
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = "Backfill or recompute daily Stats for a date range, in chunks spread over a process pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', required=True, type=datetime.date.fromisoformat, help="YYYY-MM-DD")
+        parser.add_argument('--end', required=True, type=datetime.date.fromisoformat, help="YYYY-MM-DD (inclusive)")
+        parser.add_argument('--chunk-size', type=int, default=31, help="Days per worker task")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        start, end = options['start'], options['end']
+        if start > end:
+            raise CommandError("--start must not be after --end")
+
+        chunks = list(date_chunks(start, end, max(1, options['chunk_size'])))
+        workers = max(1, min(options['workers'], len(chunks)))
+        started = time.perf_counter()
+        done = 0
+
+        if workers == 1:
+            for chunk in chunks:
+                done += save_chunk(compute_chunk(chunk))
+        else:
+            # Workers open their own connections; don't hand ours across processes
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(os.environ['DJANGO_SETTINGS_MODULE'],),
+            ) as pool:
+                for future in as_completed(pool.submit(compute_chunk, chunk) for chunk in chunks):
+                    done += save_chunk(future.result())
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f"{done} days done")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated stats for {done} days ({start} to {end}) with {workers} worker(s) "
+            f"in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,173 @@
+import asyncio
+import datetime
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+import jwt
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory, override_settings
+
+from restaurant.bench import percentile, scratch_database
+from restaurant.models import Category, Dish, Order, Table
+
+ENDPOINTS = ['/restau/client/categories/', '/restau/client/dishes/', '/restau/client/orders/']
+
+
+def seed(tablets):
+    category = Category.objects.create(name='Bench')
+    dishes = Dish.objects.bulk_create(Dish(name=f'Dish {i}', price=5 + i % 10) for i in range(40))
+    category.dishes.set(dishes)
+    tokens = []
+    for num in range(1, tablets + 1):
+        table = Table.objects.create(table_num=num, device_id=str(uuid.uuid4()))
+        for _ in range(3):
+            Order.place(table, [{'dish': dishes[num % 40].pk, 'quantity': 1}])
+        tokens.append(jwt.encode({
+            'device_id': table.device_id,
+            'table_num': table.table_num,
+            'exp': datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1),
+        }, settings.JWT_SECRET_KEY, algorithm='HS256'))
+    return tokens
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the tablet read endpoints served by the WSGI handler on a thread pool with the ASGI "
+        "handler on one event loop, with many concurrent (optionally slow) clients"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=200, help="Concurrent tablets")
+        parser.add_argument('--requests', type=int, default=10, help="Requests per tablet")
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help="Comma-separated paths to cycle through")
+        parser.add_argument('--wsgi-threads', type=int, default=16, help="Worker threads of the WSGI server")
+        parser.add_argument(
+            '--client-delay', type=float, default=0.02,
+            help="Seconds a slow tablet takes to receive a response (holds a WSGI thread, not the event loop)",
+        )
+
+    def handle(self, *args, **options):
+        # Measure the app, not the debug instrumentation
+        with override_settings(DEBUG=False, EXPOSE_QUERY_COUNT=False, ALLOWED_HOSTS=['*']), \
+                tempfile.TemporaryDirectory() as directory, \
+                scratch_database(sqlite_path=os.path.join(directory, 'bench.sqlite3')):
+            tokens = seed(options['clients'])
+            connection.close()
+            endpoints = options['endpoints'].split(',')
+            jobs = [(token, endpoints[i % len(endpoints)]) for token in tokens for i in range(options['requests'])]
+
+            self.stdout.write(
+                f"{options['clients']} tablets x {options['requests']} requests, "
+                f"client delay {options['client_delay'] * 1000:.0f} ms\n"
+                f"{'server':<22} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}"
+            )
+            for label, result in (
+                (f"wsgi ({options['wsgi_threads']} threads)", self.run_wsgi(jobs, options)),
+                ('asgi (1 event loop)', asyncio.run(self.run_asgi(jobs, options))),
+            ):
+                self.stdout.write(
+                    f"{label:<22} {result['rps']:>8.1f} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+                    f"{result['p99_ms']:>8.2f} {result['errors']:>7}"
+                )
+
+    @staticmethod
+    def summarize(latencies, errors, elapsed):
+        return {
+            'rps': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'errors': errors,
+        }
+
+    def run_wsgi(self, jobs, options):
+        handler = WSGIHandler()
+        factory = RequestFactory()
+        workers = threading.Semaphore(options['wsgi_threads'])
+        latencies, errors = [], []
+        lock = threading.Lock()
+
+        def call(token, path):
+            environ = factory.get(path, HTTP_AUTHORIZATION=f'Bearer {token}').environ
+            status = []
+            start = time.perf_counter()
+            # Waiting for a free worker thread counts towards the latency
+            with workers:
+                body = b''.join(handler(environ, lambda s, headers, exc_info=None: status.append(s)))
+                # A slow tablet keeps the worker thread busy while it reads the body
+                time.sleep(options['client_delay'])
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+                if not status[0].startswith('200') or not body:
+                    errors.append(status[0])
+
+        def tablet(token, paths):
+            try:
+                for path in paths:
+                    call(token, path)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=tablet, args=item) for item in self.by_tablet(jobs).items()]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.summarize(latencies, len(errors), time.perf_counter() - started)
+
+    @staticmethod
+    def by_tablet(jobs):
+        """Each tablet makes its requests in sequence"""
+        paths = {}
+        for token, path in jobs:
+            paths.setdefault(token, []).append(path)
+        return paths
+
+    async def run_asgi(self, jobs, options):
+        handler = ASGIHandler()
+        latencies, errors = [], []
+
+        async def call(token, path):
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+                'root_path': '', 'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+                'headers': [(b'host', b'localhost'), (b'authorization', f'Bearer {token}'.encode())],
+            }
+            status = []
+            pending = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+            async def receive():
+                if pending:
+                    return pending.pop()
+                # The tablet stays connected; Django stops listening once it has responded
+                await asyncio.Event().wait()
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+                elif not message.get('more_body'):
+                    # A slow tablet only parks this request's task
+                    await asyncio.sleep(options['client_delay'])
+
+            start = time.perf_counter()
+            await handler(scope, receive, send)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if status != [200]:
+                errors.append(status)
+
+        async def tablet(token, paths):
+            for path in paths:
+                await call(token, path)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(tablet(token, paths) for token, paths in self.by_tablet(jobs).items()))
+        return self.summarize(latencies, len(errors), time.perf_counter() - started)
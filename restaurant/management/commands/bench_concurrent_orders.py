@@ -0,0 +1,109 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from restaurant.bench import percentile, scratch_database
+from restaurant.models import Dish, Order, Table
+
+
+def place_orders(table, dishes, count, items, barrier, latencies, errors):
+    """One tablet placing ``count`` orders back to back"""
+    items_data = [{'dish': dish.pk, 'quantity': 1} for dish in dishes[:items]]
+    try:
+        barrier.wait()
+        for _ in range(count):
+            start = time.perf_counter()
+            try:
+                Order.place(table, items_data)
+            except OperationalError:
+                errors.append(1)
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark concurrent order placement (threads = tablets) against a scratch copy of the "
+        "database; --profiles runs it once per DB_PROFILE and compares throughput"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--orders', type=int, default=100, help="Orders per thread")
+        parser.add_argument('--items', type=int, default=3, help="Items per order")
+        parser.add_argument('--profiles', help="Comma-separated DB_PROFILE names to compare, e.g. sqlite,sqlite-tuned")
+        parser.add_argument('--json', action='store_true', help="Print the result as one JSON line")
+
+    def handle(self, *args, **options):
+        if options['profiles']:
+            results = [self.run_profile(profile, options) for profile in options['profiles'].split(',')]
+        else:
+            results = [self.run(options)]
+
+        if options['json']:
+            self.stdout.write(json.dumps(results[0]))
+            return
+        self.stdout.write(
+            f"{options['threads']} threads x {options['orders']} orders x {options['items']} items\n"
+            f"{'profile':<14} {'orders/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}"
+        )
+        for result in results:
+            self.stdout.write(
+                f"{result['profile']:<14} {result['orders_per_second']:>9.1f} {result['p50_ms']:>8.2f} "
+                f"{result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['errors']:>7}"
+            )
+
+    def run_profile(self, profile, options):
+        """Run the benchmark in a child process configured with ``DB_PROFILE=profile``"""
+        command = [
+            sys.executable, str(settings.BASE_DIR / 'manage.py'), 'bench_concurrent_orders', '--json',
+            f"--threads={options['threads']}", f"--orders={options['orders']}", f"--items={options['items']}",
+        ]
+        child = subprocess.run(command, env={**os.environ, 'DB_PROFILE': profile}, capture_output=True, text=True)
+        if child.returncode != 0:
+            raise CommandError(f"Profile {profile} failed:\n{child.stderr}")
+        return json.loads(child.stdout.strip().splitlines()[-1])
+
+    def run(self, options):
+        with tempfile.TemporaryDirectory() as directory:
+            with scratch_database(sqlite_path=os.path.join(directory, 'bench.sqlite3')):
+                dishes = Dish.objects.bulk_create(Dish(name=f"Dish {i}", price=10 + i % 7) for i in range(20))
+                tables = Table.objects.bulk_create(Table(table_num=num) for num in range(1, options['threads'] + 1))
+                # Threads open their own connections; ours must not hold a lock meanwhile
+                connection.close()
+
+                latencies, errors = [], []
+                barrier = threading.Barrier(options['threads'])
+                threads = [
+                    threading.Thread(target=place_orders, args=(
+                        table, dishes, options['orders'], options['items'], barrier, latencies, errors,
+                    ))
+                    for table in tables
+                ]
+                started = time.perf_counter()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                elapsed = time.perf_counter() - started
+
+        return {
+            'profile': settings.DB_PROFILE,
+            'orders': len(latencies),
+            'errors': len(errors),
+            'seconds': elapsed,
+            'orders_per_second': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+        }
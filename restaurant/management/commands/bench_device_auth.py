@@ -0,0 +1,50 @@
+import datetime
+import uuid
+
+import jwt
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from restaurant.auth import DeviceJWTAuthentication, device_token_cache
+from restaurant.bench import measure, scratch_database
+from restaurant.middleware.device_jwt_auth import DeviceJWTMiddleware
+from restaurant.models import Table
+
+
+class Command(BaseCommand):
+    help = "Benchmark the per-request cost of tablet authentication (middleware + DRF authentication)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            table = Table.objects.create(table_num=1, device_id=str(uuid.uuid4()))
+            token = jwt.encode({
+                "device_id": table.device_id,
+                "table_num": table.table_num,
+                "exp": datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=1),
+            }, settings.JWT_SECRET_KEY, algorithm='HS256')
+
+            factory = RequestFactory()
+            middleware = DeviceJWTMiddleware(lambda request: None)
+            authentication = DeviceJWTAuthentication()
+
+            def authenticate_request():
+                request = factory.get('/restau/client/dishes/', HTTP_AUTHORIZATION=f'Bearer {token}')
+                middleware.process_request(request)
+                authentication.authenticate(Request(request))
+
+            def cold():
+                device_token_cache.clear()
+                authenticate_request()
+
+            self.stdout.write(f"{'cache':<6} {'queries':>8} {'mean us':>9} {'p95 us':>9}")
+            for label, fn in (('cold', cold), ('warm', authenticate_request)):
+                result = measure(fn, repeat=options['repeat'])
+                self.stdout.write(
+                    f"{label:<6} {result['queries']:>8} "
+                    f"{result['mean_ms'] * 1000:>9.1f} {result['p95_ms'] * 1000:>9.1f}"
+                )
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from restaurant.bench import measure, scratch_database
+from restaurant.models import Dish, Order, OrderItem, Table
+
+
+def place_order_per_item(table, items_data):
+    """The previous ingestion path, kept here as the comparison baseline."""
+    with transaction.atomic():
+        order = Order.objects.create(table=table, status=Order.OrderStatus.PENDING)
+        for item in items_data:
+            dish = Dish.objects.get(id=item['dish'], is_available=True)
+            OrderItem.objects.create(order=order, dish=dish, quantity=item.get('quantity', 1), price=dish.price)
+        order.update_total_price()
+    return order
+
+
+class Command(BaseCommand):
+    help = "Benchmark query counts and latency of order creation for 1, 10 and 100 item orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--sizes', default='1,10,100')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        with scratch_database():
+            table = Table.objects.create(table_num=1)
+            dishes = Dish.objects.bulk_create(
+                Dish(name=f"Dish {i}", price=10 + i % 7) for i in range(max(sizes))
+            )
+
+            self.stdout.write(f"{'items':>6} {'path':<10} {'queries':>8} {'mean ms':>9} {'p95 ms':>9}")
+            for size in sizes:
+                items_data = [{'dish': dish.pk, 'quantity': 2} for dish in dishes[:size]]
+                for label, fn in (('per-item', place_order_per_item), ('bulk', Order.place)):
+                    result = measure(lambda: fn(table, items_data), repeat=options['repeat'])
+                    self.stdout.write(
+                        f"{size:>6} {label:<10} {result['queries']:>8} "
+                        f"{result['mean_ms']:>9.2f} {result['p95_ms']:>9.2f}"
+                    )
@@ -0,0 +1,42 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from restaurant.expiry import compact_menu_changes, compact_order_events, sweep_expired_orders
+
+
+class Command(BaseCommand):
+    help = (
+        "Expire served/cancelled orders completed more than AUTO_RESET_TIME ago, in short batched "
+        "UPDATEs, and compact the order event and menu change logs; run it from cron, or keep it running with --every"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, help="Seconds (default: AUTO_RESET_TIME)")
+        parser.add_argument('--batch-size', type=int, help="Rows per UPDATE (default: EXPIRY_SWEEP_BATCH_SIZE)")
+        parser.add_argument('--pause', type=float, help="Seconds between batches (default: EXPIRY_SWEEP_PAUSE)")
+        parser.add_argument('--every', type=float, help="Sweep again every N seconds until interrupted")
+
+    def handle(self, *args, **options):
+        while True:
+            older_than = options['older_than'] or settings.AUTO_RESET_TIME
+            result = sweep_expired_orders(
+                before=timezone.now() - datetime.timedelta(seconds=older_than),
+                batch_size=options['batch_size'],
+                pause=options['pause'],
+            )
+            compacted = compact_order_events()
+            compacted_changes = compact_menu_changes()
+            self.stdout.write(
+                f"expired={result.expired} batches={result.batches} seconds={result.seconds:.3f} "
+                f"max_batch_ms={result.max_batch_seconds * 1000:.1f} compacted_events={compacted} "
+                f"compacted_menu_changes={compacted_changes}"
+            )
+            if not options['every']:
+                return
+            time.sleep(options['every'])
+            close_old_connections()
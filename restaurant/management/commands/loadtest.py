@@ -0,0 +1,300 @@
+import json
+import random
+import statistics
+import threading
+import time
+from collections import defaultdict
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant.bench import percentile
+
+LOADTEST_TABLE_START = 9000
+LOADTEST_PASSWORD = 'loadtest-pass'
+STAFF = {'chef': 'loadtest-chef', 'waiter': 'loadtest-waiter', 'admin': 'loadtest-admin'}
+
+
+def seed(tablets, dishes):
+    """Create (or reset) the tables, menu and staff users the load test drives"""
+    from restaurant.models import Category, Dish, Ingredient, Table
+    from users.models import User
+
+    for role, username in STAFF.items():
+        user = User.objects.filter(username=username).first()
+        if user is None:
+            user = User.objects.create_user(username=username, password=LOADTEST_PASSWORD, role=role)
+        user.is_active = True
+        user.set_password(LOADTEST_PASSWORD)
+        user.save()
+
+    for num in range(LOADTEST_TABLE_START + 1, LOADTEST_TABLE_START + tablets + 1):
+        Table.objects.update_or_create(table_num=num, defaults={'device_id': None, 'is_active': True})
+
+    categories = [Category.objects.get_or_create(name=f'Loadtest {name}')[0] for name in ('Starters', 'Mains', 'Desserts')]
+    ingredients = [Ingredient.objects.get_or_create(name=f'loadtest-{name}')[0] for name in ('basil', 'tomato', 'cheese')]
+    for i in range(dishes):
+        dish, _ = Dish.objects.update_or_create(
+            name=f'Loadtest dish {i}',
+            defaults={'price': 5 + i % 20, 'description': f'Seeded dish number {i}', 'is_available': True},
+        )
+        dish.categories.set([categories[i % len(categories)]])
+        dish.ingredients.set(ingredients[: 1 + i % len(ingredients)])
+
+
+class Recorder:
+    """Thread-safe per-endpoint latency, error and query-count samples"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def record(self, label, elapsed, response):
+        with self.lock:
+            self.samples[label].append(elapsed * 1000)
+            if response is None or response.status_code >= 400:
+                self.errors[label] += 1
+            if response is not None and 'X-DB-Queries' in response.headers:
+                self.queries[label].append(int(response.headers['X-DB-Queries']))
+
+    def report(self, duration):
+        rows = []
+        for label in sorted(self.samples):
+            samples = self.samples[label]
+            queries = self.queries[label]
+            rows.append({
+                'endpoint': label,
+                'requests': len(samples),
+                'errors': self.errors[label],
+                'rps': len(samples) / duration,
+                'p50_ms': percentile(samples, 50),
+                'p95_ms': percentile(samples, 95),
+                'p99_ms': percentile(samples, 99),
+                'queries': statistics.mean(queries) if queries else None,
+            })
+        return rows
+
+
+class Client:
+    def __init__(self, base_url, recorder, token=None):
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.session = requests.Session()
+        if token:
+            self.session.headers['Authorization'] = f'Bearer {token}'
+
+    def call(self, method, label, path, **kwargs):
+        """The response, or None when the request failed outright; either way it is recorded"""
+        start = time.perf_counter()
+        response = None
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=30, **kwargs)
+        except requests.RequestException:
+            pass
+        self.recorder.record(f'{method} {label}', time.perf_counter() - start, response)
+        return response
+
+    def json(self, method, label, path, **kwargs):
+        """The decoded body of a successful call, None for a failed one (counted as an error)"""
+        response = self.call(method, label, path, **kwargs)
+        if response is None or response.status_code >= 400:
+            return None
+        try:
+            return response.json()
+        except ValueError:
+            return None
+
+
+def results(payload):
+    """List payloads may be plain or paginated"""
+    return payload['results'] if isinstance(payload, dict) else payload
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive a running server with simulated tablets, chefs and waiters and report per-endpoint "
+        "p50/p95/p99 latency, throughput and DB queries per request"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--tablets', type=int, default=20)
+        parser.add_argument('--chefs', type=int, default=2)
+        parser.add_argument('--waiters', type=int, default=2)
+        parser.add_argument('--dishes', type=int, default=60)
+        parser.add_argument('--duration', type=float, default=60, help="Seconds of traffic")
+        parser.add_argument('--iterations', type=int,
+                            help="Stop every worker after this many rounds (with --random-seed, a reproducible run)")
+        parser.add_argument('--think-time', type=float, default=0.5, help="Mean pause between tablet actions")
+        parser.add_argument('--seed', action='store_true', help="Seed tables, dishes and staff users first")
+        parser.add_argument('--random-seed', type=int, default=1,
+                            help="Every worker's choices and pauses derive from this and its index only")
+        parser.add_argument('--json', dest='json_path', help="Also write the report to this file")
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            seed(options['tablets'], options['dishes'])
+
+        self.recorder = Recorder()
+        self.url = options['url']
+        self.think_time = options['think_time']
+
+        staff_tokens = {role: self.login(username) for role, username in STAFF.items()}
+        tablets = self.link_tablets(options['tablets'])
+
+        self.deadline = time.monotonic() + options['duration']
+        self.iterations = options['iterations']
+        roles = ([(self.tablet, token) for token in tablets]
+                 + [(self.chef, staff_tokens['chef'])] * options['chefs']
+                 + [(self.waiter, staff_tokens['waiter'])] * options['waiters'])
+        # Seeded before any thread starts, so the run does not depend on their scheduling
+        workers = [
+            threading.Thread(target=target, args=(token, random.Random(f"{options['random_seed']}-{index}")))
+            for index, (target, token) in enumerate(roles)
+        ]
+        started = time.monotonic()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - started
+
+        self.admin(staff_tokens['admin'])
+        for token in tablets:
+            Client(self.url, self.recorder, token).call('POST', 'client/resetTable/', '/restau/client/resetTable/')
+
+        rows = self.recorder.report(elapsed)
+        self.print_report(rows, elapsed)
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({'duration': elapsed, 'endpoints': rows}, f, indent=2)
+
+    def login(self, username):
+        client = Client(self.url, self.recorder)
+        response = client.call('POST', 'auth/login/', '/api/auth/login/',
+                               json={'username': username, 'password': LOADTEST_PASSWORD})
+        if response is None or response.status_code != 200:
+            status = response.status_code if response is not None else 'no response'
+            raise CommandError(f"Cannot log in as {username} ({status}); run with --seed")
+        refresh = client.json('POST', 'auth/token/refresh/', '/api/auth/token/refresh/',
+                              json={'refresh': response.json()['refresh']})
+        if refresh is None:
+            raise CommandError(f"Cannot refresh the token of {username}")
+        return refresh['access']
+
+    def link_tablets(self, count):
+        client = Client(self.url, self.recorder)
+        tables = client.json('GET', 'tables/', '/restau/tables/')
+        if tables is None:
+            raise CommandError("Cannot list the tables")
+        free = [table['table_num'] for table in results(tables) if table['table_num'] > LOADTEST_TABLE_START]
+        if len(free) < count:
+            raise CommandError(f"Only {len(free)} free load-test tables; run with --seed")
+        tokens = []
+        for table_num in free[:count]:
+            linked = client.json('POST', 'link-table/', '/restau/link-table/', json={'table_num': table_num})
+            if linked is None:
+                raise CommandError(f"Cannot link load-test table {table_num}")
+            token = linked['token']
+            Client(self.url, self.recorder, token).call('POST', 'verify-device/', '/restau/verify-device/',
+                                                       json={'table_num': table_num})
+            tokens.append(token)
+        return tokens
+
+    def pause(self, rng, scale=1.0):
+        time.sleep(rng.expovariate(1 / (self.think_time * scale)) if self.think_time else 0)
+
+    def rounds(self):
+        """A worker's loop: ``--iterations`` rounds at most, until the deadline"""
+        done = 0
+        while time.monotonic() < self.deadline and (self.iterations is None or done < self.iterations):
+            yield done
+            done += 1
+
+    def tablet(self, token, rng):
+        client = Client(self.url, self.recorder, token)
+        for _ in self.rounds():
+            # A failed call is counted by the recorder; the worker skips what depended on it
+            categories = client.json('GET', 'client/categories/', '/restau/client/categories/')
+            if categories:
+                category = rng.choice(categories)
+                client.call('GET', 'client/categories/<pk>/dishes/', f"/restau/client/categories/{category['id']}/dishes/")
+                client.call('GET', 'client/categories/<pk>/', f"/restau/client/categories/{category['id']}/")
+            dishes = client.json('GET', 'client/dishes/', '/restau/client/dishes/', params={'max_price': 20})
+            client.call('GET', 'client/dishes/search/', '/restau/client/dishes/search/', params={'q': 'dish'})
+            self.pause(rng)
+            if not dishes:
+                continue
+            dishes = results(dishes)
+            client.call('GET', 'client/dishes/<pk>/', f"/restau/client/dishes/{rng.choice(dishes)['id']}/")
+
+            items = [{'dish': dish['id'], 'quantity': rng.randint(1, 3)} for dish in rng.sample(dishes, min(len(dishes), rng.randint(1, 5)))]
+            order = client.json('POST', 'client/orders/', '/restau/client/orders/', json={'items': items})
+            if order is None:
+                self.pause(rng, 4)
+                continue
+            if rng.random() < 0.05:
+                client.call('POST', 'client/orders/<pk>/cancel/', f"/restau/client/orders/{order['order_id']}/cancel/")
+            for _ in range(3):
+                self.pause(rng)
+                client.call('GET', 'client/orders/', '/restau/client/orders/')
+                client.call('GET', 'client/orders/<pk>/', f"/restau/client/orders/{order['order_id']}/")
+            if rng.random() < 0.2:
+                client.call('POST', 'client/orders/expire/', '/restau/client/orders/expire/')
+            self.pause(rng, 4)
+
+    def chef(self, token, rng):
+        client = Client(self.url, self.recorder, token)
+        for _ in self.rounds():
+            orders = client.json('GET', 'chef/orders/', '/restau/chef/orders/')
+            for order in results(orders) if orders is not None else []:
+                if order['status'] == 'pending':
+                    client.call('POST', 'chef/orders/<pk>/mark_as_in_progress/', f"/restau/chef/orders/{order['id']}/mark_as_in_progress/")
+                elif order['status'] == 'in_progress':
+                    client.call('POST', 'chef/orders/<pk>/mark_as_ready/', f"/restau/chef/orders/{order['id']}/mark_as_ready/")
+            self.pause(rng, 2)
+
+    def waiter(self, token, rng):
+        client = Client(self.url, self.recorder, token)
+        for _ in self.rounds():
+            client.call('GET', 'floor-map/', '/restau/floor-map/')
+            orders = client.json('GET', 'waiter/orders/', '/restau/waiter/orders/')
+            for order in results(orders) if orders is not None else []:
+                if order['status'] == 'ready':
+                    client.call('POST', 'waiter/orders/<pk>/mark_as_served/', f"/restau/waiter/orders/{order['id']}/mark_as_served/")
+            self.pause(rng, 2)
+
+    def admin(self, token):
+        """Exercise the user-management endpoints once; they are not on any hot path"""
+        client = Client(self.url, self.recorder, token)
+        username = f'loadtest-temp-{int(time.time())}'
+        user = client.json('POST', 'users/register/', '/api/users/register/', json={
+            'username': username, 'password': LOADTEST_PASSWORD, 'password2': LOADTEST_PASSWORD, 'role': 'waiter',
+        }) or {}
+        pk = user.get('id')
+        if pk is None:
+            return
+        client.call('PUT', 'users/<pk>/change-password/', f'/api/users/{pk}/change-password/', json={
+            'old_password': LOADTEST_PASSWORD, 'new_password': LOADTEST_PASSWORD, 'new_password2': LOADTEST_PASSWORD,
+        })
+        client.call('PATCH', 'users/<pk>/update/', f'/api/users/{pk}/update/', json={'is_active': True})
+        login = Client(self.url, self.recorder).json('POST', 'auth/login/', '/api/auth/login/',
+                                                     json={'username': username, 'password': LOADTEST_PASSWORD}) or {}
+        Client(self.url, self.recorder, login.get('token')).call(
+            'POST', 'users/<pk>/logout/', f'/api/users/{pk}/logout/', json={'refresh_token': login.get('refresh')})
+        client.call('DELETE', 'users/<pk>/delete/', f'/api/users/{pk}/delete/')
+
+    def print_report(self, rows, elapsed):
+        total = sum(row['requests'] for row in rows)
+        self.stdout.write(f"{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)\n")
+        self.stdout.write(
+            f"{'endpoint':<52} {'reqs':>6} {'err':>4} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'queries':>8}"
+        )
+        for row in rows:
+            queries = f"{row['queries']:.1f}" if row['queries'] is not None else '-'
+            self.stdout.write(
+                f"{row['endpoint']:<52} {row['requests']:>6} {row['errors']:>4} {row['rps']:>7.1f} "
+                f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {queries:>8}"
+            )
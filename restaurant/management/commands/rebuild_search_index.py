@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant.search import fts_enabled, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the dish full-text search index from the menu tables"
+
+    def handle(self, *args, **options):
+        if not fts_enabled():
+            raise CommandError("The search index is only used on SQLite")
+        rebuild_index()
+        self.stdout.write(self.style.SUCCESS("Dish search index rebuilt"))
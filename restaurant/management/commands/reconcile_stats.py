@@ -0,0 +1,86 @@
+import datetime
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from restaurant.models import DishSales, HourlyStats, Stats
+
+CENT = Decimal('0.01')
+FIELDS = ['total_orders', 'total_revenue', 'items_sold']
+
+
+def normalize(values):
+    """Comparable form of a bucket or a daily row (decimals rounded to the cent)"""
+    return {
+        key: Decimal(value).quantize(CENT) if key in ('total_revenue', 'average_order_value') else value
+        for key, value in values.items()
+    }
+
+
+def normalize_sale(row):
+    return row['quantity'], Decimal(row['revenue']).quantize(CENT)
+
+
+def differences(date):
+    """Fields of the stored stats and dish sales of ``date`` that disagree with a full recompute"""
+    hourly = Stats.compute_hourly(date)
+    expected = normalize(Stats.summarize(hourly))
+    stored = Stats.objects.filter(date=date).values(*expected).first()
+    # A missing row reads as an empty day
+    stored = normalize(stored or Stats.summarize([]))
+    found = {key: (stored[key], value) for key, value in expected.items() if stored[key] != value}
+
+    expected_hours = {bucket['hour']: normalize({key: bucket[key] or 0 for key in FIELDS}) for bucket in hourly}
+    stored_hours = {
+        row['hour']: normalize({key: row[key] for key in FIELDS})
+        for row in HourlyStats.objects.filter(date=date).exclude(total_orders=0).values('hour', *FIELDS)
+    }
+    for hour in sorted(expected_hours.keys() | stored_hours.keys()):
+        if expected_hours.get(hour) != stored_hours.get(hour):
+            found[f'hour {hour}'] = (stored_hours.get(hour), expected_hours.get(hour))
+
+    dish_sales = DishSales.compute_for_date(date)
+    expected_sales = {(row['hour'], row['dish_id']): normalize_sale(row) for row in dish_sales}
+    stored_sales = {
+        (row['hour'], row['dish_id']): normalize_sale(row)
+        for row in DishSales.objects.filter(date=date).exclude(quantity=0).values('hour', 'dish_id', 'quantity', 'revenue')
+    }
+    for key in sorted(expected_sales.keys() | stored_sales.keys()):
+        if expected_sales.get(key) != stored_sales.get(key):
+            found[f'hour {key[0]} dish {key[1]}'] = (stored_sales.get(key), expected_sales.get(key))
+    return found, hourly, dish_sales
+
+
+class Command(BaseCommand):
+    help = "Check the incrementally maintained Stats and DishSales against a full recompute, optionally repairing them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=datetime.date.fromisoformat, help="YYYY-MM-DD (default: today)")
+        parser.add_argument('--end', type=datetime.date.fromisoformat, help="YYYY-MM-DD, inclusive (default: --start)")
+        parser.add_argument('--fix', action='store_true', help="Rewrite mismatching days from the recompute")
+
+    def handle(self, *args, **options):
+        start = options['start'] or timezone.localdate()
+        end = options['end'] or start
+        if start > end:
+            raise CommandError("--start must not be after --end")
+
+        mismatched = 0
+        date = start
+        while date <= end:
+            found, hourly, dish_sales = differences(date)
+            if found:
+                mismatched += 1
+                for field, (stored, expected) in found.items():
+                    self.stdout.write(f"{date} {field}: stored {stored}, recomputed {expected}")
+                if options['fix']:
+                    Stats.save_day(date, hourly)
+                    DishSales.save_day(date, dish_sales)
+            date += datetime.timedelta(days=1)
+
+        if mismatched and not options['fix']:
+            raise CommandError(f"{mismatched} day(s) differ from a full recompute; rerun with --fix to repair")
+        self.stdout.write(self.style.SUCCESS(
+            f"{mismatched} day(s) repaired" if mismatched else f"Stats match a full recompute ({start} to {end})"
+        ))
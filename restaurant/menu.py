@@ -0,0 +1,107 @@
+import threading
+import time
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from restaurant.models import Category, Dish, MenuChange
+from restaurant.serializers import CategorySerializer, DishSerializer
+
+_lock = threading.Lock()
+_snapshot = None
+# time.monotonic() until which _snapshot is served without checking the revision
+_fresh_until = 0.0
+
+
+class MenuSnapshot:
+    """Serialized menu built once and shared by every client request.
+
+    Dish and category payloads are rendered with the regular serializers
+    (without a request, so image URLs are relative) and then only sliced
+    and filtered in Python when a tablet asks for them. ``revision`` is the
+    ``MenuChange`` head read before the menu rows, so the snapshot holds
+    every change up to it.
+    """
+
+    def __init__(self, revision, categories, dishes):
+        self.revision = revision
+        self.categories = categories
+        self.categories_by_id = {category['id']: category for category in categories}
+        self.dishes = dishes
+        self.dishes_by_id = {dish['id']: dish for dish in dishes}
+
+    def get_category(self, pk):
+        return self.categories_by_id.get(pk)
+
+    def get_available_dishes(self, category_id=None, category_names=None, min_price=None, max_price=None):
+        dishes = []
+        for dish in self.dishes:
+            if not dish['is_available']:
+                continue
+            if category_id is not None and not any(c['id'] == category_id for c in dish['categories']):
+                continue
+            if category_names and not any(c['name'] in category_names for c in dish['categories']):
+                continue
+            price = Decimal(dish['price'])
+            if min_price is not None and price < min_price:
+                continue
+            if max_price is not None and price > max_price:
+                continue
+            dishes.append(dish)
+        return dishes
+
+
+def build_menu_snapshot(revision):
+    categories = CategorySerializer(Category.objects.order_by('id'), many=True).data
+    dishes = DishSerializer(
+        Dish.objects.order_by('id').prefetch_related('categories', 'ingredients'),
+        many=True,
+    ).data
+    return MenuSnapshot(revision, categories, dishes)
+
+
+def get_menu_snapshot():
+    """Return the current snapshot, rebuilding it if the menu revision moved.
+
+    The revision is the ``MenuChange`` head, which every process sees, so a
+    change made by another worker is picked up within
+    ``MENU_REVISION_CHECK_INTERVAL`` seconds; changes made by this process
+    drop the snapshot at once (``invalidate_menu``).
+    """
+    global _snapshot, _fresh_until
+    snapshot = _snapshot
+    if snapshot is not None and time.monotonic() < _fresh_until:
+        return snapshot
+    with _lock:
+        # Read before the menu rows, see MenuSnapshot
+        revision = MenuChange.head()
+        if _snapshot is None or _snapshot.revision != revision:
+            _snapshot = build_menu_snapshot(revision)
+        _fresh_until = time.monotonic() + settings.MENU_REVISION_CHECK_INTERVAL
+        return _snapshot
+
+
+async def aget_menu_snapshot():
+    """``get_menu_snapshot`` for async views; only a revision check or a rebuild leaves the event loop"""
+    snapshot = _snapshot
+    if snapshot is not None and time.monotonic() < _fresh_until:
+        return snapshot
+    return await sync_to_async(get_menu_snapshot)()
+
+
+def _drop_snapshot():
+    global _snapshot, _fresh_until
+    _snapshot = None
+    _fresh_until = 0.0
+
+
+def invalidate_menu():
+    """Drop the snapshot now and again once the surrounding transaction commits.
+
+    The second drop stops another thread from keeping a snapshot it built
+    from data that was read before the change was committed.
+    """
+    _drop_snapshot()
+    transaction.on_commit(_drop_snapshot)
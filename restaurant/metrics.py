@@ -0,0 +1,174 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from django.conf import settings
+
+# Upper bounds of the histogram buckets; +Inf is implied
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+KNOWN_METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+
+# DB activity of the request being handled. A ContextVar rather than a
+# thread-local: async views run their ORM calls on another thread through
+# sync_to_async, which carries the context over.
+_request_db = ContextVar('request_db', default=None)
+
+
+@dataclass
+class DBUsage:
+    queries: int = 0
+    seconds: float = 0.0
+
+
+def count_queries(execute, sql, params, many, context):
+    usage = _request_db.get()
+    if usage is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        usage.queries += 1
+        usage.seconds += time.perf_counter() - start
+
+
+def install_query_counter(connection):
+    """Wrap every query of ``connection`` (called from ``connection_created``)"""
+    if count_queries not in connection.execute_wrappers:
+        # First, so a ``connection.execute_wrapper()`` block that is open
+        # while the connection is created still pops its own wrapper
+        connection.execute_wrappers.insert(0, count_queries)
+
+
+def track_db():
+    """Start counting the queries of the current request; returns (usage, token)"""
+    usage = DBUsage()
+    return usage, _request_db.set(usage)
+
+
+def untrack_db(token):
+    _request_db.reset(token)
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'total')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+
+
+@dataclass
+class EndpointStats:
+    latency: Histogram = field(default_factory=lambda: Histogram(LATENCY_BUCKETS))
+    queries: Histogram = field(default_factory=lambda: Histogram(QUERY_BUCKETS))
+    db_seconds: float = 0.0
+    response_bytes: int = 0
+    # Responses per status class ('2xx', '4xx', ...)
+    responses: dict = field(default_factory=dict)
+
+
+class MetricsRegistry:
+    """Per-endpoint request metrics of this process.
+
+    Keyed by (URL name, method). Recording is a dict lookup and a few
+    additions under one lock; rendering copies nothing it does not need.
+    Each worker process keeps its own registry, so with several workers
+    Prometheus sees one series per scraped process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def observe(self, view, method, status, seconds, queries, db_seconds, size):
+        status_class = f'{status // 100}xx'
+        with self.lock:
+            stats = self.endpoints.get((view, method))
+            if stats is None:
+                stats = self.endpoints[(view, method)] = EndpointStats()
+            stats.latency.observe(seconds)
+            stats.queries.observe(queries)
+            stats.db_seconds += db_seconds
+            stats.response_bytes += size
+            stats.responses[status_class] = stats.responses.get(status_class, 0) + 1
+
+    def reset(self):
+        with self.lock:
+            self.endpoints.clear()
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        prefix = settings.METRICS_PREFIX
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            lines = []
+
+            lines += [
+                f'# HELP {prefix}_http_requests_total Responses by endpoint, method and status class.',
+                f'# TYPE {prefix}_http_requests_total counter',
+            ]
+            for (view, method), stats in endpoints:
+                for status_class, count in sorted(stats.responses.items()):
+                    lines.append(
+                        f'{prefix}_http_requests_total{{{labels(view, method)},status="{status_class}"}} {count}'
+                    )
+
+            lines += histogram_lines(
+                f'{prefix}_http_request_duration_seconds', 'Time to produce the response.',
+                endpoints, lambda stats: stats.latency,
+            )
+            lines += histogram_lines(
+                f'{prefix}_http_db_queries', 'Database queries per request.',
+                endpoints, lambda stats: stats.queries,
+            )
+
+            lines += [
+                f'# HELP {prefix}_http_db_seconds_total Time spent in database queries.',
+                f'# TYPE {prefix}_http_db_seconds_total counter',
+            ]
+            lines += [
+                f'{prefix}_http_db_seconds_total{{{labels(view, method)}}} {stats.db_seconds:.6f}'
+                for (view, method), stats in endpoints
+            ]
+
+            lines += [
+                f'# HELP {prefix}_http_response_bytes_total Response body bytes (streamed responses excluded).',
+                f'# TYPE {prefix}_http_response_bytes_total counter',
+            ]
+            lines += [
+                f'{prefix}_http_response_bytes_total{{{labels(view, method)}}} {stats.response_bytes}'
+                for (view, method), stats in endpoints
+            ]
+        return '\n'.join(lines) + '\n'
+
+
+def labels(view, method):
+    view = view.replace('\\', '\\\\').replace('"', '\\"')
+    return f'view="{view}",method="{method}"'
+
+
+def histogram_lines(name, help_text, endpoints, histogram_of):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for (view, method), stats in endpoints:
+        histogram = histogram_of(stats)
+        cumulative = 0
+        for bound, count in zip(histogram.bounds + (float('inf'),), histogram.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else f'{bound:g}'
+            lines.append(f'{name}_bucket{{{labels(view, method)},le="{le}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels(view, method)}}} {histogram.total:.6f}')
+        lines.append(f'{name}_count{{{labels(view, method)}}} {cumulative}')
+    return lines
+
+
+metrics = MetricsRegistry()
@@ -1,30 +1,41 @@
 from django.utils.deprecation import MiddlewareMixin
-from rest_framework.authentication import get_authorization_header
-from restaurant.utils import get_table_num_from_jwt, get_device_id_from_jwt
-from rest_framework.exceptions import AuthenticationFailed  # Import the exception here
-from restaurant.models import Table
+from rest_framework.exceptions import AuthenticationFailed
+from restaurant.auth import aresolve_device_token, bearer_token, resolve_device_token
 
 class DeviceJWTMiddleware(MiddlewareMixin):
+    """Attaches the table of a device token to the request.
+
+    Runs natively in both modes: under ASGI a cached token is resolved
+    without leaving the event loop.
+    """
+
     def process_request(self, request):
-        auth_header = get_authorization_header(request).decode('utf-8')
+        token = bearer_token(request)
+        if token:
+            try:
+                # Decoded and matched to its table at most once, then cached
+                table, payload = resolve_device_token(token)
+            except AuthenticationFailed:
+                # Staff tokens and bad device tokens are left to the DRF
+                # authentication classes, which answer with a proper 401/403
+                return
+            self.attach(request, token, table, payload)
 
-        if auth_header and auth_header.startswith("Bearer "):
-            token = auth_header.split(" ")[1]
+    async def __acall__(self, request):
+        token = bearer_token(request)
+        if token:
             try:
-                # Get table number and device id from the JWT token
-                table_num = get_table_num_from_jwt(token)
-                device_id = get_device_id_from_jwt(token)
-                
-                # Attach them to the request for further use
-                request.table_num = table_num
-                request.device_id = device_id
-                
-                try:
-                    request.table = Table.objects.get(table_num=table_num, device_id=device_id)
-                except Table.DoesNotExist:
-                    raise AuthenticationFailed("Invalid table or device ID")
+                table, payload = await aresolve_device_token(token)
+            except AuthenticationFailed:
+                pass
+            else:
+                self.attach(request, token, table, payload)
+        return await self.get_response(request)
 
-            except AuthenticationFailed as e:
-                # Log and raise Authentication error in case of an invalid token
-                print(f"JWT Error: {e}")
-                raise e
\ No newline at end of file
+    @staticmethod
+    def attach(request, token, table, payload):
+        # Attach them to the request for further use
+        request.table = table
+        request.table_num = payload.get("table_num")
+        request.device_id = payload.get("device_id")
+        request.device_token = token
@@ -0,0 +1,67 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from restaurant.metrics import KNOWN_METHODS, metrics, track_db, untrack_db
+
+
+class RequestMetricsMiddleware:
+    """Record latency, DB queries/time, response size and status per endpoint.
+
+    Endpoints are labelled by resolved URL name, so ``client/orders/12/``
+    and ``client/orders/13/`` share a series. The numbers are served by
+    ``metrics/`` in Prometheus format. With ``EXPOSE_QUERY_COUNT`` the
+    request's own query count and DB time are also returned in
+    ``X-DB-Queries`` / ``X-DB-Time-Ms`` (used by `manage.py loadtest`).
+
+    Put it first in ``MIDDLEWARE`` so the latency covers the whole chain.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED and not settings.EXPOSE_QUERY_COUNT:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        usage, token = track_db()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            untrack_db(token)
+        self.record(request, response, time.perf_counter() - start, usage)
+        return response
+
+    async def __acall__(self, request):
+        usage, token = track_db()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            untrack_db(token)
+        self.record(request, response, time.perf_counter() - start, usage)
+        return response
+
+    @staticmethod
+    def record(request, response, seconds, usage):
+        if settings.METRICS_ENABLED:
+            match = request.resolver_match
+            method = request.method if request.method in KNOWN_METHODS else 'OTHER'
+            size = 0 if response.streaming else len(response.content)
+            metrics.observe(
+                match.view_name if match else '<unresolved>', method, response.status_code,
+                seconds, usage.queries, usage.seconds, size,
+            )
+        if settings.EXPOSE_QUERY_COUNT:
+            response['X-DB-Queries'] = str(usage.queries)
+            response['X-DB-Time-Ms'] = f"{usage.seconds * 1000:.2f}"
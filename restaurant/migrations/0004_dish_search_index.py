@@ -0,0 +1,43 @@
+from django.db import migrations
+
+
+def create_dish_search_index(apps, schema_editor):
+    # FTS5 is SQLite only; other databases fall back to icontains lookups
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS restaurant_dish_fts USING fts5("
+        "name, description, ingredients, categories, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    schema_editor.execute("""
+        INSERT INTO restaurant_dish_fts (rowid, name, description, ingredients, categories)
+        SELECT
+            d.id, d.name, d.description,
+            COALESCE((SELECT group_concat(i.name, ' ')
+                      FROM restaurant_dish_ingredients di
+                      JOIN restaurant_ingredient i ON i.id = di.ingredient_id
+                      WHERE di.dish_id = d.id), ''),
+            COALESCE((SELECT group_concat(c.name, ' ')
+                      FROM restaurant_dish_categories dc
+                      JOIN restaurant_category c ON c.id = dc.category_id
+                      WHERE dc.dish_id = d.id), '')
+        FROM restaurant_dish d
+    """)
+
+
+def drop_dish_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS restaurant_dish_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0003_order_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_dish_search_index, drop_dish_search_index),
+    ]
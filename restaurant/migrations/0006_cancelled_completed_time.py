@@ -0,0 +1,20 @@
+from django.db import migrations
+from django.db.models import F
+
+
+def date_cancellations(apps, schema_editor):
+    # Orders cancelled before cancel_order set completed_time; the expiry
+    # sweep ages cancellations by completed_time, so fall back to order_time.
+    Order = apps.get_model('restaurant', 'Order')
+    Order.objects.filter(status='cancelled', completed_time__isnull=True).update(completed_time=F('order_time'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0005_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(date_cancellations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-17 20:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0006_cancelled_completed_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HourlyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('total_orders', models.IntegerField(default=0)),
+                ('total_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('items_sold', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Hourly stats',
+                'verbose_name_plural': 'Hourly stats',
+                'constraints': [models.UniqueConstraint(fields=('date', 'hour'), name='hourly_stats_date_hour_uniq')],
+            },
+        ),
+    ]
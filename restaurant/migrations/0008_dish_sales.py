@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-17 20:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0007_hourly_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DishSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('dish', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales', to='restaurant.dish')),
+            ],
+            options={
+                'verbose_name': 'Dish sales',
+                'verbose_name_plural': 'Dish sales',
+                'constraints': [models.UniqueConstraint(fields=('date', 'hour', 'dish'), name='dish_sales_date_hour_dish_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-17 20:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0008_dish_sales'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('created', 'Created'), ('status', 'Status changed'), ('expired', 'Expired')], max_length=10)),
+                ('old_status', models.CharField(blank=True, choices=[('pending', 'Pending'), ('in_progress', 'In Progress'), ('ready', 'Ready'), ('served', 'Served'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('in_progress', 'In Progress'), ('ready', 'Ready'), ('served', 'Served'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='restaurant.order')),
+                ('table', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_events', to='restaurant.table')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['table', 'id'], name='order_event_table_seq_idx'), models.Index(fields=['at'], name='order_event_at_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-17 20:36
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def date_ready_orders(apps, schema_editor):
+    # Orders already waiting have no record of when they became ready; queue
+    # them by order time so the ready board still shows them oldest first.
+    Order = apps.get_model('restaurant', 'Order')
+    Order.objects.filter(status='ready', ready_time__isnull=True).update(ready_time=F('order_time'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0010_order_events'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='ready_time',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'ready_time'], name='order_status_ready_idx'),
+        ),
+        migrations.RunPython(date_ready_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 20:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0012_menu_changes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='stock',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
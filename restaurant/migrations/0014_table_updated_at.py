@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0013_ingredient_stock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='table',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -1,14 +1,95 @@
+import datetime
 from django.db import models
 from django.utils import timezone
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils.timezone import localtime
+from django.db import NotSupportedError, connection, transaction
+from django.dispatch import Signal
+from django.db.models.functions import ExtractHour
 # Create your models here.
 
+# Sent with ``changes``, a list of ``(order, old_status)`` pairs (old_status is
+# None for a new order), whenever orders are created or change status. A batch
+# transition sends it once for all its orders.
+orders_changed = Signal()
+
+# Sent with ``dish_ids`` after dishes were changed by a bulk UPDATE, which
+# sends no post_save.
+dishes_updated = Signal()
+
+
+class SequencedLog(models.Model):
+    """Base of the append-only logs whose id is a client's cursor.
+
+    A client that has read id N never asks for ids <= N again, so no id may
+    become visible after a higher one has. Ids are taken at insert but show
+    at commit, so inserts go through ``append``, which holds the log's
+    append lock until the transaction ends: commits then follow id order.
+    SQLite serializes writers already; on PostgreSQL the lock is a
+    transaction-level advisory lock, one per log.
+    """
+    # pg_advisory_xact_lock key of the log
+    append_lock_key = None
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def lock_appends(cls):
+        """Wait for the other appenders' transactions; call inside an atomic block"""
+        vendor = connection.vendor
+        if vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', [cls.append_lock_key])
+        elif vendor != 'sqlite':
+            raise NotSupportedError(f"{cls.__name__} needs commits in id order, not implemented on {vendor}")
+
+    @classmethod
+    def append(cls, rows):
+        # No savepoint: the lock is held by the enclosing transaction anyway
+        with transaction.atomic(savepoint=False):
+            cls.lock_appends()
+            return cls.objects.bulk_create(rows)
+
+    @classmethod
+    def head(cls):
+        """Id of the newest row, 0 for an empty log"""
+        return cls.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+    @classmethod
+    def continues(cls, since, head):
+        """Whether every row after cursor ``since`` is still in the log (up to ``head``)"""
+        if since > head:
+            return False
+        oldest = cls.objects.order_by('pk').values_list('pk', flat=True).first()
+        return oldest is None or since >= oldest - 1
+
+    @classmethod
+    def compact(cls, before, batch_size=1000):
+        """Delete rows older than ``before`` in batches; returns how many went.
+
+        The newest row is always kept, so ``head()`` stays put and a client
+        whose cursor falls before the oldest row can tell it missed
+        compacted ones.
+        """
+        newest = cls.head()
+        deleted = 0
+        while True:
+            ids = list(cls.objects.filter(at__lt=before, pk__lt=newest)
+                       .order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            deleted += cls.objects.filter(pk__in=ids).delete()[0]
+
+
 class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='category_images/', blank=True, null=True)
+    # Resized copies of ``image``, maintained by restaurant.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -31,6 +112,10 @@ class Category(models.Model):
 class Ingredient(models.Model):
     name = models.CharField(max_length=100, unique=True)
     icon = models.CharField(max_length=10, blank=True, null=True) 
+    # Portions left; each ordered dish uses one of every ingredient it lists.
+    # Empty when the ingredient is not tracked.
+    stock = models.IntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name  
@@ -39,6 +124,47 @@ class Ingredient(models.Model):
         verbose_name = "Ingredient"
         verbose_name_plural = "Ingredients"
 
+    @classmethod
+    def consume(cls, dish_quantities):
+        """Take the tracked ingredients of ``{dish id: quantity}`` out of stock.
+
+        Meant to run inside the order's transaction. Every ingredient is
+        decremented by one ``F()``/``Case`` UPDATE, so concurrent orders
+        never lose a decrement. Raises ValidationError when one runs short,
+        leaving the caller's rollback to undo the decrement; the dishes of
+        the ingredients that reach zero are disabled.
+        """
+        needs = {}
+        for dish_id, ingredient_id in Dish.ingredients.through.objects.filter(
+            dish_id__in=dish_quantities, ingredient__stock__isnull=False
+        ).values_list('dish_id', 'ingredient_id'):
+            needs[ingredient_id] = needs.get(ingredient_id, 0) + dish_quantities[dish_id]
+        if not needs:
+            return
+
+        cls.objects.filter(pk__in=needs).update(stock=models.Case(
+            *(models.When(pk=pk, then=models.F('stock') - amount) for pk, amount in needs.items())
+        ))
+        depleted = list(cls.objects.filter(pk__in=needs, stock__lte=0).values_list('pk', 'name', 'stock'))
+        short = sorted(name for _, name, stock in depleted if stock < 0)
+        if short:
+            raise ValidationError(f"Not enough {', '.join(short)} left")
+        if depleted:
+            cls.disable_dishes([pk for pk, _, _ in depleted])
+
+    @classmethod
+    def disable_dishes(cls, ingredient_ids):
+        """Make every available dish using one of ``ingredient_ids`` unavailable with one UPDATE"""
+        dish_ids = list(
+            Dish.objects.filter(ingredients__in=ingredient_ids, is_available=True)
+            .values_list('pk', flat=True).distinct()
+        )
+        if dish_ids:
+            Dish.objects.filter(pk__in=dish_ids).update(is_available=False, updated_at=timezone.now())
+            MenuChange.record(dishes=dish_ids)
+            dishes_updated.send(sender=Dish, dish_ids=dish_ids)
+        return dish_ids
+
 def __str__(self):
     return self.name
     
@@ -48,9 +174,12 @@ class Dish(models.Model):
     price = models.DecimalField(max_digits=6, decimal_places=2)
     categories = models.ManyToManyField(Category, related_name='dishes')
     image = models.ImageField(upload_to='dish_images/', blank=True, null=True)
+    # Resized copies of ``image``, maintained by restaurant.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     ingredients = models.ManyToManyField(Ingredient, blank=True)
     time = models.JSONField(default=dict)     
     is_available = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -65,17 +194,79 @@ class Dish(models.Model):
     
     def toggle_availability(self):
         self.is_available = not self.is_available
-        self.save()
+        self.save(update_fields=['is_available', 'updated_at'])
     
     def get_category_names(self):
         return ", ".join([category.name for category in self.categories.all()])
 
     
+class MenuChange(SequencedLog):
+    """A dish or category that was added, changed or removed; the id is the menu revision.
+
+    Tablets holding the menu as of revision N fetch the rows after N and
+    patch their copy (see ``client_menu_changes``). Rows older than
+    ``MENU_CHANGE_RETENTION`` are compacted; a tablet further behind gets
+    the whole menu again.
+    """
+    append_lock_key = 0x6d656e75  # 'menu'
+
+    class Kind(models.TextChoices):
+        DISH = 'dish', 'Dish'
+        CATEGORY = 'category', 'Category'
+
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    object_id = models.BigIntegerField()
+    at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"r{self.pk} {self.kind} {self.object_id}"
+
+    @classmethod
+    def record(cls, dishes=(), categories=()):
+        cls.append(
+            [cls(kind=cls.Kind.DISH, object_id=pk) for pk in set(dishes)]
+            + [cls(kind=cls.Kind.CATEGORY, object_id=pk) for pk in set(categories)]
+        )
+
+    @classmethod
+    def changed_since(cls, since, until):
+        """Ids of the dishes and of the categories changed in revisions ``since`` < r <= ``until``.
+
+        None when some of those revisions were compacted.
+        """
+        if not cls.continues(since, until):
+            return None
+        dishes, categories = set(), set()
+        for kind, pk in cls.objects.filter(pk__gt=since, pk__lte=until).values_list('kind', 'object_id'):
+            (dishes if kind == cls.Kind.DISH else categories).add(pk)
+        return dishes, categories
+
+
+class TableQuerySet(models.QuerySet):
+    def with_activity(self):
+        """Annotate live order activity for every table in one grouped query.
+
+        Adds ``active_orders_count``, ``oldest_active_order_time`` and
+        ``active_total`` (running total of the active orders);
+        ``Table.is_available`` reads the count instead of querying.
+        """
+        active = models.Q(orders__status__in=Order.ACTIVE_STATUSES)
+        return self.annotate(
+            active_orders_count=models.Count('orders', filter=active),
+            oldest_active_order_time=models.Min('orders__order_time', filter=active),
+            active_total=models.Sum('orders__total_price', filter=active),
+        )
+
+
 class Table(models.Model):
     table_num = models.PositiveIntegerField(unique=True)
     device_id = models.CharField(max_length=255, blank=True, null=True, unique=True)
     is_active = models.BooleanField(default=True)
     capacity = models.PositiveIntegerField(default=4)
+    # Lets every process notice a relinked or changed table (restaurant.auth)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TableQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Table"
@@ -92,11 +283,7 @@ class Table(models.Model):
     def get_active_orders(self):
         return Order.objects.filter(
             table=self, 
-            status__in=[
-                Order.OrderStatus.PENDING, 
-                Order.OrderStatus.IN_PROGRESS, 
-                Order.OrderStatus.READY
-            ]
+            status__in=Order.ACTIVE_STATUSES
         )
     
     def get_completed_orders(self):
@@ -130,9 +317,20 @@ class Table(models.Model):
     
     @property
     def is_available(self):
+        if hasattr(self, 'active_orders_count'):
+            # Annotated by TableQuerySet.with_activity
+            return self.active_orders_count == 0
         return self.get_active_orders().count() == 0
     
     
+class OrderQuerySet(models.QuerySet):
+    def with_details(self):
+        """Load the table, items and dishes needed to serialize orders up front"""
+        return self.select_related('table').prefetch_related(
+            models.Prefetch('items', queryset=OrderItem.objects.select_related('dish'))
+        )
+
+
 class Order(models.Model):
     class OrderStatus(models.TextChoices):
         PENDING = 'pending', 'Pending'
@@ -140,10 +338,14 @@ class Order(models.Model):
         READY = 'ready', 'Ready'
         SERVED = 'served', 'Served'
         CANCELLED = 'cancelled', 'Cancelled'
+
+    ACTIVE_STATUSES = [OrderStatus.PENDING, OrderStatus.IN_PROGRESS, OrderStatus.READY]
+    FINISHED_STATUSES = [OrderStatus.SERVED, OrderStatus.CANCELLED]
         
     table = models.ForeignKey(Table, on_delete=models.CASCADE, related_name='orders')
     order_time = models.DateTimeField(auto_now_add=True)
     completed_time = models.DateTimeField(null=True, blank=True)
+    ready_time = models.DateTimeField(null=True, blank=True)
     total_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)  
     items_count = models.IntegerField(null=True, blank=True)
     expired = models.BooleanField(default=False)  # expiry flag
@@ -169,27 +371,126 @@ class Order(models.Model):
         related_name='served_orders',
         help_text="The waiter who served this order"
     )
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Table.get_active_orders, ClientOrderView
+            models.Index(fields=['table', 'status'], name='order_table_status_idx'),
+            # ClientOrderDetailView, ClientExpireOrdersView
+            models.Index(fields=['table', 'expired', 'status'], name='order_table_expired_idx'),
+            # Kitchen queue and other status__in listings, oldest first
+            models.Index(fields=['status', 'order_time'], name='order_status_time_idx'),
+            # Waiters' ready board, longest waiting first
+            models.Index(fields=['status', 'ready_time'], name='order_status_ready_idx'),
+            # Stats.compute_for_date (order_time day range)
+            models.Index(fields=['order_time'], name='order_time_idx'),
+            # expire_old_orders; partial so it only holds the rows still to expire
+            models.Index(fields=['completed_time'], condition=models.Q(expired=False), name='order_expiry_idx'),
+        ]
     
     
     def __str__(self):
         return f"Order #{self.id} - Table {self.table.table_num} - {localtime(self.order_time).strftime('%Y-%m-%d %H:%M')}"
     
     def update_total_price(self):
-        total = sum(item.price * item.quantity for item in self.items.all())  
+        total = sum(item.price * item.quantity for item in self.items.all())
         self.total_price = total
-        self.items_count = sum(item.quantity for item in self.items.all())  
+        self.items_count = sum(item.quantity for item in self.items.all())
         self.save()
-    
+
+    @classmethod
+    def place(cls, table, items_data):
+        """Create an order and all of its items with a fixed number of queries.
+
+        Dishes are resolved in one query, the order row is inserted with its
+        totals already computed and the items go in with a single bulk insert,
+        so the cost no longer grows with the number of lines. Tracked
+        ingredients are taken out of stock in the same transaction.
+        """
+        if not isinstance(items_data, list) or not all(isinstance(item, dict) for item in items_data):
+            raise ValidationError("Items must be a list of {dish, quantity} objects")
+        lines = []
+        for item in items_data:
+            dish_id = item.get('dish')
+            try:
+                quantity = int(item.get('quantity', 1))
+            except (TypeError, ValueError):
+                raise ValidationError("Quantity must be at least 1")
+            if quantity < 1:
+                raise ValidationError("Quantity must be at least 1")
+            try:
+                pk = int(dish_id)
+            except (TypeError, ValueError):
+                raise ValidationError(f"Dish {dish_id} not available")
+            lines.append((dish_id, pk, quantity))
+
+        dishes = Dish.objects.filter(is_available=True).in_bulk({pk for _, pk, _ in lines})
+        for dish_id, pk, _ in lines:
+            if pk not in dishes:
+                raise ValidationError(f"Dish {dish_id} not available")
+
+        items = []
+        total_price = 0
+        items_count = 0
+        for _, pk, quantity in lines:
+            dish = dishes[pk]
+            items.append(OrderItem(dish=dish, quantity=quantity, price=dish.price))
+            total_price += dish.price * quantity
+            items_count += quantity
+
+        dish_quantities = {}
+        for _, pk, quantity in lines:
+            dish_quantities[pk] = dish_quantities.get(pk, 0) + quantity
+
+        with transaction.atomic():
+            Ingredient.consume(dish_quantities)
+            order = cls.objects.create(
+                table=table,
+                status=cls.OrderStatus.PENDING,
+                total_price=total_price,
+                items_count=items_count,
+            )
+            for item in items:
+                item.order = order
+            OrderItem.objects.bulk_create(items)
+            order.notify_changed(None)
+        return order
+
+    def notify_changed(self, old_status):
+        """Tell listeners (kitchen stream, ...) that this order was created or moved"""
+        orders_changed.send(sender=Order, changes=[(self, old_status)])
+
+    def _transition(self, old_status, new_status, **changes):
+        """Move the order from ``old_status`` to ``new_status`` in one conditional UPDATE.
+
+        Only the status and ``changes`` are written, and only
+        while the row is still in ``old_status``, so concurrent clicks cannot
+        both win.
+        Returns whether this call won; a loser reloads the winner's status.
+        Listeners of ``orders_changed`` run in the same transaction.
+        """
+        with transaction.atomic():
+            won = Order.objects.filter(pk=self.pk, status=old_status).update(status=new_status, **changes)
+            if won:
+                self.status = new_status
+                for field, value in changes.items():
+                    setattr(self, field, value)
+                self.notify_changed(old_status)
+        if not won:
+            self.refresh_from_db(fields=['status'])
+        return bool(won)
+
     def mark_as_in_progress(self, chef):
         """Chef marks order as being prepared"""
         if not chef or chef.role != 'chef':
             raise ValidationError("Only chefs can mark orders as in progress")
-            
-        old_status = self.status
-        self.status = self.OrderStatus.IN_PROGRESS
-        self.prepared_by = chef
-        self.save()
-        
+
+        if self.status != self.OrderStatus.PENDING:
+            raise ValidationError("Only pending orders can be marked as in progress")
+
+        return self._transition(self.OrderStatus.PENDING, self.OrderStatus.IN_PROGRESS, prepared_by=chef)
 
     def mark_as_ready(self, chef):
         """Chef marks order as ready to be served"""
@@ -199,9 +500,7 @@ class Order(models.Model):
         if self.status != self.OrderStatus.IN_PROGRESS:
             raise ValidationError("Order must be in progress before being marked as ready")
             
-        old_status = self.status
-        self.status = self.OrderStatus.READY
-        self.save()
+        return self._transition(self.OrderStatus.IN_PROGRESS, self.OrderStatus.READY, ready_time=timezone.now())
 
     def mark_as_served(self, waiter):
         """Waiter marks order as served to the table"""
@@ -211,18 +510,14 @@ class Order(models.Model):
         if self.status != self.OrderStatus.READY:
             raise ValidationError("Order must be ready before being marked as served")
             
-        old_status = self.status
-        self.status = self.OrderStatus.SERVED
-        self.served_by = waiter
-        self.completed_time = timezone.now()
-        self.save()
+        return self._transition(self.OrderStatus.READY, self.OrderStatus.SERVED,
+                                served_by=waiter, completed_time=timezone.now())
 
     def cancel_order(self, user):
-        if self.status == OrderStatus.PENDING:
-            self.status = OrderStatus.CANCELLED
-            self.save()
-        else:
+        if self.status != self.OrderStatus.PENDING:
             raise ValidationError("Only pending orders can be cancelled.")
+        # completed_time also dates cancellations, so the expiry sweep can age them
+        return self._transition(self.OrderStatus.PENDING, self.OrderStatus.CANCELLED, completed_time=timezone.now())
         
     def get_order_duration(self):
         if self.completed_time:
@@ -231,11 +526,7 @@ class Order(models.Model):
     
     @property
     def is_active(self):
-        return self.status in [
-            self.OrderStatus.PENDING, 
-            self.OrderStatus.IN_PROGRESS, 
-            self.OrderStatus.READY
-        ]
+        return self.status in self.ACTIVE_STATUSES
     
     def can_be_modified_by_waiter(self):
         """Check if order can still be modified by waiter"""
@@ -266,6 +557,67 @@ class Order(models.Model):
             return [status[0] for status in self.OrderStatus.choices]
         else:
             return []
+
+    @classmethod
+    def transition_changes(cls, new_status, user):
+        """Fields written alongside a move to ``new_status``, as the single-order methods do"""
+        if new_status == cls.OrderStatus.IN_PROGRESS:
+            return {'prepared_by': user}
+        if new_status == cls.OrderStatus.READY:
+            return {'ready_time': timezone.now()}
+        if new_status == cls.OrderStatus.SERVED:
+            return {'served_by': user, 'completed_time': timezone.now()}
+        if new_status == cls.OrderStatus.CANCELLED:
+            return {'completed_time': timezone.now()}
+        return {}
+
+    @classmethod
+    def transition_many(cls, order_ids, new_status, user):
+        """Move every order in ``order_ids`` that ``user`` may move to ``new_status``.
+
+        One transaction: the rows are read once (locked where the backend
+        supports it), checked with ``get_allowed_next_statuses`` and moved
+        with one UPDATE per current status. Only the rows an UPDATE really
+        wrote count as moved. ``orders_changed`` is then sent once for all
+        the moved orders, inside the same transaction, so the events and
+        the stats are written set-based too.
+        Returns ``{pk: (order, moved)}``; unknown ids are left out.
+        """
+        changes = cls.transition_changes(new_status, user)
+        with transaction.atomic():
+            orders = cls.objects.select_for_update().in_bulk(order_ids)
+            movable = {}
+            for order in orders.values():
+                if order.status != new_status and new_status in order.get_allowed_next_statuses(user):
+                    movable.setdefault(order.status, []).append(order)
+
+            outcomes = {pk: (order, False) for pk, order in orders.items()}
+            moved = []
+            for old_status, group in movable.items():
+                pks = [order.pk for order in group]
+                updated = cls.objects.filter(pk__in=pks, status=old_status).update(status=new_status, **changes)
+                if updated != len(group):
+                    # Another writer moved some rows after they were read (the
+                    # read takes no lock on SQLite): keep only the rows this
+                    # UPDATE wrote, recognised by the values it set
+                    hit = set(cls.objects.filter(pk__in=pks, status=new_status, **changes)
+                              .values_list('pk', flat=True))
+                    lost = [order for order in group if order.pk not in hit]
+                    current = dict(cls.objects.filter(pk__in=[order.pk for order in lost])
+                                   .values_list('pk', 'status'))
+                    for order in lost:
+                        # The winner's status, as _transition reloads it
+                        order.status = current.get(order.pk, order.status)
+                    group = [order for order in group if order.pk in hit]
+                for order in group:
+                    order.status = new_status
+                    for field, value in changes.items():
+                        setattr(order, field, value)
+                    moved.append((order, old_status))
+                    outcomes[order.pk] = (order, True)
+            if moved:
+                orders_changed.send(sender=cls, changes=moved)
+        return outcomes
         
     def check_expiry(self):
         """Check if the order has expired"""
@@ -273,25 +625,52 @@ class Order(models.Model):
             time_difference = timezone.now() - self.order_time
             if time_difference.total_seconds() > settings.AUTO_RESET_TIME:
                 self.expired = True
-                self.save()
+                self.save(update_fields=['expired'])
+                OrderEvent.record_expired([(self.pk, self.table_id, self.status)])
                 
     def mark_as_expired(self):
         """Mark only served or cancelled orders as expired"""
         if self.status in [self.OrderStatus.SERVED, self.OrderStatus.CANCELLED]:
             self.expired = True
-            self.save()
+            self.save(update_fields=['expired'])
+            OrderEvent.record_expired([(self.pk, self.table_id, self.status)])
             return True
         return False
 
     @classmethod
-    def expire_old_orders(cls, hours=24):
-        """Automatically expire old served/cancelled orders"""
-        expire_time = timezone.now() - timedelta(hours=hours)
+    def get_expirable_orders(cls, before):
+        """Served/cancelled orders completed (or cancelled) before ``before`` and not yet expired"""
         return cls.objects.filter(
-            Q(status=OrderStatus.SERVED) | Q(status=OrderStatus.CANCELLED),
+            status__in=[cls.OrderStatus.SERVED, cls.OrderStatus.CANCELLED],
             expired=False,
-            completed_time__lt=expire_time
-        ).update(expired=True)
+            completed_time__lt=before
+        )
+
+    @classmethod
+    def get_completed_orders_on(cls, date):
+        """Served/cancelled orders placed on ``date`` (in the current time zone).
+
+        Filters on a datetime range rather than ``order_time__date`` so the
+        lookup can use the order_time index.
+        """
+        start = timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
+        return cls.objects.filter(
+            order_time__gte=start,
+            order_time__lt=start + datetime.timedelta(days=1),
+            status__in=[cls.OrderStatus.SERVED, cls.OrderStatus.CANCELLED]
+        )
+
+    @classmethod
+    def expire_old_orders(cls, hours=24):
+        """Expire served/cancelled orders completed more than ``hours`` ago; returns how many.
+
+        Goes through ``restaurant.expiry`` like the sweeper, so the orders
+        are logged as ``OrderEvent``s for the feeds and the status ETags.
+        """
+        from restaurant.expiry import sweep_expired_orders
+
+        expire_time = timezone.now() - datetime.timedelta(hours=hours)
+        return sweep_expired_orders(before=expire_time, pause=0).expired
         
 
 class OrderItem(models.Model):
@@ -322,6 +701,94 @@ class OrderItem(models.Model):
             raise ValidationError("Quantity must be at least 1")
 
         
+class OrderEvent(SequencedLog):
+    """Append-only log of order changes; the id is the feed's sequence number.
+
+    Clients keep a replica by applying the events after the last id they
+    saw. Events are inserted through ``append``, so they commit in id order.
+    """
+    append_lock_key = 0x6f726465  # 'orde'
+
+    class Kind(models.TextChoices):
+        CREATED = 'created', 'Created'
+        STATUS = 'status', 'Status changed'
+        EXPIRED = 'expired', 'Expired'
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='events')
+    # Copied from the order so a tablet's feed is one index range
+    table = models.ForeignKey(Table, on_delete=models.CASCADE, related_name='order_events')
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    old_status = models.CharField(max_length=20, choices=Order.OrderStatus.choices, blank=True)
+    status = models.CharField(max_length=20, choices=Order.OrderStatus.choices)
+    at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['table', 'id'], name='order_event_table_seq_idx'),
+            # compact()
+            models.Index(fields=['at'], name='order_event_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} order {self.order_id} {self.kind} {self.old_status or '-'} -> {self.status}"
+
+    @classmethod
+    def record_changes(cls, changes):
+        """One event per ``(order, old_status)`` pair, in one insert"""
+        return cls.append([
+            cls(order=order, table_id=order.table_id, kind=cls.Kind.CREATED if old_status is None else cls.Kind.STATUS,
+                old_status=old_status or '', status=order.status)
+            for order, old_status in changes
+        ])
+
+    @classmethod
+    def record_expired(cls, rows):
+        """One event per ``(order id, table id, status)`` row, in one insert"""
+        cls.append([
+            cls(order_id=pk, table_id=table_id, kind=cls.Kind.EXPIRED, old_status=status, status=status)
+            for pk, table_id, status in rows
+        ])
+
+    @classmethod
+    def table_head(cls, table_id):
+        """Sequence number of the table's newest event: moves whenever one of its orders changes"""
+        return cls.objects.filter(table_id=table_id).order_by('-pk').values_list('pk', flat=True).first() or 0
+
+    @classmethod
+    def feed(cls, since=None, table_id=None, limit=500):
+        """The events after sequence number ``since``, oldest first, for a client's replica.
+
+        Returns ``{'events', 'next', 'more'}``: pass ``next`` as the next
+        ``since``, straight away while ``more`` is set. Without ``since``
+        only the current head is returned, to start following from. Returns
+        None when the cursor cannot be continued (events it has not seen
+        were compacted, or it is ahead of the log): the client must reload
+        its orders and follow on from the head.
+        """
+        head = cls.head()
+        if since is None:
+            return {'events': [], 'next': head, 'more': False}
+        if not cls.continues(since, head):
+            return None
+
+        events = cls.objects.filter(pk__gt=since)
+        if table_id is not None:
+            events = events.filter(table_id=table_id)
+        rows = list(events.order_by('pk').values(
+            'pk', 'order_id', 'table_id', 'kind', 'old_status', 'status', 'at')[:limit + 1])
+        more = len(rows) > limit
+        events = [
+            {'seq': row['pk'], 'order': row['order_id'], 'table': row['table_id'], 'kind': row['kind'],
+             'old_status': row['old_status'], 'status': row['status'], 'at': row['at']}
+            for row in rows[:limit]
+        ]
+        next_seq = events[-1]['seq'] if events else since
+        if not more:
+            # A table's feed can skip other tables' events up to the head
+            next_seq = max(next_seq, head)
+        return {'events': events, 'next': next_seq, 'more': more}
+
+
 class Stats(models.Model):
     date = models.DateField(unique=True)
     total_orders = models.IntegerField(default=0)  
@@ -334,54 +801,112 @@ class Stats(models.Model):
         return f"Stats for {self.date}"
 
     @classmethod
-    def generate_for_date(cls, date):
-        """Generate statistics for a specific date"""
-        # Get orders for the specific date
-        daily_orders = Order.objects.filter(
-            order_time__date=date,
-            status__in=[Order.OrderStatus.SERVED, Order.OrderStatus.CANCELLED]
-        )
-        
-        # Calculate statistics
-        total_orders = daily_orders.count()
-        
-        if total_orders == 0:
-            return cls.objects.update_or_create(
-                date=date,
-                defaults={
-                    'total_orders': 0,
-                    'total_revenue': 0,
-                    'items_sold': 0,
-                    'average_order_value': 0,
-                    'peak_hour': None,
-                }
-            )[0]  # Return the actual object, not the tuple
-        
-        total_revenue = daily_orders.aggregate(total=models.Sum('total_price'))['total'] or 0
-        items_sold = daily_orders.aggregate(total=models.Sum('items_count'))['total'] or 0
-        avg_order = total_revenue / total_orders if total_orders > 0 else 0
-        
-        # Find peak hour
-        hour_counts = {}
-        for order in daily_orders:
-            hour = order.order_time.hour
-            hour_counts[hour] = hour_counts.get(hour, 0) + 1
-        
-        peak_hour = max(hour_counts.items(), key=lambda x: x[1])[0] if hour_counts else None
-        
-        # Create or update stats object
-        stats, created = cls.objects.update_or_create(
-            date=date,
-            defaults={
-                'total_orders': total_orders,
-                'total_revenue': total_revenue,
-                'items_sold': items_sold,
-                'average_order_value': avg_order,
-                'peak_hour': peak_hour,
-            }
+    def compute_hourly(cls, date):
+        """Per-hour order count, revenue and items of a date, as one grouped query"""
+        return list(
+            Order.get_completed_orders_on(date)
+            .annotate(hour=ExtractHour('order_time'))
+            .values('hour')
+            .annotate(
+                total_orders=models.Count('id'),
+                total_revenue=models.Sum('total_price'),
+                items_sold=models.Sum('items_count'),
+            )
+            .order_by('hour')
         )
+
+    @staticmethod
+    def summarize(hourly):
+        """Daily totals and the peak hour derived from (at most 24) hourly buckets"""
+        total_orders = 0
+        total_revenue = 0
+        items_sold = 0
+        peak_hour = None
+        peak_count = 0
+        for bucket in sorted(hourly, key=lambda bucket: bucket['hour']):
+            total_orders += bucket['total_orders']
+            total_revenue += bucket['total_revenue'] or 0
+            items_sold += bucket['items_sold'] or 0
+            if bucket['total_orders'] > peak_count:
+                peak_hour, peak_count = bucket['hour'], bucket['total_orders']
+
+        return {
+            'total_orders': total_orders,
+            'total_revenue': total_revenue,
+            'items_sold': items_sold,
+            'average_order_value': total_revenue / total_orders if total_orders else 0,
+            'peak_hour': peak_hour,
+        }
+
+    @classmethod
+    def compute_for_date(cls, date):
+        """Compute the statistics of a date with a single grouped query"""
+        return cls.summarize(cls.compute_hourly(date))
+
+    @classmethod
+    def save_day(cls, date, hourly):
+        """Store a date's hourly buckets and the daily row derived from them"""
+        with transaction.atomic():
+            HourlyStats.objects.filter(date=date).delete()
+            HourlyStats.objects.bulk_create(
+                HourlyStats(date=date, hour=bucket['hour'], total_orders=bucket['total_orders'],
+                            total_revenue=bucket['total_revenue'] or 0, items_sold=bucket['items_sold'] or 0)
+                for bucket in hourly
+            )
+            stats, created = cls.objects.update_or_create(date=date, defaults=cls.summarize(hourly))
         return stats
 
+    @classmethod
+    def generate_for_date(cls, date):
+        """Generate statistics (and the per-dish rollup) for a specific date"""
+        DishSales.generate_for_date(date)
+        return cls.save_day(date, cls.compute_hourly(date))
+
+    @classmethod
+    def record_orders(cls, orders):
+        """Add just-finished orders to their days' stats with atomic increments.
+
+        The hourly bucket and the daily row are bumped with ``F()`` updates,
+        so concurrent transitions never lose a count; the average and the
+        peak hour are then rederived while the daily row is still locked.
+        Orders are bucketed like ``compute_for_date``: by local order time.
+        The orders are summed per hour first, so a batch costs one UPDATE
+        per hour and per day touched rather than per order.
+        """
+        hours = {}
+        for order in orders:
+            placed = localtime(order.order_time)
+            bucket = hours.setdefault((placed.date(), placed.hour), [0, 0, 0])
+            bucket[0] += 1
+            bucket[1] += order.total_price or 0
+            bucket[2] += order.items_count or 0
+        days = {}
+        for (date, hour), (count, revenue, items) in hours.items():
+            day = days.setdefault(date, [0, 0, 0])
+            day[0] += count
+            day[1] += revenue
+            day[2] += items
+
+        def increments(count, revenue, items):
+            return {
+                'total_orders': models.F('total_orders') + count,
+                'total_revenue': models.F('total_revenue') + revenue,
+                'items_sold': models.F('items_sold') + items,
+            }
+
+        # No savepoint: a failure rolls back the enclosing transition anyway
+        with transaction.atomic(savepoint=False):
+            HourlyStats.objects.bulk_create(
+                [HourlyStats(date=date, hour=hour) for date, hour in hours], ignore_conflicts=True)
+            for (date, hour), bucket in hours.items():
+                HourlyStats.objects.filter(date=date, hour=hour).update(**increments(*bucket))
+            cls.objects.bulk_create([cls(date=date) for date in days], ignore_conflicts=True)
+            for date, day in days.items():
+                cls.objects.filter(date=date).update(**increments(*day))
+                total_orders, total_revenue = cls.objects.filter(date=date).values_list('total_orders', 'total_revenue').get()
+                peak = HourlyStats.objects.filter(date=date).order_by('-total_orders', 'hour').values_list('hour', flat=True).first()
+                cls.objects.filter(date=date).update(average_order_value=total_revenue / total_orders, peak_hour=peak)
+
     @classmethod
     def get_stats_for_date_range(cls, start_date, end_date):
         return cls.objects.filter(date__range=[start_date, end_date])
@@ -409,4 +934,136 @@ class Stats(models.Model):
             'average_order_value': avg_order,
             'period': f"{year}-{month}"
         }
-    
\ No newline at end of file
+    
+
+
+class HourlyStats(models.Model):
+    """One hour of a day's finished orders; ``Stats.peak_hour`` is derived from these"""
+    date = models.DateField()
+    hour = models.PositiveSmallIntegerField()
+    total_orders = models.IntegerField(default=0)
+    total_revenue = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    items_sold = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Hourly stats"
+        verbose_name_plural = "Hourly stats"
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'hour'], name='hourly_stats_date_hour_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Stats for {self.date} {self.hour:02d}:00"
+
+
+class DishSales(models.Model):
+    """Quantity and revenue of one dish in one hour of a day, from served orders"""
+    date = models.DateField()
+    hour = models.PositiveSmallIntegerField()
+    dish = models.ForeignKey(Dish, on_delete=models.CASCADE, related_name='sales')
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Dish sales"
+        verbose_name_plural = "Dish sales"
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'hour', 'dish'], name='dish_sales_date_hour_dish_uniq'),
+        ]
+
+    # Aggregates of OrderItem rows (named apart from the OrderItem fields)
+    SOLD = {
+        'units': models.Sum('quantity'),
+        'sales': models.Sum(models.F('quantity') * models.F('price')),
+    }
+
+    def __str__(self):
+        return f"{self.dish_id} on {self.date} {self.hour:02d}:00"
+
+    @classmethod
+    def compute_for_date(cls, date):
+        """Per-hour, per-dish sales of a date's served orders, as one grouped query"""
+        rows = (
+            OrderItem.objects.filter(order__in=Order.get_completed_orders_on(date).filter(status=Order.OrderStatus.SERVED))
+            .annotate(hour=ExtractHour('order__order_time'))
+            .values('hour', 'dish_id')
+            .annotate(**cls.SOLD)
+            .order_by('hour', 'dish_id')
+        )
+        return [{'hour': row['hour'], 'dish_id': row['dish_id'], 'quantity': row['units'], 'revenue': row['sales']}
+                for row in rows]
+
+    @classmethod
+    def save_day(cls, date, rows):
+        with transaction.atomic():
+            cls.objects.filter(date=date).delete()
+            cls.objects.bulk_create(cls(date=date, **row) for row in rows)
+
+    @classmethod
+    def generate_for_date(cls, date):
+        cls.save_day(date, cls.compute_for_date(date))
+
+    @classmethod
+    def record_orders(cls, orders):
+        """Add just-served orders' items to the rollup with atomic increments.
+
+        The items are summed per (date, hour, dish) in one grouped query and
+        each hour touched gets one ``Case`` UPDATE over its dishes.
+        """
+        hours = {}
+        for order in orders:
+            placed = localtime(order.order_time)
+            hours[order.pk] = (placed.date(), placed.hour)
+        sold = {}
+        for row in OrderItem.objects.filter(order_id__in=hours).values('order_id', 'dish_id').annotate(**cls.SOLD).order_by():
+            dishes = sold.setdefault(hours[row['order_id']], {})
+            units, sales = dishes.get(row['dish_id'], (0, 0))
+            dishes[row['dish_id']] = (units + row['units'], sales + row['sales'])
+        if not sold:
+            return
+
+        with transaction.atomic(savepoint=False):
+            cls.objects.bulk_create(
+                [cls(date=date, hour=hour, dish_id=dish_id)
+                 for (date, hour), dishes in sold.items() for dish_id in dishes],
+                ignore_conflicts=True,
+            )
+            for (date, hour), dishes in sold.items():
+                cls.objects.filter(date=date, hour=hour, dish_id__in=dishes).update(
+                    quantity=models.F('quantity') + models.Case(
+                        *(models.When(dish_id=dish_id, then=units) for dish_id, (units, _) in dishes.items()),
+                        output_field=models.IntegerField(),
+                    ),
+                    revenue=models.F('revenue') + models.Case(
+                        *(models.When(dish_id=dish_id, then=sales) for dish_id, (_, sales) in dishes.items()),
+                        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+                    ),
+                )
+
+    @classmethod
+    def top_sellers(cls, start, end, category=None, limit=10, by_hour=False):
+        """Best-selling dishes between two dates (inclusive), by quantity.
+
+        With ``by_hour`` every dish also gets an ``hours`` list of
+        ``{hour, quantity, revenue}``, from a second grouped query.
+        """
+        sales = cls.objects.filter(date__range=[start, end])
+        if category is not None:
+            sales = sales.filter(dish__categories=category)
+        top = list(
+            sales.values('dish_id', name=models.F('dish__name'))
+            .annotate(quantity=models.Sum('quantity'), revenue=models.Sum('revenue'))
+            .order_by('-quantity', '-revenue', 'dish_id')[:limit]
+        )
+        if by_hour and top:
+            hours = {}
+            for row in (
+                sales.filter(dish_id__in=[dish['dish_id'] for dish in top])
+                .values('dish_id', 'hour')
+                .annotate(quantity=models.Sum('quantity'), revenue=models.Sum('revenue'))
+                .order_by('hour')
+            ):
+                hours.setdefault(row.pop('dish_id'), []).append(row)
+            for dish in top:
+                dish['hours'] = hours.get(dish['dish_id'], [])
+        return top
@@ -0,0 +1,130 @@
+import base64
+import json
+from functools import reduce
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination that seeks on a tuple of columns instead of an offset.
+
+    Every page is a ``WHERE (a, b) < (A, B) ORDER BY a DESC, b DESC LIMIT n``
+    style query, so a page deep into history costs the same as the first.
+    ``ordering`` must be descending and end with a unique column. Cursors are
+    opaque base64 tokens holding the boundary row's key.
+    """
+    ordering = ('-id',)
+    page_size = getattr(settings, 'KEYSET_PAGE_SIZE', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    @property
+    def key_fields(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, row, reverse):
+        key = [getattr(row, field) for field in self.key_fields]
+        payload = json.dumps({'k': [value.isoformat() if hasattr(value, 'isoformat') else value for value in key],
+                              'r': reverse})
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, queryset, cursor):
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            fields = [queryset.model._meta.get_field(field) for field in self.key_fields]
+            key = [field.to_python(value) for field, value in zip(fields, payload['k'], strict=True)]
+            return key, bool(payload['r'])
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def seek(self, key, reverse):
+        """``(a, b, ...) < key`` (or ``>`` when paging backwards) as a Q object"""
+        lookup = 'gt' if reverse else 'lt'
+        clauses = []
+        for i, field in enumerate(self.key_fields):
+            equal = {name: value for name, value in zip(self.key_fields[:i], key[:i])}
+            clauses.append(Q(**equal, **{f'{field}__{lookup}': key[i]}))
+        return reduce(lambda a, b: a | b, clauses)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset, page_size, cursor, reverse = self.page_query(queryset, request)
+        return self.page_rows(list(queryset), page_size, cursor, reverse)
+
+    async def apaginate_queryset(self, queryset, request):
+        """``paginate_queryset`` for async views, fetching through the async ORM"""
+        queryset, page_size, cursor, reverse = self.page_query(queryset, request)
+        return self.page_rows([row async for row in queryset], page_size, cursor, reverse)
+
+    def page_query(self, queryset, request):
+        """The queryset of the requested page, plus one row to tell if there is more"""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        reverse = False
+        if cursor:
+            key, reverse = self.decode_cursor(queryset, cursor)
+            queryset = queryset.filter(self.seek(key, reverse))
+
+        ordering = self.key_fields if reverse else self.ordering
+        return queryset.order_by(*ordering)[:page_size + 1], page_size, cursor, reverse
+
+    def page_rows(self, rows, page_size, cursor, reverse):
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, bool(cursor)
+
+        self.next_cursor = self.encode_cursor(rows[-1], False) if has_next and rows else None
+        self.previous_cursor = self.encode_cursor(rows[0], True) if has_previous and rows else None
+        return rows
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_link(self.next_cursor),
+            'previous': self.get_link(self.previous_cursor),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class OrderKeysetPagination(KeysetPagination):
+    ordering = ('-order_time', '-id')
+
+
+class StatsKeysetPagination(KeysetPagination):
+    ordering = ('-date',)
@@ -0,0 +1,77 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from restaurant.models import Dish
+
+FTS_TABLE = 'restaurant_dish_fts'
+
+# bm25 column weights: name, description, ingredients, categories
+RANK_WEIGHTS = (10.0, 1.0, 4.0, 4.0)
+
+def fts_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def index_dishes(dish_ids):
+    """(Re)write the search rows of the given dishes; missing dishes are dropped"""
+    dish_ids = list(dish_ids)
+    if not dish_ids or not fts_enabled():
+        return
+    dishes = Dish.objects.filter(pk__in=dish_ids).prefetch_related('categories', 'ingredients')
+    placeholders = ', '.join(['%s'] * len(dish_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", dish_ids)
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, description, ingredients, categories) VALUES (%s, %s, %s, %s, %s)",
+            [
+                (
+                    dish.pk,
+                    dish.name,
+                    dish.description,
+                    ' '.join(ingredient.name for ingredient in dish.ingredients.all()),
+                    ' '.join(category.name for category in dish.categories.all()),
+                )
+                for dish in dishes
+            ],
+        )
+
+
+def rebuild_index():
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    index_dishes(Dish.objects.values_list('pk', flat=True))
+
+
+def to_match_expression(query):
+    """Turn free text into an FTS5 query where every word is a quoted prefix"""
+    return ' '.join(f'"{term}"*' for term in re.findall(r'\w+', query.lower()))
+
+
+def search_dishes(query, limit=50):
+    """Ids of available dishes matching ``query``, most relevant first"""
+    expression = to_match_expression(query)
+    if not expression:
+        return []
+
+    if not fts_enabled():
+        terms = Q()
+        for term in re.findall(r'\w+', query):
+            terms &= (
+                Q(name__icontains=term) | Q(description__icontains=term)
+                | Q(ingredients__name__icontains=term) | Q(categories__name__icontains=term)
+            )
+        return list(
+            Dish.objects.filter(terms, is_available=True).distinct().order_by('name').values_list('pk', flat=True)[:limit]
+        )
+
+    weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT d.id FROM {FTS_TABLE} f JOIN restaurant_dish d ON d.id = f.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s AND d.is_available "
+            f"ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s",
+            [expression, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
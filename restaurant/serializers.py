@@ -2,16 +2,30 @@
 from rest_framework import serializers
 from .models import Category, Dish, Table, Order, OrderItem, Stats, Ingredient
 from users.models import User
+import logging
 import uuid
 import jwt
 import datetime
 from django.conf import settings
+from django.utils import timezone
+from .images import variant_urls
 
+logger = logging.getLogger(__name__)
 
-class CategorySerializer(serializers.ModelSerializer):
+
+class ImageVariantsMixin(serializers.Serializer):
+    """Exposes the thumb/card/full derivatives of ``image``"""
+    image_variants = serializers.SerializerMethodField()
+
+    def get_image_variants(self, obj):
+        request = self.context.get('request')
+        return variant_urls(obj.image_variants, obj.image.storage, request.build_absolute_uri if request else None)
+
+
+class CategorySerializer(ImageVariantsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
-        fields = ['id', 'name', 'description', 'image']
+        fields = ['id', 'name', 'description', 'image', 'image_variants', 'updated_at']
         read_only_fields = ['id']
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -20,14 +34,14 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'icon']
 
 
-class DishSerializer(serializers.ModelSerializer):
+class DishSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     categories = CategorySerializer(many=True, read_only=True)
     ingredients = ingredients = IngredientSerializer(many=True)
 
     class Meta:
         model = Dish
         fields = ['id', 'name', 'description', 'price', 'categories', 
-                 'image', 'ingredients', 'time', 'is_available']
+                 'image', 'image_variants', 'ingredients', 'time', 'is_available', 'updated_at']
         read_only_fields = ['id']
         
     def validate(self, value):
@@ -48,6 +62,20 @@ class TableSerializer(serializers.ModelSerializer):
                  'is_available', 'active_orders_count']
         read_only_fields = ['id', 'device_id', 'is_available', 'active_orders_count']
         
+class TableFloorSerializer(TableSerializer):
+    """Table with live activity, read from TableQuerySet.with_activity annotations"""
+    oldest_active_order_age = serializers.SerializerMethodField()
+    active_total = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+
+    class Meta(TableSerializer.Meta):
+        fields = TableSerializer.Meta.fields + ['oldest_active_order_age', 'active_total']
+
+    def get_oldest_active_order_age(self, obj):
+        """Seconds since the oldest active order was placed"""
+        if obj.oldest_active_order_time is None:
+            return None
+        return int((timezone.now() - obj.oldest_active_order_time).total_seconds())
+        
 class TableLinkSerializer(serializers.Serializer):
     table_num = serializers.IntegerField()
 
@@ -81,7 +109,7 @@ class TableLinkSerializer(serializers.Serializer):
             "exp": datetime.datetime.utcnow() + datetime.timedelta(days=1)  
         }
         
-        print(payload) 
+        logger.info("Linked a device to table %s", table.table_num)
 
         token = jwt.encode(payload, settings.JWT_SECRET_KEY, algorithm='HS256')
 
@@ -90,7 +118,7 @@ class TableLinkSerializer(serializers.Serializer):
     
 class OrderItemSerializer(serializers.ModelSerializer):
     dish_name = serializers.CharField(source='dish.name', read_only=True)
-    total_price = serializers.DecimalField(max_digits=6, decimal_places=2, read_only=True)
+    total_price = serializers.DecimalField(source='get_total_price', max_digits=6, decimal_places=2, read_only=True)
     
     class Meta:
         model = OrderItem
@@ -106,15 +134,56 @@ class OrderSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Order
-        fields = ['id', 'table', 'table_number', 'order_time', 'completed_time',
+        fields = ['id', 'table', 'table_number', 'order_time', 'completed_time', 'ready_time',
                  'total_price', 'items_count', 'status', 'status_display',
                  'prepared_by', 'served_by', 'items', 'duration']
-        read_only_fields = ['id', 'order_time', 'completed_time', 'total_price',
-                          'items_count', 'status_display', 'duration']
+        # Status moves go through the transition actions, which log them for
+        # the event feed and the ready board
+        read_only_fields = ['id', 'order_time', 'completed_time', 'ready_time', 'total_price',
+                          'items_count', 'status', 'status_display', 'duration']
         extra_kwargs = {
             'table': {'write_only': True}
         }
 
+class OrderListSerializer(serializers.BaseSerializer):
+    """Read-only OrderSerializer output for list views, built without per-field overhead.
+
+    Expects orders loaded with ``Order.objects.with_details()`` so items,
+    dishes and tables are already in memory.
+    """
+    datetime_field = serializers.DateTimeField()
+    price_field = serializers.DecimalField(max_digits=10, decimal_places=2)
+    duration_field = serializers.DurationField()
+
+    def to_representation(self, order):
+        to_datetime = self.datetime_field.to_representation
+        to_price = self.price_field.to_representation
+        return {
+            'id': order.id,
+            'table_number': order.table.table_num,
+            'order_time': to_datetime(order.order_time),
+            'completed_time': to_datetime(order.completed_time) if order.completed_time else None,
+            'ready_time': to_datetime(order.ready_time) if order.ready_time else None,
+            'total_price': to_price(order.total_price) if order.total_price is not None else None,
+            'items_count': order.items_count,
+            'status': order.status,
+            'status_display': order.get_status_display(),
+            'prepared_by': order.prepared_by_id,
+            'served_by': order.served_by_id,
+            'items': [
+                {
+                    'id': item.id,
+                    'dish': item.dish_id,
+                    'dish_name': item.dish.name,
+                    'quantity': item.quantity,
+                    'price': to_price(item.price),
+                    'total_price': to_price(item.get_total_price()),
+                }
+                for item in order.items.all()
+            ],
+            'duration': self.duration_field.to_representation(order.get_order_duration()),
+        }
+
 class StatsSerializer(serializers.ModelSerializer):
     class Meta:
         model = Stats
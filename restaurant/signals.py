@@ -0,0 +1,157 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from restaurant.auth import device_token_cache
+from restaurant.images import refresh_image_variants, variants_stale
+from restaurant.kitchen import kitchen_broker
+from restaurant.menu import invalidate_menu
+from restaurant.metrics import install_query_counter
+from restaurant.models import (Category, Dish, DishSales, Ingredient, MenuChange, Order, OrderEvent, Stats, Table,
+                               dishes_updated, orders_changed)
+from restaurant.search import index_dishes
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Dish)
+def image_changed(sender, instance, **kwargs):
+    # Encoding the renditions is slow: do it once the save has committed
+    if variants_stale(instance):
+        transaction.on_commit(partial(build_image_variants, sender, instance.pk))
+
+
+def build_image_variants(model, pk):
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not refresh_image_variants(instance):
+        return
+    # A queryset update: log it for the tablets' delta sync like the command does
+    if model is Dish:
+        MenuChange.record(dishes=[pk])
+    else:
+        MenuChange.record(categories=[pk])
+    invalidate_menu()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Dish)
+@receiver(post_delete, sender=Dish)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def menu_model_changed(sender, **kwargs):
+    invalidate_menu()
+
+
+@receiver(dishes_updated)
+def menu_bulk_changed(sender, **kwargs):
+    invalidate_menu()
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_stock_changed(sender, instance, **kwargs):
+    # Stock set to zero by hand (admin) sells its dishes out like an order would
+    if instance.stock is not None and instance.stock <= 0:
+        Ingredient.disable_dishes([instance.pk])
+
+
+@receiver(m2m_changed, sender=Dish.categories.through)
+@receiver(m2m_changed, sender=Dish.ingredients.through)
+def menu_relation_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_menu()
+
+
+@receiver(post_save, sender=Table)
+@receiver(post_delete, sender=Table)
+def table_changed(sender, instance, **kwargs):
+    # Linking or resetting a device must revoke its cached tokens immediately
+    device_token_cache.invalidate_table(instance.pk)
+
+
+@receiver(connection_created)
+def count_request_queries(sender, connection, **kwargs):
+    install_query_counter(connection)
+
+
+@receiver(orders_changed)
+def log_order_events(sender, changes, **kwargs):
+    OrderEvent.record_changes(changes)
+
+
+@receiver(orders_changed)
+def publish_kitchen_event(sender, **kwargs):
+    transaction.on_commit(kitchen_broker.notify)
+
+
+@receiver(orders_changed)
+def record_finished_orders(sender, changes, **kwargs):
+    # Same transaction as the transition, so a rollback undoes both
+    finished = [order for order, old_status in changes
+                if order.status in Order.FINISHED_STATUSES and old_status not in Order.FINISHED_STATUSES]
+    if finished:
+        Stats.record_orders(finished)
+        served = [order for order in finished if order.status == Order.OrderStatus.SERVED]
+        if served:
+            DishSales.record_orders(served)
+
+
+def dishes_of(instance):
+    """Dishes linked to a Category or an Ingredient"""
+    return instance.dishes if isinstance(instance, Category) else instance.dish_set
+
+
+def dishes_changed(dish_ids):
+    """The dishes' rendered payload changed: refresh their search rows and log them for menu sync"""
+    dish_ids = list(dish_ids)
+    index_dishes(dish_ids)
+    MenuChange.record(dishes=dish_ids)
+
+
+@receiver(post_save, sender=Dish)
+@receiver(post_delete, sender=Dish)
+def dish_changed(sender, instance, **kwargs):
+    dishes_changed([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    MenuChange.record(categories=[instance.pk])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Ingredient)
+def related_dishes_changed(sender, instance, created, **kwargs):
+    if not created:
+        dishes_changed(dishes_of(instance).values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Category)
+@receiver(pre_delete, sender=Ingredient)
+def remember_related_dishes(sender, instance, **kwargs):
+    # The M2M rows are gone by post_delete, and deleting them sends no m2m_changed
+    instance._related_dish_ids = list(dishes_of(instance).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Ingredient)
+def orphaned_dishes_changed(sender, instance, **kwargs):
+    dishes_changed(getattr(instance, '_related_dish_ids', []))
+
+
+@receiver(m2m_changed, sender=Dish.categories.through)
+@receiver(m2m_changed, sender=Dish.ingredients.through)
+def dish_relation_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            dishes_changed([instance.pk])
+    elif action == 'pre_clear':
+        # Which dishes lose this category/ingredient is only known before the clear
+        instance._related_dish_ids = list(dishes_of(instance).values_list('pk', flat=True))
+    elif action == 'post_clear':
+        dishes_changed(getattr(instance, '_related_dish_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        dishes_changed(pk_set)
@@ -1,12 +1,58 @@
 from django.test import TestCase
 
 # Create your tests here.
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from django.contrib.auth import get_user_model
-from .models import Order, Table, Dish, Category
+from django.core.exceptions import ValidationError
+from .models import (Order, OrderItem, OrderEvent, Table, Dish, Category, Stats, HourlyStats, DishSales, Ingredient,
+                     MenuChange)
+from .search import search_dishes
+from .expiry import compact_menu_changes, sweep_expired_orders
+from .menu import get_menu_snapshot
+from .auth import device_token_cache
+from .metrics import metrics
+from .views import ChefOrderViewSet, ClientOrderView, visible_orders_of
+from .serializers import OrderListSerializer, OrderSerializer
+import datetime
+import uuid
+import jwt
+import json
+import asyncio
+import io
+import os
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from django.db import OperationalError, connection, transaction
+import tempfile
+import threading
+import time
+from django.test import tag, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.test import APIClient
+import requests
 
 User = get_user_model()
 
+
+def device_token(table):
+    """Link a fresh device to the table and return its JWT"""
+    table.device_id = str(uuid.uuid4())
+    table.save()
+    payload = {
+        "device_id": table.device_id,
+        "table_num": table.table_num,
+        "exp": datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=1),
+    }
+    return jwt.encode(payload, settings.JWT_SECRET_KEY, algorithm='HS256')
+
 class OrderStatusTests(TestCase):
     def setUp(self):
         # Create test data
@@ -87,4 +133,1291 @@ class OrderStatusTests(TestCase):
         
         # Can't cancel already cancelled order
         with self.assertRaises(ValidationError):
-            order.cancel_order(self.waiter)
\ No newline at end of file
+            order.cancel_order(self.waiter)
+
+
+class OrderPlacementTests(TestCase):
+    def setUp(self):
+        self.table = Table.objects.create(table_num=1, capacity=4)
+        self.dishes = [
+            Dish.objects.create(name=f'Dish {i}', price=10 + i, is_available=True)
+            for i in range(10)
+        ]
+
+    def test_totals_are_computed_once(self):
+        """Order totals reflect every line"""
+        order = Order.place(self.table, [
+            {'dish': self.dishes[0].id, 'quantity': 2},
+            {'dish': self.dishes[1].id},
+        ])
+        self.assertEqual(order.total_price, 2 * 10 + 11)
+        self.assertEqual(order.items_count, 3)
+        self.assertEqual(order.items.count(), 2)
+
+    def test_query_count_does_not_grow_with_items(self):
+        """A 10 item order costs the same number of queries as a 1 item order"""
+        items = [{'dish': dish.id, 'quantity': 1} for dish in self.dishes]
+        # dish lookup, savepoint, tracked ingredients, order insert, items insert, event insert, release
+        with self.assertNumQueries(7):
+            Order.place(self.table, items[:1])
+        with self.assertNumQueries(7):
+            Order.place(self.table, items)
+
+    def test_unavailable_dish_is_rejected(self):
+        """An unavailable dish aborts the whole order"""
+        self.dishes[3].is_available = False
+        self.dishes[3].save()
+        with self.assertRaisesMessage(ValidationError, f"Dish {self.dishes[3].id} not available"):
+            Order.place(self.table, [
+                {'dish': self.dishes[0].id},
+                {'dish': self.dishes[3].id},
+            ])
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+
+    def test_malformed_orders_get_a_readable_400(self):
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {device_token(self.table)}'
+        for items, error in (
+            ('abc', "Items must be a list of {dish, quantity} objects"),
+            ([1, 2], "Items must be a list of {dish, quantity} objects"),
+            ([{'dish': 999}], "Dish 999 not available"),
+        ):
+            response = self.client.post('/restau/client/orders/', {'items': items}, content_type='application/json')
+            self.assertEqual((response.status_code, response.json()), (400, {'error': error}))
+        self.assertFalse(Order.objects.exists())
+
+
+class MenuSnapshotTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Pizza')
+        self.dish = Dish.objects.create(name='Margherita', price=9, is_available=True)
+        self.dish.categories.add(self.category)
+        self.table = Table.objects.create(table_num=1)
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {device_token(self.table)}'
+
+    def test_snapshot_is_reused_until_menu_changes(self):
+        """The menu is built once and rebuilt after a dish changes"""
+        snapshot = get_menu_snapshot()
+        with self.assertNumQueries(0):
+            self.assertIs(get_menu_snapshot(), snapshot)
+
+        self.dish.toggle_availability()
+        self.assertEqual(get_menu_snapshot().get_available_dishes(), [])
+
+    def test_client_dish_list_filters_snapshot(self):
+        """Client dish list applies category and price filters to the snapshot"""
+        Dish.objects.create(name='Water', price=2, is_available=True)
+        response = self.client.get('/restau/client/dishes/', {'categories': 'Pizza', 'min_price': '5'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([dish['name'] for dish in response.json()], ['Margherita'])
+
+    def test_client_dish_list_rejects_non_finite_prices(self):
+        for value in ('nan', 'inf', '-Infinity', 'sNaN'):
+            response = self.client.get('/restau/client/dishes/', {'min_price': value})
+            self.assertEqual(response.status_code, 400, value)
+
+    def test_snapshot_follows_changes_made_by_other_processes(self):
+        """The revision check sees menu changes this process was not told about"""
+        snapshot = get_menu_snapshot()
+        # What another worker's save leaves behind: the rows and their log, no local invalidation
+        Dish.objects.filter(pk=self.dish.pk).update(price=11)
+        MenuChange.record(dishes=[self.dish.pk])
+        self.assertIs(get_menu_snapshot(), snapshot)
+        with override_settings(MENU_REVISION_CHECK_INTERVAL=0), mock.patch('restaurant.menu._fresh_until', 0.0):
+            self.assertEqual(get_menu_snapshot().dishes_by_id[self.dish.pk]['price'], '11.00')
+
+        response = self.client.get(f'/restau/client/categories/{self.category.id}/dishes/')
+        self.assertEqual([dish['name'] for dish in response.json()], ['Margherita'])
+
+
+class DeviceAuthTests(TestCase):
+    def setUp(self):
+        device_token_cache.clear()
+        self.table = Table.objects.create(table_num=1)
+        self.token = device_token(self.table)
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {self.token}'
+
+    def test_authenticated_request_makes_no_auth_queries(self):
+        """A repeat tablet request is authenticated from the token cache"""
+        self.client.get('/restau/client/orders/')
+        # only the order list itself
+        with self.assertNumQueries(1):
+            response = self.client.get('/restau/client/orders/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_table_changed_elsewhere_revokes_cached_token(self):
+        """A relink by another process (no local signal) is seen by the revocation check"""
+        self.assertEqual(self.client.get('/restau/client/orders/').status_code, 200)
+        Table.objects.filter(pk=self.table.pk).update(device_id=str(uuid.uuid4()), updated_at=timezone.now())
+        self.assertEqual(self.client.get('/restau/client/orders/').status_code, 200)
+        with mock.patch.object(device_token_cache, 'check_interval', 0):
+            response = self.client.get('/restau/client/orders/')
+        self.assertIn(response.status_code, (401, 403))
+
+    def test_reset_table_revokes_cached_token(self):
+        """Unlinking a device drops its token from the cache"""
+        self.assertEqual(self.client.post('/restau/client/resetTable/').status_code, 200)
+        response = self.client.get('/restau/client/orders/')
+        self.assertIn(response.status_code, (401, 403))
+
+    def test_expired_token_is_rejected(self):
+        """The exp claim is honoured"""
+        payload = {
+            "device_id": self.table.device_id,
+            "table_num": self.table.table_num,
+            "exp": datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=1),
+        }
+        token = jwt.encode(payload, settings.JWT_SECRET_KEY, algorithm='HS256')
+        response = self.client.get('/restau/client/orders/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertIn(response.status_code, (401, 403))
+
+
+class KitchenStreamTests(TestCase):
+    def setUp(self):
+        self.chef = User.objects.create_user(username='chef1', password='testpass', role='chef')
+        self.table = Table.objects.create(table_num=1)
+        self.dish = Dish.objects.create(name='Pasta', price=12)
+        self.token = str(RefreshToken.for_user(self.chef).access_token)
+
+    async def test_stream_sends_snapshot_then_changes(self):
+        """The kitchen stream starts with the active queue and then pushes updates"""
+        order = await sync_to_async(Order.place)(self.table, [{'dish': self.dish.id}])
+        served = await Order.objects.acreate(table=self.table, status=Order.OrderStatus.SERVED)
+
+        response = await self.async_client.get('/restau/chef/orders/stream/', {'token': self.token})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = response.streaming_content
+        stream = aiter(content)
+
+        snapshot = await anext(stream)
+        self.assertTrue(snapshot.startswith(b'event: snapshot\n'))
+        ids = [entry['id'] for entry in json.loads(snapshot.split(b'data: ', 1)[1])]
+        self.assertEqual(ids, [order.id])
+        self.assertNotIn(served.id, ids)
+
+        def start_order():
+            with self.captureOnCommitCallbacks(execute=True):
+                order.mark_as_in_progress(self.chef)
+        await sync_to_async(start_order)()
+
+        update = await asyncio.wait_for(anext(stream), timeout=5)
+        self.assertTrue(update.startswith(b'event: order_updated\n'))
+        self.assertEqual(json.loads(update.split(b'data: ', 1)[1])['status'], 'in_progress')
+        await content.aclose()
+
+    async def test_stream_catches_up_with_changes_from_other_processes(self):
+        """Changes that wake no stream here (no on_commit runs in this test) arrive by the catch-up read"""
+        response = await self.async_client.get('/restau/chef/orders/stream/', {'token': self.token})
+        content = response.streaming_content
+        stream = aiter(content)
+        await anext(stream)
+
+        with mock.patch('restaurant.kitchen.CATCH_UP_SECONDS', 0.05):
+            order = await sync_to_async(Order.place)(self.table, [{'dish': self.dish.id}])
+            created = await asyncio.wait_for(anext(stream), timeout=5)
+            self.assertTrue(created.startswith(b'event: order_created\n'))
+            self.assertEqual(json.loads(created.split(b'data: ', 1)[1])['id'], order.id)
+
+            await sync_to_async(order.mark_as_in_progress)(self.chef)
+            update = await asyncio.wait_for(anext(stream), timeout=5)
+            self.assertEqual(json.loads(update.split(b'data: ', 1)[1])['status'], 'in_progress')
+        await content.aclose()
+
+    async def test_stream_requires_chef(self):
+        """Only chefs may open the kitchen stream"""
+        response = await self.async_client.get('/restau/chef/orders/stream/')
+        self.assertEqual(response.status_code, 401)
+
+
+class StatsGenerationTests(TestCase):
+    def setUp(self):
+        self.table = Table.objects.create(table_num=1)
+        self.day = datetime.date(2025, 3, 1)
+
+    def make_order(self, hour, total, items, status=Order.OrderStatus.SERVED):
+        order = Order.objects.create(table=self.table, total_price=total, items_count=items, status=status)
+        order_time = datetime.datetime.combine(self.day, datetime.time(hour, 15), tzinfo=datetime.timezone.utc)
+        Order.objects.filter(pk=order.pk).update(order_time=order_time)
+
+    def test_generate_for_date(self):
+        """Daily totals and peak hour come from one grouped query"""
+        self.make_order(12, 20, 2)
+        self.make_order(19, 30, 3)
+        self.make_order(19, 10, 1, status=Order.OrderStatus.CANCELLED)
+        self.make_order(20, 99, 9, status=Order.OrderStatus.PENDING)
+
+        with self.assertNumQueries(1):
+            values = Stats.compute_for_date(self.day)
+        self.assertEqual(values['total_orders'], 3)
+        self.assertEqual(values['total_revenue'], 60)
+        self.assertEqual(values['items_sold'], 6)
+        self.assertEqual(values['peak_hour'], 19)
+
+        stats = Stats.generate_for_date(self.day)
+        self.assertEqual(stats.average_order_value, 20)
+
+    def test_backfill_command(self):
+        """backfill_stats writes one row per day in the range"""
+        self.make_order(8, 15, 1)
+        call_command('backfill_stats', '--start=2025-02-27', '--end=2025-03-02', '--chunk-size=2', '--workers=1', stdout=io.StringIO())
+        self.assertEqual(Stats.objects.count(), 4)
+        self.assertEqual(Stats.objects.get(date=self.day).total_orders, 1)
+        self.assertEqual(HourlyStats.objects.get(date=self.day).hour, 8)
+
+    def test_finished_orders_update_stats(self):
+        """Serving or cancelling an order bumps its day, matching a full recompute"""
+        chef = User.objects.create_user(username='chef1', password='testpass', role='chef')
+        waiter = User.objects.create_user(username='waiter1', password='testpass', role='waiter')
+        today = timezone.localdate()
+        for total, items in [(20, 2), (30, 3)]:
+            order = Order.objects.create(table=self.table, total_price=total, items_count=items)
+            order.mark_as_in_progress(chef)
+            order.mark_as_ready(chef)
+            order.mark_as_served(waiter)
+        Order.objects.create(table=self.table, total_price=10, items_count=1).cancel_order(self.table)
+
+        stats = Stats.objects.get(date=today)
+        self.assertEqual((stats.total_orders, stats.total_revenue, stats.items_sold), (3, 60, 6))
+        self.assertEqual(stats.average_order_value, 20)
+        self.assertEqual(stats.peak_hour, timezone.localtime().hour)
+        call_command('reconcile_stats', stdout=io.StringIO())
+
+    def test_reconcile_detects_and_repairs_drift(self):
+        self.make_order(12, 20, 2)
+        Stats.generate_for_date(self.day)
+        Stats.objects.filter(date=self.day).update(total_orders=5)
+        args = ['reconcile_stats', '--start=2025-03-01']
+        with self.assertRaises(CommandError):
+            call_command(*args, stdout=io.StringIO())
+        call_command(*args, '--fix', stdout=io.StringIO())
+        self.assertEqual(Stats.objects.get(date=self.day).total_orders, 1)
+        call_command(*args, stdout=io.StringIO())
+
+
+@skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN is SQLite specific")
+class OrderQueryPlanTests(TestCase):
+    """The hot order queries must stay index lookups once the planner has statistics"""
+
+    SEED_ORDERS = 20_000
+
+    @classmethod
+    def setUpTestData(cls):
+        Table.objects.bulk_create(Table(table_num=num) for num in range(1, 201))
+        cls.table = Table.objects.get(table_num=1)
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < %s)
+                INSERT INTO restaurant_order
+                    (table_id, order_time, completed_time, total_price, items_count, expired, status)
+                SELECT
+                    (SELECT MIN(id) FROM restaurant_table) + i %% 200,
+                    datetime('2024-01-01', '+' || (i / 3) || ' minutes'),
+                    CASE WHEN i %% 10 < 8 THEN datetime('2024-01-01', '+' || (i / 3 + 30) || ' minutes') END,
+                    20, 2, i %% 10 < 7,
+                    CASE WHEN i %% 10 < 7 THEN 'served' WHEN i %% 10 = 7 THEN 'cancelled'
+                         WHEN i %% 10 = 8 THEN 'pending' ELSE 'ready' END
+                FROM n
+            """, [cls.SEED_ORDERS])
+            cursor.execute("ANALYZE")
+
+    def assertNoFullScan(self, queryset):
+        plan = queryset.explain()
+        self.assertNotRegex(plan, r'SCAN restaurant_order\b', plan)
+
+    def test_hot_queries_use_indexes(self):
+        request = SimpleNamespace(table=self.table)
+        querysets = {
+            'Table.get_active_orders': self.table.get_active_orders(),
+            'ClientOrderView': ClientOrderView(request=request).get_queryset(),
+            'client_order_detail': visible_orders_of(self.table).filter(pk=1),
+            'client_order_status': Order.objects.filter(table=self.table, expired=False).order_by('-pk'),
+            'ready_board': Order.objects.filter(status=Order.OrderStatus.READY).order_by('ready_time', 'pk'),
+            'ClientExpireOrdersView': self.table.get_completed_orders().filter(expired=False),
+            'Stats.compute_for_date': Order.get_completed_orders_on(datetime.date(2024, 6, 1)),
+            'expire_old_orders': Order.get_expirable_orders(datetime.datetime(2024, 2, 1, tzinfo=datetime.timezone.utc)),
+        }
+        for name, queryset in querysets.items():
+            with self.subTest(name):
+                self.assertNoFullScan(queryset)
+
+
+@tag('slow')
+@skipUnless(os.environ.get('QUERY_PLAN_SEED_ORDERS'), "set QUERY_PLAN_SEED_ORDERS to check plans on a production-sized table")
+class LargeOrderQueryPlanTests(OrderQueryPlanTests):
+    """Same plan checks on a production-sized orders table, e.g. QUERY_PLAN_SEED_ORDERS=1000000"""
+
+    SEED_ORDERS = int(os.environ.get('QUERY_PLAN_SEED_ORDERS') or 0)
+
+
+class TableActivityTests(TestCase):
+    def setUp(self):
+        self.waiter = User.objects.create_user(username='waiter1', password='testpass', role='waiter')
+        self.tables = Table.objects.bulk_create(Table(table_num=num) for num in range(1, 21))
+        Order.objects.create(table=self.tables[0], total_price=12, status=Order.OrderStatus.PENDING)
+        Order.objects.create(table=self.tables[0], total_price=8, status=Order.OrderStatus.READY)
+        Order.objects.create(table=self.tables[1], total_price=30, status=Order.OrderStatus.SERVED)
+        self.client = APIClient()
+        self.client.force_authenticate(self.waiter)
+
+    def test_floor_map_is_one_query(self):
+        """The floor map annotates every table's activity in a single query"""
+        with self.assertNumQueries(1):
+            response = self.client.get('/restau/floor-map/')
+        self.assertEqual(response.status_code, 200)
+        tables = {table['table_num']: table for table in response.json()}
+        self.assertEqual(len(tables), 20)
+        self.assertEqual(tables[1]['active_orders_count'], 2)
+        self.assertFalse(tables[1]['is_available'])
+        self.assertEqual(tables[1]['active_total'], '20.00')
+        self.assertIsNotNone(tables[1]['oldest_active_order_age'])
+        self.assertTrue(tables[2]['is_available'])
+        self.assertIsNone(tables[2]['oldest_active_order_age'])
+
+    def test_floor_map_requires_floor_staff(self):
+        """Chefs are not floor staff"""
+        chef = User.objects.create_user(username='chef1', password='testpass', role='chef')
+        self.client.force_authenticate(chef)
+        self.assertEqual(self.client.get('/restau/floor-map/').status_code, 403)
+
+
+class OrderListQueryBudgetTests(TestCase):
+    def setUp(self):
+        self.chef = User.objects.create_user(username='chef1', password='testpass', role='chef')
+        self.waiter = User.objects.create_user(username='waiter1', password='testpass', role='waiter')
+        self.table = Table.objects.create(table_num=1)
+        dishes = [Dish.objects.create(name=f'Dish {i}', price=5 + i) for i in range(3)]
+        for _ in range(10):
+            Order.place(self.table, [{'dish': dish.id, 'quantity': 2} for dish in dishes])
+        self.client = APIClient()
+
+    def test_list_serializer_matches_order_serializer(self):
+        """The lean list serializer renders exactly what OrderSerializer does"""
+        Order.objects.update(completed_time=timezone.now())
+        order = Order.objects.with_details().first()
+        self.assertEqual(OrderListSerializer(order).data, OrderSerializer(order).data)
+
+    def test_staff_lists_use_fixed_queries(self):
+        """Orders, then items with their dishes, whatever the number of orders"""
+        for user, url in ((self.chef, '/restau/chef/orders/'), (self.waiter, '/restau/waiter/orders/')):
+            with self.subTest(url):
+                self.client.force_authenticate(user)
+                with self.assertNumQueries(2):
+                    response = self.client.get(url)
+                self.assertEqual(len(response.json()['results']), 10)
+
+    def test_client_list_uses_fixed_queries(self):
+        """A tablet's order list costs the same two queries once authenticated"""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {device_token(self.table)}')
+        self.client.get('/restau/client/orders/')
+        with self.assertNumQueries(2):
+            response = self.client.get('/restau/client/orders/')
+        self.assertEqual(len(response.json()['results']), 10)
+
+
+class DishSearchTests(TestCase):
+    def setUp(self):
+        self.pizza = Category.objects.create(name='Pizza')
+        self.basil = Ingredient.objects.create(name='Basil')
+        self.margherita = Dish.objects.create(name='Margherita', description='Tomato and mozzarella', price=9)
+        self.margherita.categories.add(self.pizza)
+        self.margherita.ingredients.add(self.basil)
+        self.soup = Dish.objects.create(name='Tomato soup', description='Slow cooked', price=6)
+        self.pesto = Dish.objects.create(name='Pesto pasta', description='With fresh basil', price=11)
+
+    def test_ranks_name_matches_first(self):
+        """A match in the name outranks one in the description"""
+        self.assertEqual(search_dishes('tomato'), [self.soup.id, self.margherita.id])
+
+    def test_prefix_and_related_names(self):
+        """Prefixes match, and ingredients and categories are searchable"""
+        self.assertEqual(search_dishes('marg'), [self.margherita.id])
+        self.assertEqual(set(search_dishes('basil')), {self.margherita.id, self.pesto.id})
+        self.assertEqual(search_dishes('pizza'), [self.margherita.id])
+
+    def test_index_follows_changes(self):
+        """Renames, unavailability and relation changes are reflected"""
+        self.pizza.name = 'Flatbread'
+        self.pizza.save()
+        self.assertEqual(search_dishes('pizza'), [])
+        self.assertEqual(search_dishes('flatbread'), [self.margherita.id])
+
+        self.margherita.ingredients.remove(self.basil)
+        self.assertEqual(search_dishes('basil'), [self.pesto.id])
+
+        self.pesto.toggle_availability()
+        self.assertEqual(search_dishes('basil'), [])
+
+        self.pizza.delete()
+        self.assertEqual(search_dishes('flatbread'), [])
+
+    def test_search_endpoint(self):
+        """The client search endpoint serves ranked dishes from the menu snapshot"""
+        table = Table.objects.create(table_num=1)
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {device_token(table)}'
+        response = self.client.get('/restau/client/dishes/search/', {'q': 'tom'})
+        self.assertEqual([dish['name'] for dish in response.json()], ['Tomato soup', 'Margherita'])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.chef = User.objects.create_user(username='chef1', password='testpass', role='chef')
+        table = Table.objects.create(table_num=1)
+        same_time = timezone.now()
+        self.orders = [Order.objects.create(table=table) for _ in range(7)]
+        # Ties on order_time must be broken by id
+        Order.objects.filter(pk__in=[order.pk for order in self.orders[2:5]]).update(order_time=same_time)
+        self.client = APIClient()
+        self.client.force_authenticate(self.chef)
+
+    def expected_order(self):
+        return list(Order.objects.order_by('-order_time', '-id').values_list('id', flat=True))
+
+    def test_walks_forward_and_back(self):
+        """Pages cover every order once, in a stable order, in both directions"""
+        seen = []
+        pages = []
+        url = '/restau/chef/orders/?page_size=3'
+        while url:
+            page = self.client.get(url).json()
+            pages.append(page)
+            seen += [order['id'] for order in page['results']]
+            url = page['next']
+        self.assertEqual(seen, self.expected_order())
+        self.assertIsNone(pages[0]['previous'])
+
+        back = self.client.get(pages[-1]['previous']).json()
+        self.assertEqual([order['id'] for order in back['results']], seen[3:6])
+
+    def test_page_query_is_a_seek(self):
+        """Later pages filter on the key instead of skipping rows"""
+        first = self.client.get('/restau/chef/orders/?page_size=2').json()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(first['next'])
+        self.assertNotIn('OFFSET', ctx.captured_queries[0]['sql'])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/restau/chef/orders/?cursor=bogus').status_code, 404)
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.media_root = media.name
+
+    def upload(self, name, size=(2000, 1000), mode='RGB'):
+        buffer = io.BytesIO()
+        Image.new(mode, size, (200, 80, 40, 255)[:len(mode)]).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def create(self, model, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            instance = model.objects.create(**fields)
+        instance.refresh_from_db()
+        return instance
+
+    def test_upload_builds_variants_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            dish = Dish.objects.create(name='Ramen', price=12, image=self.upload('ramen.png'))
+        self.assertEqual(dish.image_variants, {})
+        revision = MenuChange.head()
+        get_menu_snapshot()
+        for callback in callbacks:
+            callback()
+        self.assertEqual(MenuChange.changed_since(revision, MenuChange.head()), ({dish.pk}, set()))
+        dish.refresh_from_db()
+        variants = dish.image_variants
+        self.assertEqual(variants['source'], dish.image.name)
+        self.assertEqual((variants['thumb']['width'], variants['thumb']['height']), (160, 80))
+        self.assertEqual(variants['full']['width'], 1280)
+        for size in ('thumb', 'card', 'full'):
+            self.assertEqual(set(variants[size]), {'width', 'height', 'webp', 'jpeg'})
+            self.assertTrue(os.path.exists(os.path.join(self.media_root, variants[size]['webp'])))
+        self.assertIn('dish_images/variants/ramen-', variants['thumb']['webp'])
+
+        data = get_menu_snapshot().dishes_by_id[dish.pk]
+        self.assertTrue(data['image_variants']['card']['webp'].endswith('-card.webp'))
+
+    def test_transparent_images_fall_back_to_png(self):
+        category = self.create(Category, name='Drinks', image=self.upload('drinks.png', (300, 300), 'RGBA'))
+        self.assertIn('png', category.image_variants['card'])
+        self.assertEqual(category.image_variants['card']['width'], 300)
+
+    def test_unchanged_image_is_not_rebuilt(self):
+        dish = self.create(Dish, name='Ramen', price=12, image=self.upload('ramen.png'))
+        before = dish.image_variants
+        dish.price = 13
+        with mock.patch('restaurant.images.build_variants') as build, self.captureOnCommitCallbacks(execute=True):
+            dish.save()
+        build.assert_not_called()
+        self.assertEqual(dish.image_variants, before)
+
+        dish.image = None
+        with self.captureOnCommitCallbacks(execute=True):
+            dish.save()
+        dish.refresh_from_db()
+        self.assertEqual(dish.image_variants, {})
+
+    def test_build_command_logs_menu_changes(self):
+        dish = self.create(Dish, name='Ramen', price=12, image=self.upload('ramen.png'))
+        Dish.objects.filter(pk=dish.pk).update(image_variants={})
+        revision = MenuChange.head()
+        call_command('build_image_variants', stdout=io.StringIO())
+        self.assertEqual(MenuChange.changed_since(revision, MenuChange.head()), ({dish.pk}, set()))
+
+
+class OrderTransitionRaceTests(TransactionTestCase):
+    def setUp(self):
+        self.table = Table.objects.create(table_num=1)
+        self.order = Order.objects.create(table=self.table)
+        self.chefs = [
+            User.objects.create_user(username=f'chef{i}', password='testpass', role='chef') for i in range(6)
+        ]
+
+    def race(self, attempt):
+        """Run ``attempt(order, index)`` from one thread per chef, each with its own copy of the order"""
+        barrier = threading.Barrier(len(self.chefs))
+        results = [None] * len(self.chefs)
+
+        def run(index):
+            order = Order.objects.get(pk=self.order.pk)
+            barrier.wait()
+            try:
+                while results[index] is None:
+                    try:
+                        results[index] = attempt(order, index)
+                    except OperationalError:
+                        # The shared-cache test database reports lock contention
+                        # instead of waiting like a file database would
+                        time.sleep(0.01)
+            except ValidationError:
+                results[index] = False
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(self.chefs))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_only_one_chef_takes_the_order(self):
+        results = self.race(lambda order, i: order.mark_as_in_progress(self.chefs[i]))
+        self.assertEqual(results.count(True), 1)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.OrderStatus.IN_PROGRESS)
+        self.assertEqual(self.order.prepared_by, self.chefs[results.index(True)])
+
+    def test_cancel_cannot_overwrite_a_started_order(self):
+        def attempt(order, i):
+            if i == 0:
+                return order.cancel_order(self.table)
+            return order.mark_as_in_progress(self.chefs[i])
+
+        results = self.race(attempt)
+        self.assertEqual(results.count(True), 1)
+        self.order.refresh_from_db()
+        expected = Order.OrderStatus.CANCELLED if results[0] else Order.OrderStatus.IN_PROGRESS
+        self.assertEqual(self.order.status, expected)
+
+    def test_loser_sees_winning_status(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        self.assertTrue(self.order.mark_as_in_progress(self.chefs[0]))
+        self.assertFalse(stale.cancel_order(self.table))
+        self.assertEqual(stale.status, Order.OrderStatus.IN_PROGRESS)
+
+    def test_lost_transition_is_a_conflict(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        self.order.cancel_order(self.table)
+        client = APIClient()
+        client.force_authenticate(self.chefs[0])
+        with mock.patch.object(ChefOrderViewSet, 'get_object', return_value=stale):
+            response = client.post(f'/restau/chef/orders/{self.order.pk}/mark_as_in_progress/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['status'], Order.OrderStatus.CANCELLED)
+
+
+class ExpirySweepTests(TestCase):
+    def setUp(self):
+        self.table = Table.objects.create(table_num=1)
+        self.old = timezone.now() - datetime.timedelta(seconds=settings.AUTO_RESET_TIME + 60)
+
+    def make_orders(self, count, status, completed_time):
+        Order.objects.bulk_create(
+            Order(table=self.table, status=status, completed_time=completed_time) for _ in range(count)
+        )
+
+    def test_sweeps_old_orders_in_batches(self):
+        self.make_orders(7, Order.OrderStatus.SERVED, self.old)
+        self.make_orders(3, Order.OrderStatus.CANCELLED, self.old)
+        self.make_orders(2, Order.OrderStatus.SERVED, timezone.now())
+        self.make_orders(2, Order.OrderStatus.READY, None)
+
+        with CaptureQueriesContext(connection) as ctx:
+            result = sweep_expired_orders(batch_size=4, pause=0)
+        self.assertEqual((result.expired, result.batches), (10, 3))
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 3)
+        self.assertEqual(Order.objects.filter(expired=True).count(), 10)
+        self.assertEqual(sweep_expired_orders(pause=0).expired, 0)
+
+    def test_cancelled_orders_are_dated(self):
+        order = Order.objects.create(table=self.table)
+        order.cancel_order(self.table)
+        order.refresh_from_db()
+        self.assertIsNotNone(order.completed_time)
+        self.assertEqual(sweep_expired_orders(pause=0).expired, 0)
+
+    def test_command_reports_metrics(self):
+        self.make_orders(2, Order.OrderStatus.SERVED, self.old)
+        out = io.StringIO()
+        call_command('expire_orders', stdout=out)
+        self.assertIn('expired=2 batches=1', out.getvalue())
+
+
+class DishSalesTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin1', password='testpass', role='admin')
+        self.chef = User.objects.create_user(username='chef1', password='testpass', role='chef')
+        self.waiter = User.objects.create_user(username='waiter1', password='testpass', role='waiter')
+        self.table = Table.objects.create(table_num=1)
+        self.mains = Category.objects.create(name='Mains')
+        self.pasta = Dish.objects.create(name='Pasta', price=12)
+        self.pasta.categories.add(self.mains)
+        self.soup = Dish.objects.create(name='Soup', price=5)
+
+    def serve(self, items):
+        order = Order.place(self.table, items)
+        order.mark_as_in_progress(self.chef)
+        order.mark_as_ready(self.chef)
+        order.mark_as_served(self.waiter)
+        return order
+
+    def test_served_orders_roll_up(self):
+        self.serve([{'dish': self.pasta.id, 'quantity': 2}, {'dish': self.soup.id, 'quantity': 1}])
+        self.serve([{'dish': self.soup.id, 'quantity': 4}])
+        Order.place(self.table, [{'dish': self.pasta.id, 'quantity': 9}]).cancel_order(self.table)
+
+        sales = {row.dish_id: (row.quantity, row.revenue) for row in DishSales.objects.all()}
+        self.assertEqual(sales, {self.pasta.id: (2, 24), self.soup.id: (5, 25)})
+        call_command('reconcile_stats', stdout=io.StringIO())
+
+    def test_top_dishes_endpoint(self):
+        self.serve([{'dish': self.pasta.id, 'quantity': 2}, {'dish': self.soup.id, 'quantity': 3}])
+        client = APIClient()
+        client.force_authenticate(self.admin)
+
+        with self.assertNumQueries(2):
+            response = client.get('/restau/stats/top-dishes/', {'by': 'hour'})
+        dishes = response.json()['dishes']
+        self.assertEqual([dish['name'] for dish in dishes], ['Soup', 'Pasta'])
+        self.assertEqual(dishes[0]['hours'][0]['quantity'], 3)
+
+        response = client.get('/restau/stats/top-dishes/', {'category': self.mains.id})
+        self.assertEqual([dish['name'] for dish in response.json()['dishes']], ['Pasta'])
+        self.assertEqual(client.get('/restau/stats/top-dishes/', {'start': 'nope'}).status_code, 400)
+        for limit in ('0', '-3'):
+            self.assertEqual(client.get('/restau/stats/top-dishes/', {'limit': limit}).status_code, 400)
+
+
+@skipUnless(settings.DB_PROFILE == 'sqlite-tuned', "Checks the tuned SQLite profile")
+class DatabaseProfileTests(TestCase):
+    def test_connection_is_tuned(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+
+class AsyncClientEndpointTests(TestCase):
+    def setUp(self):
+        device_token_cache.clear()
+        self.category = Category.objects.create(name='Pizza')
+        self.dish = Dish.objects.create(name='Margherita', price=9)
+        self.dish.categories.add(self.category)
+        self.table = Table.objects.create(table_num=1)
+        self.order = Order.place(self.table, [{'dish': self.dish.id, 'quantity': 2}])
+        self.token = device_token(self.table)
+        self.headers = {'Authorization': f'Bearer {self.token}'}
+
+    def get(self, path, headers=None):
+        return self.async_client.get(path, headers=headers or self.headers)
+
+    async def test_menu_and_orders(self):
+        response = await self.get('/restau/client/categories/')
+        self.assertEqual([category['name'] for category in response.json()], ['Pizza'])
+        response = await self.get(f'/restau/client/dishes/{self.dish.id}/')
+        self.assertEqual(response.json()['name'], 'Margherita')
+        response = await self.get('/restau/client/dishes/0/')
+        self.assertEqual(response.status_code, 404)
+
+        response = await self.get('/restau/client/orders/')
+        self.assertEqual([order['id'] for order in response.json()['results']], [self.order.id])
+        response = await self.get(f'/restau/client/orders/{self.order.id}/')
+        self.assertEqual(response.json()['items'][0]['quantity'], 2)
+
+    async def test_auth_errors_match_drf(self):
+        self.assertEqual((await self.async_client.get('/restau/client/dishes/')).status_code, 403)
+        response = await self.get('/restau/client/dishes/', {'Authorization': 'Bearer nope'})
+        self.assertEqual((response.status_code, response.json()['detail']), (401, 'Invalid token'))
+        self.assertEqual((await self.async_client.post('/restau/client/dishes/', headers=self.headers)).status_code, 405)
+
+    def test_cached_token_needs_no_query(self):
+        """Auth and menu come from memory on the async path too"""
+        get = async_to_sync(self.get)
+        get('/restau/client/categories/')
+        with self.assertNumQueries(0):
+            response = get('/restau/client/categories/')
+        self.assertEqual(response.status_code, 200)
+
+    async def test_verify_device(self):
+        response = await self.async_client.post('/restau/verify-device/', {'table_num': 1},
+                                               content_type='application/json', headers=self.headers)
+        self.assertEqual(response.json()['status'], 'valid')
+
+    def test_orders_are_still_placed_through_drf(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        response = client.post('/restau/client/orders/', {'items': [{'dish': self.dish.id}]}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        device_token_cache.clear()
+        self.admin = User.objects.create_user(username='admin1', password='testpass', role='admin')
+        self.chef = User.objects.create_user(username='chef1', password='testpass', role='chef')
+        self.dish = Dish.objects.create(name='Margherita', price=9)
+        self.table = Table.objects.create(table_num=1)
+        Order.place(self.table, [{'dish': self.dish.id, 'quantity': 2}])
+        self.token = device_token(self.table)
+
+    def scrape(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get('/restau/metrics/')
+
+    def test_records_sync_and_async_endpoints(self):
+        client = APIClient()
+        client.force_authenticate(self.chef)
+        response = client.get('/restau/chef/orders/')
+        queries = int(response['X-DB-Queries'])
+        self.assertGreater(queries, 0)
+
+        # Queries made on the sync thread of an async view are counted too
+        response = async_to_sync(self.async_client.get)(
+            '/restau/client/orders/', headers={'Authorization': f'Bearer {self.token}'})
+        self.assertGreater(int(response['X-DB-Queries']), 0)
+        async_to_sync(self.async_client.get)('/restau/client/orders/')
+
+        response = self.scrape(self.admin)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('restaurant_http_requests_total{view="chef-orders-list",method="GET",status="2xx"} 1', text)
+        self.assertIn('restaurant_http_requests_total{view="client-orders",method="GET",status="2xx"} 1', text)
+        self.assertIn('restaurant_http_requests_total{view="client-orders",method="GET",status="4xx"} 1', text)
+        self.assertIn('restaurant_http_request_duration_seconds_count{view="client-orders",method="GET"} 2', text)
+        self.assertIn(f'restaurant_http_db_queries_sum{{view="chef-orders-list",method="GET"}} {queries}', text)
+
+    def test_admin_only(self):
+        self.assertEqual(self.scrape(self.chef).status_code, 403)
+
+
+class BatchTransitionTests(TestCase):
+    def setUp(self):
+        self.chef = User.objects.create_user(username='chef1', password='testpass', role='chef')
+        self.waiter = User.objects.create_user(username='waiter1', password='testpass', role='waiter')
+        self.table = Table.objects.create(table_num=1)
+        self.dish = Dish.objects.create(name='Pasta', price=12)
+        self.orders = [Order.place(self.table, [{'dish': self.dish.id, 'quantity': 1}]) for _ in range(15)]
+        self.ids = [order.id for order in self.orders]
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_chef_bumps_tickets_in_one_request(self):
+        chef = self.client_for(self.chef)
+        Order.objects.filter(pk=self.ids[0]).update(status=Order.OrderStatus.READY)
+        response = chef.post('/restau/chef/orders/batch/',
+                             {'ids': self.ids + [0], 'status': 'in_progress'}, format='json')
+
+        results = response.json()['results']
+        self.assertEqual(results[0], {'id': self.ids[0], 'result': 'not_allowed', 'status': 'ready'})
+        self.assertEqual({result['result'] for result in results[1:-1]}, {'updated'})
+        self.assertEqual(results[-1], {'id': 0, 'result': 'not_found', 'status': None})
+        self.assertEqual(
+            Order.objects.filter(status=Order.OrderStatus.IN_PROGRESS, prepared_by=self.chef).count(), 14)
+
+    def test_waiter_serves_a_table(self):
+        for order in self.orders[:3]:
+            order.mark_as_in_progress(self.chef)
+            order.mark_as_ready(self.chef)
+        response = self.client_for(self.waiter).post(
+            '/restau/waiter/orders/batch/', {'ids': self.ids[:4], 'status': 'served'}, format='json')
+
+        self.assertEqual([result['result'] for result in response.json()['results']],
+                         ['updated', 'updated', 'updated', 'not_allowed'])
+        served = Order.objects.filter(status=Order.OrderStatus.SERVED)
+        self.assertEqual(served.filter(served_by=self.waiter, completed_time__isnull=False).count(), 3)
+        self.assertEqual(Stats.objects.get(date=timezone.localdate()).total_orders, 3)
+
+    def test_batch_side_effects_are_set_based(self):
+        dishes = [self.dish] + [Dish.objects.create(name=f'Dish {i}', price=5) for i in range(2)]
+        orders = [Order.place(self.table, [{'dish': dish.id, 'quantity': 2} for dish in dishes]) for _ in range(15)]
+        ids = [order.id for order in orders]
+        Order.transition_many(ids, Order.OrderStatus.IN_PROGRESS, self.chef)
+        Order.transition_many(ids, Order.OrderStatus.READY, self.chef)
+
+        # Savepoint, rows, UPDATE, events; hourly and daily stats (7);
+        # dish sales (3); release: the same for 1 order or 45 items
+        with self.assertNumQueries(15):
+            outcomes = Order.transition_many(ids, Order.OrderStatus.SERVED, self.waiter)
+        self.assertTrue(all(moved for _, moved in outcomes.values()))
+
+        self.assertEqual(OrderEvent.objects.filter(order_id__in=ids, status='served').count(), 15)
+        stats = Stats.objects.get(date=timezone.localdate())
+        self.assertEqual((stats.total_orders, stats.items_sold, stats.total_revenue), (15, 90, 15 * (24 + 20)))
+        self.assertEqual(HourlyStats.objects.get().total_orders, 15)
+        self.assertEqual(
+            sorted(DishSales.objects.values_list('dish_id', 'quantity', 'revenue')),
+            [(self.dish.id, 30, 360), (dishes[1].id, 30, 150), (dishes[2].id, 30, 150)],
+        )
+        # Same rollups as recomputing the day from the orders
+        self.assertEqual(Stats.compute_for_date(timezone.localdate())['total_orders'], 15)
+
+    def test_rows_moved_by_another_writer_are_not_reported(self):
+        """Only the rows the batch UPDATE wrote count as moved, logged and counted"""
+        raced = self.orders[0]
+        check = Order.get_allowed_next_statuses
+
+        def check_then_race(order, user):
+            allowed = check(order, user)
+            if order.pk == raced.pk:
+                # Another writer cancels the order between the read and the UPDATE
+                Order.objects.filter(pk=raced.pk).update(status=Order.OrderStatus.CANCELLED)
+            return allowed
+
+        with mock.patch.object(Order, 'get_allowed_next_statuses', check_then_race):
+            outcomes = Order.transition_many(self.ids[:3], Order.OrderStatus.IN_PROGRESS, self.chef)
+
+        self.assertEqual({pk: moved for pk, (_, moved) in outcomes.items()},
+                         {self.ids[0]: False, self.ids[1]: True, self.ids[2]: True})
+        self.assertEqual(outcomes[raced.pk][0].status, Order.OrderStatus.CANCELLED)
+        self.assertFalse(OrderEvent.objects.filter(order=raced, kind=OrderEvent.Kind.STATUS).exists())
+        self.assertEqual(OrderEvent.objects.filter(order_id__in=self.ids[1:3], status='in_progress').count(), 2)
+
+    def test_rejects_bad_requests(self):
+        chef = self.client_for(self.chef)
+        for payload in ({'ids': self.ids, 'status': 'served'}, {'ids': 'abc', 'status': 'ready'},
+                        {'ids': [], 'status': 'ready'}, {'ids': list(range(101)), 'status': 'ready'}):
+            self.assertEqual(chef.post('/restau/chef/orders/batch/', payload, format='json').status_code, 400)
+        response = self.client_for(self.waiter).post(
+            '/restau/chef/orders/batch/', {'ids': self.ids, 'status': 'ready'}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class OrderStatusPollingTests(TestCase):
+    def setUp(self):
+        device_token_cache.clear()
+        self.chef = User.objects.create_user(username='chef1', password='testpass', role='chef')
+        self.dish = Dish.objects.create(name='Pasta', price=12)
+        self.table = Table.objects.create(table_num=1)
+        self.order = Order.place(self.table, [{'dish': self.dish.id, 'quantity': 1}])
+        self.headers = {'Authorization': f'Bearer {device_token(self.table)}'}
+
+    def poll(self, etag=None):
+        headers = dict(self.headers, **({'If-None-Match': etag} if etag else {}))
+        return async_to_sync(self.async_client.get)('/restau/client/orders/status/', headers=headers)
+
+    def test_unchanged_orders_answer_304_without_reading_them(self):
+        response = self.poll()
+        self.assertEqual(response.json()['orders'], [{'id': self.order.id, 'status': 'pending'}])
+        etag = response['ETag']
+
+        # The table's newest event id
+        with self.assertNumQueries(1):
+            response = self.poll(etag)
+        self.assertEqual((response.status_code, response['ETag']), (304, etag))
+
+        self.order.mark_as_in_progress(self.chef)
+        response = self.poll(etag)
+        self.assertEqual(response.json()['orders'][0], {'id': self.order.id, 'status': 'in_progress'})
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_expiry_changes_the_version(self):
+        self.order.cancel_order(self.table)
+        etag = self.poll()['ETag']
+        sweep_expired_orders(before=timezone.now() + datetime.timedelta(seconds=1))
+        response = self.poll(etag)
+        self.assertEqual((response.status_code, response.json()['orders']), (200, []))
+
+    def test_version_follows_changes_made_by_other_processes(self):
+        """No cache in this process is told about the change, as when another worker makes it"""
+        etag = self.poll()['ETag']
+        Order.objects.filter(pk=self.order.pk).update(status=Order.OrderStatus.CANCELLED)
+        OrderEvent.record_changes([(Order.objects.get(pk=self.order.pk), Order.OrderStatus.PENDING)])
+        response = self.poll(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['orders'][0]['status'], 'cancelled')
+
+
+class OrderEventFeedTests(TestCase):
+    def setUp(self):
+        device_token_cache.clear()
+        self.chef = User.objects.create_user(username='chef1', password='testpass', role='chef')
+        self.waiter = User.objects.create_user(username='waiter1', password='testpass', role='waiter')
+        self.dish = Dish.objects.create(name='Pasta', price=12)
+        self.table = Table.objects.create(table_num=1)
+        self.other = Table.objects.create(table_num=2)
+        self.headers = {'Authorization': f'Bearer {device_token(self.table)}'}
+        self.staff = APIClient()
+        self.staff.force_authenticate(self.waiter)
+
+    def place(self, table):
+        return Order.place(table, [{'dish': self.dish.id, 'quantity': 1}])
+
+    def test_staff_feed_replays_every_change(self):
+        head = self.staff.get('/restau/waiter/orders/events/').json()['next']
+        order = self.place(self.table)
+        order.mark_as_in_progress(self.chef)
+        order.mark_as_ready(self.chef)
+        order.mark_as_served(self.waiter)
+        sweep_expired_orders(before=timezone.now() + datetime.timedelta(seconds=1))
+
+        feed = self.staff.get('/restau/waiter/orders/events/', {'since': head}).json()
+        self.assertEqual(
+            [(event['kind'], event['old_status'], event['status']) for event in feed['events']],
+            [('created', '', 'pending'), ('status', 'pending', 'in_progress'), ('status', 'in_progress', 'ready'),
+             ('status', 'ready', 'served'), ('expired', 'served', 'served')],
+        )
+        self.assertEqual(feed['next'], feed['events'][-1]['seq'])
+        self.assertEqual(self.staff.get('/restau/waiter/orders/events/', {'since': feed['next']}).json()['events'], [])
+
+    def test_expire_old_orders_is_logged(self):
+        order = self.place(self.table)
+        order.cancel_order(self.table)
+        Order.objects.filter(pk=order.pk).update(completed_time=timezone.now() - datetime.timedelta(hours=25))
+        head = OrderEvent.table_head(self.table.pk)
+
+        self.assertEqual(Order.expire_old_orders(), 1)
+        event = OrderEvent.objects.get(pk=OrderEvent.table_head(self.table.pk))
+        self.assertGreater(event.pk, head)
+        self.assertEqual((event.order_id, event.kind), (order.id, OrderEvent.Kind.EXPIRED))
+
+    def test_tablet_only_sees_its_table(self):
+        mine = self.place(self.table)
+        self.place(self.other)
+        response = async_to_sync(self.async_client.get)(
+            '/restau/client/orders/events/', {'since': 0}, headers=self.headers)
+        feed = response.json()
+        self.assertEqual([event['order'] for event in feed['events']], [mine.id])
+        self.assertEqual(feed['next'], OrderEvent.head())
+
+    def test_compaction_forces_a_resync(self):
+        self.place(self.table)
+        head = OrderEvent.head()
+        for _ in range(3):
+            self.place(self.table)
+        # Everything but the newest event is old enough to go
+        self.assertEqual(OrderEvent.compact(timezone.now() + datetime.timedelta(seconds=1)), 3)
+        self.assertEqual(OrderEvent.objects.count(), 1)
+
+        response = self.staff.get('/restau/waiter/orders/events/', {'since': head})
+        self.assertEqual((response.status_code, response.json()['next']), (410, OrderEvent.head()))
+        self.assertEqual(self.staff.get('/restau/waiter/orders/events/', {'since': 'x'}).status_code, 400)
+
+
+class OrderEventOrderingTests(TransactionTestCase):
+    def test_events_commit_in_id_order(self):
+        order = Order.objects.create(table=Table.objects.create(table_num=1))
+        appended, release = threading.Event(), threading.Event()
+        first, second = {}, {}
+
+        def slow_writer():
+            try:
+                with transaction.atomic():
+                    first['seq'] = OrderEvent.record_changes([(order, None)])[0].pk
+                    appended.set()
+                    release.wait(5)
+            finally:
+                connection.close()
+
+        def writer():
+            appended.wait(5)
+            try:
+                while True:
+                    try:
+                        second['seq'] = OrderEvent.record_changes([(order, 'pending')])[0].pk
+                        break
+                    except OperationalError:
+                        # The shared-cache test database reports lock contention
+                        time.sleep(0.01)
+                # Anyone who can read the later id must see the earlier one
+                second['sees_first'] = OrderEvent.objects.filter(pk=first['seq']).exists()
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=slow_writer), threading.Thread(target=writer)]
+        for thread in threads:
+            thread.start()
+        appended.wait(5)
+        time.sleep(0.2)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertGreater(second['seq'], first['seq'])
+        self.assertTrue(second['sees_first'])
+
+    @mock.patch('restaurant.models.connection')
+    def test_postgres_appends_take_the_log_lock(self, db):
+        db.vendor = 'postgresql'
+        OrderEvent.lock_appends()
+        db.cursor.return_value.__enter__.return_value.execute.assert_called_once_with(
+            'SELECT pg_advisory_xact_lock(%s)', [OrderEvent.append_lock_key])
+
+
+class ReadyBoardTests(TestCase):
+    def setUp(self):
+        self.chef = User.objects.create_user(username='chef1', password='testpass', role='chef')
+        self.waiter = User.objects.create_user(username='waiter1', password='testpass', role='waiter')
+        self.dish = Dish.objects.create(name='Pasta', price=12)
+        self.tables = [Table.objects.create(table_num=num) for num in (1, 2)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.waiter)
+
+    def ready(self, table):
+        order = Order.place(table, [{'dish': self.dish.id, 'quantity': 1}])
+        order.mark_as_in_progress(self.chef)
+        order.mark_as_ready(self.chef)
+        return order
+
+    def test_groups_ready_orders_by_longest_waiting_table(self):
+        first = self.ready(self.tables[1])
+        second = self.ready(self.tables[0])
+        third = self.ready(self.tables[1])
+        Order.place(self.tables[0], [{'dish': self.dish.id, 'quantity': 1}])
+
+        # head, orders, items with dishes
+        with self.assertNumQueries(3):
+            board = self.client.get('/restau/waiter/orders/ready-board/').json()
+        self.assertEqual(
+            [(table['table_number'], [order['id'] for order in table['orders']]) for table in board['tables']],
+            [(2, [first.id, third.id]), (1, [second.id])],
+        )
+        self.assertIsNotNone(board['tables'][0]['orders'][0]['ready_time'])
+
+    def test_since_only_returns_new_entries(self):
+        self.ready(self.tables[0])
+        cursor = self.client.get('/restau/waiter/orders/ready-board/').json()['next']
+        newer = self.ready(self.tables[1])
+
+        board = self.client.get('/restau/waiter/orders/ready-board/', {'since': cursor}).json()
+        self.assertEqual([[order['id'] for order in table['orders']] for table in board['tables']], [[newer.id]])
+        self.assertGreater(board['next'], cursor)
+
+    def test_status_is_not_writable_past_the_event_log(self):
+        order = Order.place(self.tables[0], [{'dish': self.dish.id, 'quantity': 1}])
+        order.mark_as_in_progress(self.chef)
+        cursor = self.client.get('/restau/waiter/orders/ready-board/').json()['next']
+        chef = APIClient()
+        chef.force_authenticate(self.chef)
+        chef.patch(f'/restau/chef/orders/{order.id}/', {'status': 'ready'}, format='json')
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.OrderStatus.IN_PROGRESS)
+
+        chef.post(f'/restau/chef/orders/{order.id}/mark_as_ready/')
+        board = self.client.get('/restau/waiter/orders/ready-board/', {'since': cursor}).json()
+        self.assertEqual([[entry['id'] for entry in table['orders']] for table in board['tables']], [[order.id]])
+
+
+class MenuDeltaSyncTests(TestCase):
+    def setUp(self):
+        device_token_cache.clear()
+        self.pizza = Category.objects.create(name='Pizza')
+        self.dishes = [Dish.objects.create(name=f'Pizza {i}', price=9) for i in range(30)]
+        self.pizza.dishes.set(self.dishes)
+        self.table = Table.objects.create(table_num=1)
+        self.headers = {'Authorization': f'Bearer {device_token(self.table)}'}
+
+    def changes(self, since=None):
+        params = {} if since is None else {'since_revision': since}
+        return async_to_sync(self.async_client.get)('/restau/client/menu/changes/', params, headers=self.headers)
+
+    def test_sold_out_dishes_are_sent_as_ids(self):
+        menu = self.changes().json()
+        self.assertTrue(menu['full'])
+        self.assertEqual(len(menu['dishes']), 30)
+
+        for dish in self.dishes[:20]:
+            dish.toggle_availability()
+        response = self.changes(menu['revision'])
+        delta = response.json()
+        self.assertEqual((delta['full'], delta['dishes'], delta['categories']), (False, [], []))
+        self.assertEqual(delta['removed']['dishes'], [dish.id for dish in self.dishes[:20]])
+        self.assertLess(len(response.content), 300)
+
+        # Up to date: answered from the snapshot, without a query
+        self.changes(delta['revision'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.changes(delta['revision']).json()['removed']['dishes'], [])
+
+    def test_edits_and_removals(self):
+        revision = self.changes().json()['revision']
+        self.dishes[0].price = 11
+        self.dishes[0].save()
+        self.pizza.name = 'Pizzas'
+        self.pizza.save()
+        drinks = Category.objects.create(name='Drinks')
+        removed = {'categories': [drinks.id], 'dishes': [self.dishes[1].id]}
+        self.dishes[1].delete()
+        drinks.delete()
+
+        delta = self.changes(revision).json()
+        self.assertEqual([category['name'] for category in delta['categories']], ['Pizzas'])
+        # Every dish of the renamed category is resent, minus the deleted one
+        self.assertEqual(len(delta['dishes']), 29)
+        self.assertEqual(delta['dishes'][0]['price'], '11.00')
+        self.assertEqual(delta['removed'], removed)
+
+    def test_compacted_revision_gets_full_menu(self):
+        revision = self.changes().json()['revision']
+        self.dishes[0].toggle_availability()
+        self.dishes[1].toggle_availability()
+        self.assertEqual(compact_menu_changes(timezone.now() + datetime.timedelta(seconds=1)), revision + 1)
+
+        menu = self.changes(revision).json()
+        self.assertTrue(menu['full'])
+        self.assertEqual(len(menu['dishes']), 28)
+        self.assertEqual(menu['revision'], MenuChange.head())
+        # Still continuous from the kept head
+        self.assertFalse(self.changes(menu['revision']).json()['full'])
+
+
+class IngredientStockTests(TestCase):
+    def setUp(self):
+        self.table = Table.objects.create(table_num=1)
+        self.mozzarella = Ingredient.objects.create(name='Mozzarella', stock=5)
+        self.basil = Ingredient.objects.create(name='Basil')
+        self.margherita = Dish.objects.create(name='Margherita', price=9)
+        self.margherita.ingredients.set([self.mozzarella, self.basil])
+        self.calzone = Dish.objects.create(name='Calzone', price=11)
+        self.calzone.ingredients.set([self.mozzarella])
+        self.salad = Dish.objects.create(name='Salad', price=7)
+        self.salad.ingredients.set([self.basil])
+
+    def test_orders_decrement_stock_and_sell_out_dishes(self):
+        Order.place(self.table, [{'dish': self.margherita.id, 'quantity': 2}, {'dish': self.calzone.id}])
+        self.mozzarella.refresh_from_db()
+        self.assertEqual(self.mozzarella.stock, 2)
+
+        with self.assertRaisesMessage(ValidationError, "Not enough Mozzarella left"):
+            Order.place(self.table, [{'dish': self.calzone.id, 'quantity': 3}])
+        self.mozzarella.refresh_from_db()
+        self.assertEqual(self.mozzarella.stock, 2)
+
+        snapshot = get_menu_snapshot()
+        Order.place(self.table, [{'dish': self.calzone.id, 'quantity': 2}])
+        self.assertEqual(
+            set(Dish.objects.filter(is_available=False).values_list('name', flat=True)), {'Margherita', 'Calzone'})
+        # The menu was invalidated and the sold out dishes logged for delta sync
+        self.assertEqual([dish['name'] for dish in get_menu_snapshot().get_available_dishes()], ['Salad'])
+        self.assertGreater(get_menu_snapshot().revision, snapshot.revision)
+
+    def test_untracked_ingredients_never_run_out(self):
+        for _ in range(3):
+            Order.place(self.table, [{'dish': self.salad.id, 'quantity': 10}])
+        self.basil.refresh_from_db()
+        self.assertIsNone(self.basil.stock)
+        self.assertTrue(Dish.objects.get(pk=self.salad.id).is_available)
+
+    def test_stock_set_to_zero_by_hand(self):
+        self.mozzarella.stock = 0
+        self.mozzarella.save()
+        self.assertEqual(list(Dish.objects.filter(is_available=True).values_list('name', flat=True)), ['Salad'])
+
+
+class IngredientStockRaceTests(TransactionTestCase):
+    def test_concurrent_orders_do_not_lose_decrements(self):
+        table = Table.objects.create(table_num=1)
+        cheese = Ingredient.objects.create(name='Cheese', stock=10)
+        dish = Dish.objects.create(name='Toastie', price=5)
+        dish.ingredients.add(cheese)
+        barrier = threading.Barrier(15)
+        placed = []
+
+        def order():
+            barrier.wait()
+            try:
+                while True:
+                    try:
+                        Order.place(table, [{'dish': dish.id}])
+                        placed.append(True)
+                        return
+                    except OperationalError:
+                        # The shared-cache test database reports lock contention
+                        time.sleep(0.01)
+            except ValidationError:
+                pass
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=order) for _ in range(15)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        cheese.refresh_from_db()
+        self.assertEqual((len(placed), cheese.stock), (10, 0))
+        self.assertEqual(Order.objects.count(), 10)
+        self.assertFalse(Dish.objects.get(pk=dish.id).is_available)
+
+
+# Fast hashing: the command logs staff users in and registers one
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoadTestCommandTests(TransactionTestCase):
+    def run_loadtest(self, fail_path=None):
+        """Run the command against the test client; requests are served one at a time"""
+        client, lock, dumps = self.client, threading.Lock(), json.dumps
+
+        def request(session, method, url, params=None, json=None, timeout=None):
+            path = url.removeprefix('http://loadtest')
+            if path == fail_path:
+                raise requests.ConnectionError(path)
+            headers = {key: value for key, value in session.headers.items() if key == 'Authorization'}
+            with lock:
+                if method == 'GET':
+                    return client.get(path, params or {}, headers=headers)
+                return client.generic(method, path, dumps(json or {}), content_type='application/json', headers=headers)
+
+        report = tempfile.NamedTemporaryFile(suffix='.json')
+        self.addCleanup(report.close)
+        with mock.patch.object(requests.Session, 'request', request):
+            call_command('loadtest', '--url', 'http://loadtest', '--seed', '--tablets', '3', '--chefs', '0',
+                         '--waiters', '0', '--dishes', '6', '--iterations', '4', '--think-time', '0',
+                         '--random-seed', '7', '--json', report.name, stdout=io.StringIO())
+        with open(report.name) as f:
+            return {row['endpoint']: row for row in json.load(f)['endpoints']}
+
+    def test_fixed_seed_is_reproducible_and_failures_are_counted(self):
+        first = self.run_loadtest(fail_path='/restau/client/dishes/search/')
+        self.assertEqual(first['POST client/orders/']['requests'], 12)
+        self.assertEqual(first['POST client/orders/']['errors'], 0)
+        # Every search failed and was counted, and the tablets carried on
+        self.assertEqual((first['GET client/dishes/search/']['requests'],
+                          first['GET client/dishes/search/']['errors']), (12, 12))
+        self.assertEqual(first['GET client/orders/<pk>/']['requests'], 36)
+
+        second = self.run_loadtest(fail_path='/restau/client/dishes/search/')
+        tablet_counts = lambda report: {
+            endpoint: (row['requests'], row['errors']) for endpoint, row in report.items() if 'client/' in endpoint}
+        self.assertEqual(tablet_counts(second), tablet_counts(first))
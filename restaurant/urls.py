@@ -1,9 +1,13 @@
 from rest_framework.routers import DefaultRouter
 from django.urls import path, include
-from restaurant.views import (ChefOrderViewSet, WaiterOrderViewSet, ClientCategoryViewSet, ClientDishViewSet, 
-                            ClientOrderView, verify_device, LinkDeviceToTableView, 
-                            AvailableTablesView, ClientOrderDetailView, 
-                            ClientExpireOrdersView, ResetTableView, ClientOrderCancelView)
+from restaurant.views import (ChefOrderViewSet, WaiterOrderViewSet,
+                            verify_device, LinkDeviceToTableView, AvailableTablesView,
+                            ClientExpireOrdersView, ResetTableView, ClientOrderCancelView,
+                            kitchen_stream, FloorMapView, TopDishesView, MetricsView,
+                            client_menu_changes,
+                            client_categories, client_category_detail, client_category_dishes,
+                            client_dishes, client_dish_detail, client_dish_search,
+                            client_orders, client_order_status, client_order_events, client_order_detail)
 
 router = DefaultRouter()
 #router.register(r'admin/categories', CategoryViewSet)
@@ -13,15 +17,27 @@ router = DefaultRouter()
 router.register(r'chef/orders', ChefOrderViewSet, basename="chef-orders")
 router.register(r'waiter/orders', WaiterOrderViewSet, basename="waiter-orders")
 
-router.register(r'client/categories', ClientCategoryViewSet, basename="client-categories")
-router.register(r'client/dishes', ClientDishViewSet, basename="client-dishes")
-
 
 urlpatterns = [
+    # Before the router so "stream" is not taken for an order pk
+    path('chef/orders/stream/', kitchen_stream, name='kitchen-stream'),
     path('', include(router.urls)),
     path('tables/', AvailableTablesView.as_view(), name='available-tables'),
-    path('client/orders/', ClientOrderView.as_view(), name='client-orders'),
-    path('client/orders/<int:pk>/', ClientOrderDetailView.as_view(), name='client-order-detail'),
+    path('floor-map/', FloorMapView.as_view(), name='floor-map'),
+    path('stats/top-dishes/', TopDishesView.as_view(), name='top-dishes'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    # Tablet read paths are async views (see backend_restau/asgi.py)
+    path('client/menu/changes/', client_menu_changes, name='client-menu-changes'),
+    path('client/categories/', client_categories, name='client-categories-list'),
+    path('client/categories/<int:pk>/', client_category_detail, name='client-categories-detail'),
+    path('client/categories/<int:pk>/dishes/', client_category_dishes, name='client-categories-dishes'),
+    path('client/dishes/', client_dishes, name='client-dishes-list'),
+    path('client/dishes/search/', client_dish_search, name='client-dishes-search'),
+    path('client/dishes/<int:pk>/', client_dish_detail, name='client-dishes-detail'),
+    path('client/orders/', client_orders, name='client-orders'),
+    path('client/orders/status/', client_order_status, name='client-order-status'),
+    path('client/orders/events/', client_order_events, name='client-order-events'),
+    path('client/orders/<int:pk>/', client_order_detail, name='client-order-detail'),
     path('client/orders/expire/', ClientExpireOrdersView.as_view(), name='expire-orders'),
     path('client/orders/<int:pk>/cancel/', ClientOrderCancelView.as_view(), name='client-order-cancel'),
     path('client/resetTable/', ResetTableView.as_view(), name='reset-table-device'),
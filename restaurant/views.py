@@ -3,13 +3,64 @@ from restaurant.models import *
 from restaurant.serializers import *
 from users.permissions import *
 from django.core.exceptions import ValidationError
-from rest_framework.decorators import action, api_view, permission_classes, authentication_classes
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny
-from django.db import transaction
-from restaurant.auth import DeviceJWTAuthentication
+from restaurant.auth import DeviceJWTAuthentication, aresolve_device_token, bearer_token
+from restaurant.menu import aget_menu_snapshot
+from restaurant.metrics import metrics
+from restaurant.expiry import expire_orders
+from restaurant.search import search_dishes
+from restaurant.pagination import OrderKeysetPagination, StatsKeysetPagination
+from rest_framework.exceptions import AuthenticationFailed, NotFound
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+import json
+from functools import wraps
+from django.views.decorators.csrf import csrf_exempt
+import datetime
+from decimal import Decimal, InvalidOperation
+from django.utils import timezone
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils.http import parse_etags
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed as JWTAuthenticationFailed
+from restaurant.kitchen import kitchen_event_stream
+
+
+def parse_price(value):
+    if not value:
+        return None
+    price = Decimal(value)
+    if not price.is_finite():
+        # NaN compares false with every price and would empty the filter
+        raise InvalidOperation(value)
+    return price
+
+
+def transition_conflict(order):
+    """409 for a status change that another request made first"""
+    return Response({'error': f"Order is already {order.status}", 'status': order.status}, status=409)
+
+
+def with_absolute_images(request, items):
+    """Copy snapshot entries with image URLs made absolute for this request"""
+    def absolute(entry):
+        if entry.get('image'):
+            entry = {**entry, 'image': request.build_absolute_uri(entry['image'])}
+        if entry.get('image_variants'):
+            entry = {**entry, 'image_variants': {
+                size: {key: value if key in ('width', 'height') else request.build_absolute_uri(value)
+                       for key, value in variant.items()}
+                for size, variant in entry['image_variants'].items()
+            }}
+        if entry.get('categories'):
+            entry = {**entry, 'categories': [absolute(category) for category in entry['categories']]}
+        return entry
+    return [absolute(entry) for entry in items]
 
 
 #Admin's views 
@@ -24,7 +75,7 @@ class DishAdminViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAdmin]
 
 class TableAdminViewSet(viewsets.ModelViewSet):
-    queryset = Table.objects.all()
+    queryset = Table.objects.with_activity()
     serializer_class = TableSerializer
     permission_classes = [IsAdmin]
 
@@ -32,103 +83,232 @@ class StatsViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Stats.objects.all()
     serializer_class = StatsSerializer
     permission_classes = [IsAdmin]
+    pagination_class = StatsKeysetPagination
+
+
+class TopDishesView(APIView):
+    """Best-selling dishes over a date range, read from the DishSales rollup.
+
+    Query params: ``start`` / ``end`` (YYYY-MM-DD, default today),
+    ``category`` (id), ``limit`` (default 10, at most 100) and ``by=hour``
+    for an hour-of-day breakdown of every dish.
+    """
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        params = request.query_params
+        try:
+            start = datetime.date.fromisoformat(params['start']) if params.get('start') else timezone.localdate()
+            end = datetime.date.fromisoformat(params['end']) if params.get('end') else start
+            category = int(params['category']) if params.get('category') else None
+            limit = min(int(params.get('limit', 10)), 100)
+        except ValueError:
+            return Response({'error': 'Invalid start, end, category or limit'}, status=400)
+        if start > end:
+            return Response({'error': 'start must not be after end'}, status=400)
+        if limit < 1:
+            return Response({'error': 'limit must be at least 1'}, status=400)
+
+        dishes = DishSales.top_sellers(start, end, category=category, limit=limit, by_hour=params.get('by') == 'hour')
+        return Response({'start': start, 'end': end, 'dishes': dishes})
     
     
+class MetricsView(APIView):
+    """Per-endpoint request metrics of this worker process, for Prometheus to scrape"""
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class OrderDetailsMixin:
+    """Order views load related rows up front and list with OrderListSerializer, newest first"""
+    list_serializer_class = OrderListSerializer
+    pagination_class = OrderKeysetPagination
+
+    def get_queryset(self):
+        return super().get_queryset().with_details()
+
+    def get_serializer_class(self):
+        if self.request.method == 'GET' and getattr(self, 'action', 'list') == 'list' and 'pk' not in self.kwargs:
+            return self.list_serializer_class
+        return super().get_serializer_class()
+
+
+class BatchTransitionMixin:
+    """``POST <orders>/batch/`` with ``{"ids": [...], "status": ...}`` moves many orders at once.
+
+    ``batch_statuses`` lists the targets this screen may request; each order
+    is still checked against ``Order.get_allowed_next_statuses``. Answers
+    with one ``{id, result, status}`` entry per id, ``result`` being
+    ``updated``, ``not_allowed`` or ``not_found``.
+    """
+    batch_statuses = []
+    max_batch_size = 100
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        ids, new_status = request.data.get('ids'), request.data.get('status')
+        if new_status not in self.batch_statuses:
+            return Response({'error': f"status must be one of {', '.join(self.batch_statuses)}"}, status=400)
+        try:
+            if not isinstance(ids, list) or not 0 < len(ids) <= self.max_batch_size:
+                raise ValueError
+            ids = list(dict.fromkeys(int(pk) for pk in ids))
+        except (TypeError, ValueError):
+            return Response({'error': f'ids must be a list of 1 to {self.max_batch_size} order ids'}, status=400)
+
+        outcomes = Order.transition_many(ids, new_status, request.user)
+        results = []
+        for pk in ids:
+            if pk not in outcomes:
+                results.append({'id': pk, 'result': 'not_found', 'status': None})
+            else:
+                order, moved = outcomes[pk]
+                results.append({'id': pk, 'result': 'updated' if moved else 'not_allowed', 'status': order.status})
+        return Response({'results': results})
+
+
+def order_event_feed(since, table_id=None):
+    """``(payload, status)`` of ``OrderEvent.feed`` for a raw ``?since=`` value"""
+    try:
+        since = int(since) if since not in (None, '') else None
+    except ValueError:
+        return {'error': 'since must be an event sequence number'}, 400
+    feed = OrderEvent.feed(since, table_id=table_id)
+    if feed is None:
+        return {'error': 'Events after this cursor were compacted; reload the orders', 'next': OrderEvent.head()}, 410
+    return feed, 200
+
+
+class OrderEventFeedMixin:
+    """``GET <orders>/events/?since=<seq>``: every order change after ``since``"""
+
+    @action(detail=False, methods=['get'])
+    def events(self, request):
+        payload, status_code = order_event_feed(request.query_params.get('since'))
+        return Response(payload, status=status_code)
+
+
 #chef's views or actions
-class ChefOrderViewSet(viewsets.ModelViewSet):
+class ChefOrderViewSet(OrderEventFeedMixin, BatchTransitionMixin, OrderDetailsMixin, viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [IsChef] 
+    batch_statuses = [Order.OrderStatus.IN_PROGRESS, Order.OrderStatus.READY, Order.OrderStatus.CANCELLED]
 
     @action(detail=True, methods=['post'])
     def mark_as_in_progress(self, request, pk=None):
         order = self.get_object()
         try:
-            order.mark_as_in_progress(request.user)
+            if not order.mark_as_in_progress(request.user):
+                return transition_conflict(order)
             return Response({'status': 'Order in progress'})
         except ValidationError as e:
-            return Response({'error': str(e)}, status=400)
+            return Response({'error': e.messages[0]}, status=400)
 
     @action(detail=True, methods=['post'])
     def mark_as_ready(self, request, pk=None):
         order = self.get_object()
         try:
-            order.mark_as_ready(request.user)
+            if not order.mark_as_ready(request.user):
+                return transition_conflict(order)
             return Response({'status': 'Order ready'})
         except ValidationError as e:
-            return Response({'error': str(e)}, status=400)
+            return Response({'error': e.messages[0]}, status=400)
 
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
         order = self.get_object()
         try:
-            order.cancel_order(request.user)
+            if not order.cancel_order(request.user):
+                return transition_conflict(order)
             return Response({'status': 'Order cancelled'})
         except ValidationError as e:
-            return Response({'error': str(e)}, status=400)
+            return Response({'error': e.messages[0]}, status=400)
   
+async def kitchen_stream(request):
+    """Server-Sent Events feed of the kitchen queue, meant to be served over ASGI.
+
+    Sends a ``snapshot`` of the pending and in-progress orders, then
+    ``order_created`` / ``order_updated`` events read from the order event
+    log, so changes made by any process reach it. Browsers'
+    EventSource cannot set headers, so the staff token may also be passed
+    as ``?token=``.
+    """
+    token = request.GET.get('token')
+    if token and 'HTTP_AUTHORIZATION' not in request.META:
+        request.META['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except (InvalidToken, JWTAuthenticationFailed):
+        result = None
+    if result is None:
+        return JsonResponse({'detail': 'Authentication required'}, status=401)
+    if result[0].role != User.Role.CHEF:
+        return JsonResponse({'detail': 'Chef access required'}, status=403)
+
+    response = StreamingHttpResponse(kitchen_event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 #waiter views or actions      
-class WaiterOrderViewSet(viewsets.ModelViewSet):
+class WaiterOrderViewSet(OrderEventFeedMixin, BatchTransitionMixin, OrderDetailsMixin, viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [IsWaiter]
+    batch_statuses = [Order.OrderStatus.SERVED, Order.OrderStatus.CANCELLED]
+
+    @action(detail=False, methods=['get'], url_path='ready-board')
+    def ready_board(self, request):
+        """READY orders grouped by table, the table waiting longest first.
+
+        ``?since=<seq>`` (the ``next`` of the previous answer) returns only
+        the orders that became ready after it; a 410 means the cursor is
+        too old and the board must be fetched whole again.
+        """
+        since = request.query_params.get('since')
+        try:
+            since = int(since) if since else None
+        except ValueError:
+            return Response({'error': 'since must be an event sequence number'}, status=400)
+        # Read before the orders, so nothing that turns ready meanwhile is
+        # skipped; events commit in id order, so none below it can still appear
+        head = OrderEvent.head()
+        orders = Order.objects.filter(status=Order.OrderStatus.READY)
+        if since is not None:
+            if not OrderEvent.continues(since, head):
+                return Response({'error': 'Cursor is too old; reload the board', 'next': head}, status=410)
+            orders = orders.filter(pk__in=OrderEvent.objects.filter(
+                pk__gt=since, status=Order.OrderStatus.READY).values('order_id'))
+
+        tables = {}
+        for order in orders.order_by('ready_time', 'pk').with_details():
+            tables.setdefault(order.table_id, []).append(order)
+        board = [
+            {
+                'table': table_id,
+                'table_number': table_orders[0].table.table_num,
+                'waiting_since': table_orders[0].ready_time,
+                'orders': OrderListSerializer(table_orders, many=True).data,
+            }
+            for table_id, table_orders in tables.items()
+        ]
+        return Response({'tables': board, 'next': head})
 
     @action(detail=True, methods=['post'])
     def mark_as_served(self, request, pk=None):
         order = self.get_object()
         try:
-            order.mark_as_served(request.user)
+            if not order.mark_as_served(request.user):
+                return transition_conflict(order)
             return Response({'status': 'Order served'})
         except ValidationError as e:
-            return Response({'error': str(e)}, status=400)
+            return Response({'error': e.messages[0]}, status=400)
         
 #client wiews or actions
-class ClientCategoryViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Category.objects.all()
-    serializer_class = CategorySerializer
-    authentication_classes = [DeviceJWTAuthentication]
-    permission_classes = [IsTableDevice]
-
-    @action(detail=True, methods=['get'])
-    def dishes(self, request, pk=None):
-        category = self.get_object()
-        serializer = DishSerializer(category.get_available_dishes(), many=True)
-        return Response(serializer.data)
-
-class ClientDishViewSet(viewsets.ReadOnlyModelViewSet):
-    serializer_class = DishSerializer
-    authentication_classes = [DeviceJWTAuthentication]
-    permission_classes = [IsTableDevice]
-
-    def get_queryset(self):
-        queryset = Dish.objects.filter(is_available=True)
-        
-        categories = self.request.query_params.get('categories')
-
-        if categories:
-            category_list = categories.split(',')  
-            queryset = queryset.filter(categories__name__in=category_list)
-
-        min_price = self.request.query_params.get('min_price', None)
-        max_price = self.request.query_params.get('max_price', None)
-        if min_price and max_price:
-            queryset = queryset.filter(price__gte=min_price, price__lte=max_price)
-        elif min_price:
-            queryset = queryset.filter(price__gte=min_price)
-        elif max_price:
-            queryset = queryset.filter(price__lte=max_price)
-
-        return queryset
-
-    @action(detail=False, methods=['get'])
-    def search(self, request):
-        q = request.query_params.get('q')
-        if not q:
-            return Response({"error": "Query param 'q' is required"}, status=400)
-        dishes = Dish.objects.filter(name__icontains=q, is_available=True)
-        return Response(DishSerializer(dishes, many=True).data)
-
-class ClientOrderView(generics.CreateAPIView, generics.ListAPIView):
+class ClientOrderView(OrderDetailsMixin, generics.CreateAPIView, generics.ListAPIView):
     serializer_class = OrderSerializer
     authentication_classes = [DeviceJWTAuthentication]
     permission_classes = [IsTableDevice] 
@@ -136,7 +316,7 @@ class ClientOrderView(generics.CreateAPIView, generics.ListAPIView):
     def get_queryset(self):
         table = getattr(self.request, "table", None)
         if table:
-            return Order.objects.filter(table=table).exclude(status=Order.OrderStatus.SERVED)
+            return open_orders_of(table)
         return Order.objects.none()  
 
     def create(self, request, *args, **kwargs):
@@ -152,21 +332,10 @@ class ClientOrderView(generics.CreateAPIView, generics.ListAPIView):
         if not items_data:
             return Response({"error": "Order must contain items"}, status=400)
 
-        with transaction.atomic():
-            order = Order.objects.create(table=table, status=Order.OrderStatus.PENDING)
-
-            for item in items_data:
-                dish_id = item.get('dish')
-                quantity = item.get('quantity', 1)
-
-                try:
-                    dish = Dish.objects.get(id=dish_id, is_available=True)
-                    OrderItem.objects.create(order=order, dish=dish, quantity=quantity, price=dish.price)
-                except Dish.DoesNotExist:
-                    order.delete()  
-                    raise ValidationError(f"Dish {dish_id} not available")
-
-            order.update_total_price()
+        try:
+            order = Order.place(table, items_data)
+        except ValidationError as e:
+            return Response({'error': e.messages[0]}, status=400)
 
         return Response({
             "message": "created",
@@ -176,6 +345,223 @@ class ClientOrderView(generics.CreateAPIView, generics.ListAPIView):
         }, status=201)
         
 
+def open_orders_of(table):
+    """A tablet's order list: everything not served yet"""
+    return Order.objects.filter(table=table).exclude(status=Order.OrderStatus.SERVED).with_details()
+
+
+def visible_orders_of(table):
+    """Orders a tablet may open, until they expire"""
+    return Order.objects.filter(table=table, expired=False).with_details()
+
+
+def device_json(data, status=200):
+    return JsonResponse(data, status=status, safe=False, encoder=JSONEncoder)
+
+
+def device_view(*methods):
+    """Async tablet endpoint taking ``methods`` and called with the request's table.
+
+    Answers like the DRF views with DeviceJWTAuthentication + IsTableDevice
+    did: 403 without a token, 401 for a bad one. DeviceJWTMiddleware has
+    usually resolved the token already, from its cache.
+    """
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return device_json({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+            table = getattr(request, 'table', None)
+            if table is None:
+                token = bearer_token(request)
+                if token is None:
+                    return device_json({'detail': 'Authentication credentials were not provided.'}, status=403)
+                try:
+                    table, payload = await aresolve_device_token(token)
+                except AuthenticationFailed as e:
+                    return device_json({'detail': str(e.detail)}, status=401)
+            if not table.is_active:
+                return device_json({'detail': 'You do not have permission to perform this action.'}, status=403)
+            return await view(request, table, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@device_view('GET')
+async def client_categories(request, table):
+    snapshot = await aget_menu_snapshot()
+    return device_json(with_absolute_images(request, snapshot.categories))
+
+
+@device_view('GET')
+async def client_menu_changes(request, table):
+    """What changed in the menu since ``?since_revision=``, for a tablet to patch its copy.
+
+    Returns the categories and available dishes added or changed after that
+    revision and the ids of the ones removed (a dish that went unavailable
+    counts as removed), with the ``revision`` to send next time. Without
+    ``since_revision``, or when that revision was compacted away, the whole
+    menu is returned with ``full`` set: the tablet replaces its copy. A
+    tablet that is up to date is answered from memory.
+    """
+    try:
+        since = int(request.GET['since_revision']) if request.GET.get('since_revision') else None
+    except ValueError:
+        return device_json({'detail': 'since_revision must be a menu revision'}, status=400)
+    snapshot = await aget_menu_snapshot()
+
+    if since is not None and since >= snapshot.revision:
+        # Up to date, or this process's snapshot is older than the tablet's copy
+        dish_ids, category_ids = set(), set()
+    elif since is not None:
+        changes = await sync_to_async(MenuChange.changed_since)(since, snapshot.revision)
+        if changes is None:
+            since = None
+        else:
+            dish_ids, category_ids = changes
+    if since is None:
+        return device_json({
+            'revision': snapshot.revision,
+            'full': True,
+            'categories': with_absolute_images(request, snapshot.categories),
+            'dishes': with_absolute_images(request, snapshot.get_available_dishes()),
+            'removed': {'categories': [], 'dishes': []},
+        })
+
+    categories, removed_categories = [], []
+    for pk in sorted(category_ids):
+        category = snapshot.get_category(pk)
+        if category:
+            categories.append(category)
+        else:
+            removed_categories.append(pk)
+    dishes, removed_dishes = [], []
+    for pk in sorted(dish_ids):
+        dish = snapshot.dishes_by_id.get(pk)
+        if dish and dish['is_available']:
+            dishes.append(dish)
+        else:
+            removed_dishes.append(pk)
+    return device_json({
+        'revision': max(since, snapshot.revision),
+        'full': False,
+        'categories': with_absolute_images(request, categories),
+        'dishes': with_absolute_images(request, dishes),
+        'removed': {'categories': removed_categories, 'dishes': removed_dishes},
+    })
+
+
+@device_view('GET')
+async def client_category_detail(request, table, pk):
+    category = (await aget_menu_snapshot()).get_category(pk)
+    if category is None:
+        return device_json({'detail': 'No Category matches the given query.'}, status=404)
+    return device_json(with_absolute_images(request, [category])[0])
+
+
+@device_view('GET')
+async def client_category_dishes(request, table, pk):
+    snapshot = await aget_menu_snapshot()
+    if snapshot.get_category(pk) is None:
+        return device_json({'detail': 'Not found.'}, status=404)
+    return device_json(with_absolute_images(request, snapshot.get_available_dishes(category_id=pk)))
+
+
+@device_view('GET')
+async def client_dishes(request, table):
+    categories = request.GET.get('categories')
+    try:
+        min_price = parse_price(request.GET.get('min_price'))
+        max_price = parse_price(request.GET.get('max_price'))
+    except InvalidOperation:
+        return device_json({"error": "min_price and max_price must be numbers"}, status=400)
+
+    dishes = (await aget_menu_snapshot()).get_available_dishes(
+        category_names=set(categories.split(',')) if categories else None,
+        min_price=min_price,
+        max_price=max_price,
+    )
+    return device_json(with_absolute_images(request, dishes))
+
+
+@device_view('GET')
+async def client_dish_detail(request, table, pk):
+    dish = (await aget_menu_snapshot()).dishes_by_id.get(pk)
+    if dish is None or not dish['is_available']:
+        return device_json({'detail': 'No Dish matches the given query.'}, status=404)
+    return device_json(with_absolute_images(request, [dish])[0])
+
+
+@device_view('GET')
+async def client_dish_search(request, table):
+    q = request.GET.get('q')
+    if not q:
+        return device_json({"error": "Query param 'q' is required"}, status=400)
+    snapshot = await aget_menu_snapshot()
+    dishes = [snapshot.dishes_by_id[pk] for pk in await sync_to_async(search_dishes)(q) if pk in snapshot.dishes_by_id]
+    return device_json(with_absolute_images(request, dishes))
+
+
+@device_view('GET')
+async def client_order_list(request, table):
+    paginator = OrderKeysetPagination()
+    try:
+        orders = await paginator.apaginate_queryset(open_orders_of(table), Request(request))
+    except NotFound as e:
+        return device_json({'detail': str(e.detail)}, status=404)
+    return device_json(paginator.get_paginated_response(OrderListSerializer(orders, many=True).data).data)
+
+
+create_client_order = ClientOrderView.as_view()
+
+
+@csrf_exempt
+async def client_orders(request):
+    """GET lists the table's orders natively async; POST places one through ClientOrderView"""
+    if request.method == 'POST':
+        return await sync_to_async(create_client_order)(request)
+    return await client_order_list(request)
+
+
+@device_view('GET')
+async def client_order_status(request, table):
+    """``(id, status)`` of the table's unexpired orders, for polling.
+
+    The ETag is the table's order version, the sequence number of its
+    newest ``OrderEvent``. A poll with a matching ``If-None-Match`` is
+    answered 304 without reading the orders, so it costs one indexed query.
+    That query is deliberate: every worker sees the same head, which an
+    in-process cache of table versions could not guarantee.
+    """
+    version = await sync_to_async(OrderEvent.table_head)(table.pk)
+    etag = f'"{table.pk}-{version}"'
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        orders = [order async for order in Order.objects.filter(table=table, expired=False)
+                  .order_by('-pk').values('id', 'status')]
+        response = device_json({'version': version, 'orders': orders})
+    response['ETag'] = etag
+    return response
+
+
+@device_view('GET')
+async def client_order_events(request, table):
+    """The table's order changes after ``?since=<seq>`` (see ``OrderEvent.feed``)"""
+    payload, status_code = await sync_to_async(order_event_feed)(request.GET.get('since'), table_id=table.pk)
+    return device_json(payload, status=status_code)
+
+
+@device_view('GET')
+async def client_order_detail(request, table, pk):
+    try:
+        order = await visible_orders_of(table).aget(pk=pk)
+    except Order.DoesNotExist:
+        return device_json({'detail': 'No Order matches the given query.'}, status=404)
+    return device_json(OrderSerializer(order).data)
+
+
 class ClientOrderCancelView(APIView):
     authentication_classes = [DeviceJWTAuthentication]
     permission_classes = [IsTableDevice]
@@ -187,8 +573,8 @@ class ClientOrderCancelView(APIView):
             if order.status != Order.OrderStatus.PENDING:
                 return Response({"error": "Only pending orders can be cancelled."}, status=400)
 
-            order.status = Order.OrderStatus.CANCELLED
-            order.save()
+            if not order.cancel_order(request.table):
+                return transition_conflict(order)
             
             return Response({
                 "status": "success",
@@ -200,21 +586,6 @@ class ClientOrderCancelView(APIView):
         except Order.DoesNotExist:
             return Response({"error": "Order not found"}, status=404)
         
-class ClientOrderDetailView(generics.RetrieveAPIView):
-    serializer_class = OrderSerializer
-    authentication_classes = [DeviceJWTAuthentication]
-    permission_classes = [IsTableDevice]
-
-    def get_queryset(self):
-        table = getattr(self.request, "table", None)
-        if table:
-            return Order.objects.filter(
-                table=table,
-                expired=False 
-            )
-        return Order.objects.none()
-    
-    
 class ClientExpireOrdersView(APIView):
     authentication_classes = [DeviceJWTAuthentication]
     permission_classes = [IsTableDevice]
@@ -228,11 +599,7 @@ class ClientExpireOrdersView(APIView):
             )
         
         # Only expire served or cancelled orders
-        expired_count = Order.objects.filter(
-            table=table,
-            expired=False,
-            status__in=[Order.OrderStatus.SERVED, Order.OrderStatus.CANCELLED]
-        ).update(expired=True)
+        expired_count = expire_orders(table.get_completed_orders())
         
         return Response({
             "message": f"Marked {expired_count} orders as expired",
@@ -274,8 +641,6 @@ class LinkDeviceToTableView(APIView):
 
     def post(self, request):
         serializer = TableLinkSerializer(data=request.data)
-        print("Received data:", request.data)
-        serializer = TableLinkSerializer(data=request.data)
         
         if serializer.is_valid():
             table, token = serializer.save()
@@ -288,48 +653,56 @@ class LinkDeviceToTableView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-@api_view(['POST'])
-@permission_classes([AllowAny])
-@authentication_classes([]) 
-def verify_device(request):
-    print("Inside verify_device") 
-    auth_header = request.headers.get('Authorization', '')
-    if not auth_header.startswith('Bearer '):
-        return Response({"error": "Invalid Authorization header"}, status=400)
-    
-    token = auth_header.split(' ')[1]
-    table_num = request.data.get('table_num')
+@csrf_exempt
+async def verify_device(request):
+    if request.method != 'POST':
+        return device_json({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+    token = bearer_token(request)
+    if not token:
+        return device_json({"error": "Invalid Authorization header"}, status=400)
+
+    try:
+        data = json.loads(request.body or b'{}') if request.content_type == 'application/json' else request.POST
+    except ValueError:
+        return device_json({"error": "Invalid JSON body"}, status=400)
+    table_num = data.get('table_num')
     
     if not table_num:
-        return Response({"error": "table_num is required"}, status=400)
+        return device_json({"error": "table_num is required"}, status=400)
 
     try:
         payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=['HS256'])
-        table = Table.objects.get(table_num=table_num)
+        table = await Table.objects.aget(table_num=table_num)
         
         if str(table.device_id) != str(payload.get('device_id')):
-            return Response({
+            return device_json({
                 "status": "invalid",
                 "reason": "Device ID mismatch"
             }, status=403)
             
-        return Response({
+        return device_json({
             "status": "valid",
             "table_num": table.table_num,
             "capacity": table.capacity
         })
         
     except jwt.ExpiredSignatureError:
-        return Response({"status": "invalid", "reason": "Token expired"}, status=401)
+        return device_json({"status": "invalid", "reason": "Token expired"}, status=401)
     except jwt.InvalidTokenError:
-        return Response({"status": "invalid", "reason": "Invalid token"}, status=401)
-    except Table.DoesNotExist:
-        return Response({"status": "invalid", "reason": "Table not found"}, status=404)
+        return device_json({"status": "invalid", "reason": "Invalid token"}, status=401)
+    except (Table.DoesNotExist, ValueError):
+        return device_json({"status": "invalid", "reason": "Table not found"}, status=404)
     
 
     
 #####################
 class AvailableTablesView(generics.ListAPIView):
-    queryset = Table.objects.filter(device_id__isnull=True)
+    queryset = Table.objects.filter(device_id__isnull=True).with_activity()
     serializer_class = TableSerializer
-    permission_classes = [AllowAny]
\ No newline at end of file
+    permission_classes = [AllowAny]
+
+class FloorMapView(generics.ListAPIView):
+    """Every table with its live activity, loaded in one query"""
+    queryset = Table.objects.with_activity().order_by('table_num')
+    serializer_class = TableFloorSerializer
+    permission_classes = [IsFloorStaff]
\ No newline at end of file
@@ -42,6 +42,22 @@ class RoleRequired(BasePermission):
             
         raise PermissionDenied(f'{self.role.capitalize()} access required')
 
+class AnyRoleRequired(BasePermission):
+    """Base permission class for access shared by several roles"""
+    roles = ()
+
+    def has_permission(self, request, view):
+        if not request.user.is_authenticated:
+            raise PermissionDenied('Authentication required')
+
+        if not hasattr(request.user, 'role'):
+            raise PermissionDenied('Invalid user type')
+
+        if request.user.role in self.roles:
+            return True
+
+        raise PermissionDenied(f"{' or '.join(role.capitalize() for role in self.roles)} access required")
+
 class IsAdmin(RoleRequired):
     """Requires admin role"""
     role = User.Role.ADMIN
@@ -54,6 +70,10 @@ class IsWaiter(RoleRequired):
     """Requires waiter role (or admin)"""
     role = User.Role.WAITER
 
+class IsFloorStaff(AnyRoleRequired):
+    """Requires admin or waiter role"""
+    roles = (User.Role.ADMIN, User.Role.WAITER)
+
 class HasKitchenAccess(BasePermission):
     """Requires kitchen access (chef or admin)"""
     